@@ -0,0 +1,177 @@
+"""
+Quantized-center AOI geometry cache.
+
+The map AOI is centered on the mean of the recommended sites, so nearly every
+trip has a slightly different circle and misses a cache keyed on the exact
+polygon. Here the center is snapped to a grid of AOI_GRID_METERS and the
+geometries are fetched once for a superset circle around the snapped center,
+large enough to contain every AOI snapping to it, then clipped to the real
+circle. Superset geometries are kept in a small in-memory LRU and a larger
+on-disk LRU of GeoParquet files shared between processes.
+"""
+import math
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+import geopandas as gpd
+from prettymapp.geo import explode_multigeometries, get_aoi
+from prettymapp.osm import OsmDataError
+from shapely.geometry import Polygon
+
+from config import AOI_GRID_METERS, DATA_DIR
+from geometry_store import get_geometry_store
+from metrics import timed
+from utils import fetch_osm_geometries
+
+CACHE_DIR = DATA_DIR / "aoi_cache"
+DEFAULT_MEMORY_ENTRIES = 16
+DEFAULT_DISK_ENTRIES = 500
+METERS_PER_DEGREE = 111_320
+# Locks serializing the fetches of a cell, shared by the keys hashing to the same stripe
+KEY_LOCK_STRIPES = 64
+
+
+class AoiCache:
+    """
+    Args:
+        fetch: Callable returning the geometries of an AOI polygon
+        grid_meters: Spacing of the grid the AOI centers are snapped to
+        memory_entries: Superset geometries kept in memory
+        disk_entries: Superset geometries kept on disk, 0 to disable the disk tier
+    """
+
+    def __init__(
+        self,
+        fetch,
+        grid_meters: float = AOI_GRID_METERS,
+        cache_dir: Path = CACHE_DIR,
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        disk_entries: int = DEFAULT_DISK_ENTRIES,
+    ):
+        self.fetch = fetch
+        self.grid_meters = grid_meters
+        self.cache_dir = Path(cache_dir)
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+
+    def snap(self, coordinates) -> tuple:
+        """Grid cell (lat index, lon index) of coordinates (lat, lon)."""
+        lat, lon = coordinates
+        lat_step = self.grid_meters / METERS_PER_DEGREE
+        i = round(lat / lat_step)
+        lon_step = self.grid_meters / (METERS_PER_DEGREE * math.cos(math.radians(i * lat_step)))
+        return i, round(lon / lon_step)
+
+    def cell_center(self, cell) -> tuple:
+        lat_step = self.grid_meters / METERS_PER_DEGREE
+        lat = cell[0] * lat_step
+        lon_step = self.grid_meters / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+        return lat, cell[1] * lon_step
+
+    def superset_radius(self, radius: float) -> float:
+        # Covers any center within half a grid cell diagonal, plus slack for the
+        # projection differences between the two circles
+        return radius + self.grid_meters * math.sqrt(2) / 2 + 50
+
+    def geometries(self, aoi: Polygon, coordinates, radius: float) -> gpd.GeoDataFrame:
+        """Geometries within aoi, the circle of radius meters around coordinates (lat, lon)."""
+        cell = self.snap(coordinates)
+        key = f"{cell[0]}_{cell[1]}_{int(radius)}"
+        key_lock = self._key_locks[hash(key) % KEY_LOCK_STRIPES]
+        with timed("aoi.geometries") as fields:
+            # Concurrent sessions for the same cell wait for a single fetch
+            with key_lock:
+                df, fields["cache"] = self._get(key)
+                if df is None:
+                    superset = get_aoi(
+                        coordinates=self.cell_center(cell), radius=self.superset_radius(radius)
+                    )
+                    df = self.fetch(superset)
+                    self._put(key, df)
+            df = gpd.clip(df, aoi)
+            if df.empty:
+                raise OsmDataError("No OSM features found for this area.")
+            df = explode_multigeometries(df)
+            fields["rows"] = len(df)
+        return df
+
+    def _get(self, key: str) -> tuple:
+        """(geometries or None, the tier that served them: memory, disk or miss)."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key], "memory"
+        path = self.cache_dir / f"{key}.parquet"
+        if self.disk_entries and path.exists():
+            try:
+                df = gpd.read_parquet(path)
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another process meanwhile
+                df = None
+            if df is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._put_memory(key, df)
+                return df, "disk"
+        with self._lock:
+            self.misses += 1
+        return None, "miss"
+
+    def _put(self, key: str, df: gpd.GeoDataFrame):
+        self._put_memory(key, df)
+        if not self.disk_entries:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Per process, other processes may write the same cell at the same time
+        tmp_path = self.cache_dir / f"{key}.parquet.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path)
+        tmp_path.replace(self.cache_dir / f"{key}.parquet")
+        # Evict the least recently used files beyond disk_entries
+        entries = []
+        for path in self.cache_dir.glob("*.parquet"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        for _, path in sorted(entries, reverse=True)[self.disk_entries:]:
+            path.unlink(missing_ok=True)
+
+    def _put_memory(self, key: str, df: gpd.GeoDataFrame):
+        with self._lock:
+            self._memory[key] = df
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_aoi_cache() -> AoiCache:
+    """
+    AoiCache shared by every session in the process, fetching from the
+    geometry store or Overpass. Disk entries are kept per geometry store
+    version, so a re-ingest does not serve stale geometries.
+    """
+    geometry_store = get_geometry_store()
+    version = geometry_store.version if geometry_store is not None else "overpass"
+    return AoiCache(fetch_osm_geometries, cache_dir=CACHE_DIR / version)
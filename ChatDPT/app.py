@@ -1,28 +1,30 @@
 import os
-import openai
+import time
 from dataclasses import dataclass
 from typing import Literal
-import pandas as pd
 import streamlit as st
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationChain
-from langchain.globals import set_verbose, get_verbose
-from langchain_community.callbacks.manager import get_openai_callback
-from langchain.chains.conversation.memory import ConversationSummaryMemory
 import streamlit.components.v1 as components
-import re
 
-
-set_verbose(False)
-openai.api_key = st.secrets["openai_api_key"]
-
-from utils import (
-    st_get_osm_geometries,
-    st_plot_all,
-    get_colors_from_style,
-    gdf_to_bytesio_geojson,
+# Only light modules are imported at the top: Streamlit reruns this script on
+# every widget change and the survey page does not need LangChain or the map
+# stack (osmnx, geopandas, matplotlib, folium). Those are imported on the
+# paths that use them, see get_conversation, start_map and the utils module.
+from utils import build_route_map, show_folium_map
+from config import CHAT_MEMORY, MODEL_NAME
+from metrics import format_summary, get_metrics, timed
+from catalog import get_catalog
+from prompts import (
+    CHAT_PROMPT,
+    PROMPT_VERSION,
+    SURVEY_QUESTIONS,
+    build_survey_prompt,
+    count_tokens,
+    strip_site_ids,
 )
-from prettymapp.geo import get_aoi
+from survey_output import complete_recommendation, response_format as survey_response_format
+from rec_cache import get_recommendation_cache
+from itinerary import plan_itinerary, travel_time_matrix
+from streaming import RecommendationStreamParser
 from prettymapp.settings import STYLES
 
 
@@ -87,14 +89,7 @@ st.markdown('<div class="subtitle">Uncover the Enchanting Wonders of Daejeon</di
 st.markdown('<div class="section-title">🌟 Welcome Survey 🌟</div>', unsafe_allow_html=True)
 
 # Survey questions
-questions = [
-    "I prefer travel experiences that incorporate technology and efficiency.",
-    "I enjoy participating in local events and engaging with the community when traveling.",
-    "I am open to trying new and adventurous activities during my trips.",
-    "I prioritize comfort and relaxation over exploring new places.",
-    "I value cultural immersion and learning about local traditions.",
-    "I prefer using public transportation over private transportation when traveling."
-]
+questions = SURVEY_QUESTIONS
 
 # Create sliders for each question
 responses = []
@@ -110,7 +105,6 @@ for i, question in enumerate(questions):
 
 # Initialize prompt
 prompt = ""
-daejeon_sites_csv = pd.read_csv('daejeon_touristic_sites_en.csv')
 
 # Traveler type configuration
 traveler_type_config = {
@@ -119,102 +113,217 @@ traveler_type_config = {
     "Practical Leisure Seeker": {"style": "Peach", "radius": 4000}
 }
 
-# Function to extract traveler type from OpenAI response
-def extract_traveler_type(response):
-    pattern = r"\*\*Traveler Type:\*\* ([\w\s-]+)"
-    match = re.search(pattern, response)
-    if match:
-        return match.group(1).strip()
-    return None
-
-# Function to extract recommended sites from OpenAI response
-def extract_recommended_sites(response):
-    pattern = r"\*\*Recommended Sites:\*\*\n(.*?)(?=\n\n|$)"
-    match = re.search(pattern, response, re.DOTALL)
-    if match:
-        sites_text = match.group(1).strip()
-        sites = [site.strip().lstrip('- ').strip() for site in sites_text.split("\n") if site.strip()]
-        return sites
-    return []
-
 # Function to calculate center coordinates for recommended sites
 def calculate_center_coordinates(sites):
-    latitudes = [float(daejeon_sites_csv[daejeon_sites_csv['Name'] == site]['lat'].values[0]) for site in sites]
-    longitudes = [float(daejeon_sites_csv[daejeon_sites_csv['Name'] == site]['lon'].values[0]) for site in sites]
+    latitudes = [site.lat for site in sites]
+    longitudes = [site.lon for site in sites]
     center_lat = sum(latitudes) / len(latitudes)
     center_lon = sum(longitudes) / len(longitudes)
     return center_lat, center_lon
 
+# Function to describe travel between consecutive sites using the precomputed route matrix
+def format_travel_times(sites):
+    from route_matrix import get_route_matrix
+
+    route_matrix = get_route_matrix()
+    if route_matrix is None:
+        return ""
+    lines = []
+    for origin, destination in zip(sites[:-1], sites[1:]):
+        if not route_matrix.has_route(origin, destination):
+            continue
+        distance_km = route_matrix.cost(origin, destination, metric="length") / 1000
+        line = f"- **{origin} → {destination}:** {distance_km:.1f} km, about {route_matrix.cost(origin, destination) / 60:.0f} min by car"
+        if route_matrix.has_route(origin, destination, mode="walk"):
+            line += f" or {route_matrix.cost(origin, destination, mode='walk') / 60:.0f} min on foot"
+        lines.append(line)
+    return "\n".join(lines)
+
+# Function to order the sites by least travel time for the preferred transportation
+def order_sites(sites):
+    if len(sites) < 2:
+        return sites
+    from route_matrix import get_route_matrix
+
+    transportation_type = "Public Transport" if responses[5] >= 4 else "Car"
+    cost = travel_time_matrix(
+        [site.lat for site in sites],
+        [site.lon for site in sites],
+        transportation_type,
+        names=[site.name for site in sites],
+        route_matrix=get_route_matrix(),
+    )
+    order, _ = plan_itinerary(cost)
+    return [sites[i] for i in order]
+
+# Function to build the prettymapp plot settings for the traveler type
+def map_plot_settings(traveler_type):
+    # Use the fixed coordinates for Daejeon, South Korea
+    from datetime import date
+    today = date.today()
+    address = f"DaeTRIP for Daejeon, South Korea, {today}"
+    style = traveler_type_config.get(traveler_type, {}).get("style", "Citrus")
+    return {
+        "draw_settings": STYLES[style],
+        "name_on": True,
+        "name": address,
+        "font_size": 20,
+        "font_color": "black",
+        "text_x": 0,
+        "text_y": -55,
+        "text_rotation": 0,
+        "shape": "circle",
+        "contour_width": 2,
+        "contour_color": "black",
+        "bg_shape": "rectangle",
+        "bg_buffer": 20,
+        "bg_color": "white"
+    }
+
+# Function to start building the map for the sites in the background
+def start_map(sites, traveler_type):
+    from pipeline import start_map_pipeline
+
+    radius = traveler_type_config.get(traveler_type, {}).get("radius", 4000)
+    recommended_sites_dict = {site.name: {'lat': site.lat, 'lon': site.lon} for site in sites}
+    return start_map_pipeline(
+        calculate_center_coordinates(sites), radius, recommended_sites_dict, map_plot_settings(traveler_type)
+    )
+
+# Function to create the conversation chain on first use
+def get_conversation():
+    if "conversation" not in st.session_state:
+        from langchain.chains import ConversationChain
+        from langchain.globals import set_verbose
+        from langchain.chains.conversation.memory import ConversationSummaryMemory
+
+        from llm_gateway import GatewayChatModel, get_llm_gateway
+        from memory import WindowSummaryMemory
+
+        set_verbose(False)
+        # Sessions share one gateway, which caps the concurrent OpenAI calls
+        # (ChatOpenAI with MODEL_NAME) and coalesces identical ones
+        llm = GatewayChatModel(gateway=get_llm_gateway(st.secrets["openai_api_key"]))
+        if CHAT_MEMORY == "summary":
+            memory = ConversationSummaryMemory(llm=llm)
+        else:
+            memory = WindowSummaryMemory(llm=llm)
+        st.session_state.conversation = ConversationChain(
+            llm=llm,
+            memory=memory,
+        )
+    return st.session_state.conversation
+
 # Submit button
 if st.button("Discover My Perfect Trip"):
-    # Collect the responses and create a prompt        
-    prompt = f"Based on the six responses to the travel preference questions answered on a scale of 1 (strongly disagree) to 5 (strongly agree), please classify my traveler type into one of the following categories: Tech-savvy, Community-focused, or Practical Leisure Seeker. Provide a brief explanation for your classification.\n\nThen, recommend three to four relevant touristic sites or activities specifically in Daejeon, South Korea, by selecting them from the following CSV data:\n\n{daejeon_sites_csv.to_string(index=False)}\n\nEnsure that the recommended sites are exactly matched with the names provided in the CSV data. Do not include any sites that are not present in the CSV.\n\nFinally, present the recommendations as a connected single-day itinerary, including estimated travel times between each location based on the preferred mode of transportation (public or private). Present the information in an organized markdown format with concise details and proper usage of bold fonts for better readability, using the following format:\n\n**Traveler Type:** <traveler_type>\n\n**Explanation:** <explanation>\n\n**Recommended Sites:**\n- <site1>\n- <site2>\n- <site3>\n\n**Itinerary:** <itinerary>\n"
-    
-    for i, (question, response) in enumerate(zip(questions, responses)):
-        prompt += f"{i+1}. {question} (Response: {response})\n"
-
-    # Send the prompt to the OpenAI API using the ConversationChain
-    result = st.session_state.conversation.invoke(prompt)
-    summary = result['response']
+    # Collect the responses and create a compact prompt with the best matching candidate sites
+    catalog = get_catalog()
+    survey_prompt = build_survey_prompt(questions, responses, catalog)
+    prompt = survey_prompt.text
+    map_pipeline = None
+
+    # Identical surveys (temperature 0) reuse the parsed result shared across sessions
+    recommendation_cache = get_recommendation_cache()
+    # The cache key (a hash of the answers, not the answers) is recorded for bench_recommend.py to replay
+    survey_key = recommendation_cache.make_key(responses, PROMPT_VERSION, MODEL_NAME)
+    with timed("llm.survey_cache", survey=survey_key) as fields:
+        cached = recommendation_cache.get(responses, PROMPT_VERSION, MODEL_NAME)
+        fields["cache_hit"] = cached is not None
+    if cached is not None:
+        summary = cached["summary"]
+        traveler_type = cached["traveler_type"]
+        recommended_sites = cached["sites"]
+        sites = order_sites([catalog[site] for site in recommended_sites if site in catalog])
+        if sites:
+            map_pipeline = start_map(sites, traveler_type)
+        get_conversation().memory.save_context({"input": prompt}, {"response": summary})
+        st.write(strip_site_ids(summary))
+    else:
+        # Stream the JSON answer from the OpenAI API and start preparing the map as soon as the
+        # recommended sites are complete, while the itinerary is still being written.
+        # Site IDs, or names with small spelling differences, are mapped back to catalog sites
+        stream_parser = RecommendationStreamParser({sid: site.name for sid, site in survey_prompt.sites.items()})
+        summary_placeholder = st.empty()
+        sites = []
+        from llm_gateway import GatewayBusy
+
+        llm = get_conversation().llm
+        try:
+            with timed("llm.survey", prompt_tokens=survey_prompt.tokens) as fields:
+                stream_start = time.perf_counter()
+                for chunk in llm.stream(prompt, response_format=survey_response_format(survey_prompt)):
+                    stream_parser.feed(chunk.content)
+                    summary_placeholder.markdown(strip_site_ids(stream_parser.markdown))
+                    if map_pipeline is None and stream_parser.sites_complete and stream_parser.traveler_type:
+                        # Time to the recommended sites, when the map starts
+                        fields["sites_seconds"] = time.perf_counter() - stream_start
+                        sites = order_sites(survey_prompt.resolve_sites(stream_parser.sites, catalog))
+                        if sites:
+                            map_pipeline = start_map(sites, stream_parser.traveler_type)
+                fields["completion_tokens"] = count_tokens(stream_parser.text)
+
+                # Validate the answer against the catalog and re-request only its invalid fields
+                recommendation = complete_recommendation(
+                    lambda text, response_format: llm.invoke(text, response_format=response_format).content,
+                    survey_prompt,
+                    catalog,
+                    stream_parser.text,
+                )
+                fields.update(repairs=recommendation.repairs, repair_tokens=recommendation.repair_tokens)
+        except GatewayBusy:
+            # The gateway queue is full, or the call timed out (GatewayTimeout)
+            st.warning("Many travelers are planning their trip right now, please try again in a minute.")
+            st.stop()
+        summary = recommendation.summary
+        summary_placeholder.markdown(strip_site_ids(summary))
+        get_conversation().memory.save_context({"input": prompt}, {"response": summary})
+
+        traveler_type = recommendation.traveler_type
+        recommended_sites = [site.name for site in recommendation.sites]
+        # The map is restarted when the sites or traveler type were repaired after it started
+        if {site.name for site in sites} != set(recommended_sites) or stream_parser.traveler_type != traveler_type:
+            sites = order_sites(recommendation.sites)
+            if map_pipeline is not None:
+                # Stages not started yet are dropped, e.g. the render of the streamed sites
+                map_pipeline.cancel_all()
+            map_pipeline = None
+        if traveler_type and sites and not recommendation.errors:
+            recommendation_cache.put(responses, PROMPT_VERSION, MODEL_NAME, {
+                "traveler_type": traveler_type,
+                "sites": [site.name for site in sites],
+                "summary": summary,
+            })
 
-    # Display the summary
-    st.write(summary)
     prompt = summary
-    
-    # Parse the OpenAI response to extract traveler type and recommended sites
-    traveler_type = extract_traveler_type(summary)
-    recommended_sites = extract_recommended_sites(summary)
-    
-    if traveler_type and recommended_sites:
-        # Retrieve map style, color, and size based on traveler type
-        style = traveler_type_config.get(traveler_type, {}).get("style", "Citrus")
-        radius = traveler_type_config.get(traveler_type, {}).get("radius", 4000)
 
-        # Filter recommended sites based on the daejeon_sites_csv data
-        filtered_sites = [site for site in recommended_sites if site in daejeon_sites_csv['Name'].values]
+    if traveler_type and recommended_sites:
+        filtered_sites = [site.name for site in sites]
+        # Chat turns about "these places" are grounded in the recommended sites
+        st.session_state.recommended_sites = filtered_sites
 
         if filtered_sites:
-            # Calculate center coordinates for filtered recommended sites
-            latitudes = [float(daejeon_sites_csv[daejeon_sites_csv['Name'] == site]['lat'].values[0]) for site in filtered_sites]
-            longitudes = [float(daejeon_sites_csv[daejeon_sites_csv['Name'] == site]['lon'].values[0]) for site in filtered_sites]
-            center_lat = sum(latitudes) / len(latitudes)
-            center_lon = sum(longitudes) / len(longitudes)
-            coordinates = (center_lat, center_lon)
-
-            # Use the fixed coordinates for Daejeon, South Korea
-            from datetime import date
-            today = date.today()
-            address = f"DaeTRIP for Daejeon, South Korea, {today}"
-            rectangular = False
+            travel_times = format_travel_times(filtered_sites)
+            if travel_times:
+                st.write("## Travel Times")
+                st.markdown(travel_times)
 
             result_container = st.empty()
             with st.spinner("Creating map... (may take up to a minute)"):
-                aoi = get_aoi(coordinates=coordinates, radius=radius, rectangular=rectangular)
-                df = st_get_osm_geometries(aoi=aoi)
-                draw_settings = STYLES[style]
-                config = {
-                    "aoi_bounds": aoi.bounds,
-                    "draw_settings": draw_settings,
-                    "name_on": True,
-                    "name": address,
-                    "font_size": 20,
-                    "font_color": "black",
-                    "text_x": 0,
-                    "text_y": -55,
-                    "text_rotation": 0,
-                    "shape": "circle",
-                    "contour_width": 2,
-                    "contour_color": "black",
-                    "bg_shape": "rectangle",
-                    "bg_buffer": 20,
-                    "bg_color": "white"
-                }
+                if map_pipeline is None:
+                    map_pipeline = start_map(sites, traveler_type)
                 st.write("## Your Recommended Sites")
-                recommended_sites_dict = {site: daejeon_sites_csv[daejeon_sites_csv['Name'] == site][['lat', 'lon']].to_dict(orient='records')[0] for site in recommended_sites if site in daejeon_sites_csv['Name'].values}
-                fig = st_plot_all(_df=df, recommended_sites=recommended_sites_dict, **config)
+                st.markdown("\n".join(f"- **{site.name}** ({site.name_kr}) · {site.category}" for site in sites))
+                try:
+                    route_map = map_pipeline.result("route_map")
+                except Exception:
+                    # Routes are optional, show the site markers when routing failed or timed out
+                    recommended_sites_dict = {site.name: {'lat': site.lat, 'lon': site.lon} for site in sites}
+                    route_map = build_route_map(map_pipeline.result("aoi").bounds, recommended_sites_dict, [])
+                show_folium_map(route_map)
+                map_image = map_pipeline.result("image")
                 st.write("---")
                 st.write("## Share your Instagram-Ready Trip Map!")
-                st.pyplot(fig, pad_inches=0, bbox_inches="tight", transparent=True, dpi=300)
+                st.image(map_image, use_column_width=True)
         else:
             st.write(f"{recommended_sites}\nNone of the recommended sites are found in the Daejeon touristic sites data.")
     else:
@@ -255,22 +364,42 @@ def initialize_session_state():
         st.session_state.history = []
     if "token_count" not in st.session_state:
         st.session_state.token_count = 0
-    if "conversation" not in st.session_state:
-        llm = ChatOpenAI(
-            temperature=0,
-            openai_api_key=st.secrets["openai_api_key"],
-            model_name="gpt-4o" #"gpt-3.5-turbo-0125"
-        )
-        st.session_state.conversation = ConversationChain(
-            llm=llm,
-            memory=ConversationSummaryMemory(llm=llm),
-        )
+    if "recommended_sites" not in st.session_state:
+        st.session_state.recommended_sites = []
 
 def on_click_callback():
-    with get_openai_callback() as cb:
+    from langchain_community.callbacks.manager import get_openai_callback
+
+    from llm_gateway import GatewayBusy
+
+    from site_index import format_site_rows, get_site_index, refers_back
+
+    with get_openai_callback() as cb, timed("llm.chat") as fields:
         human_prompt = st.session_state.human_prompt
-        result = st.session_state.conversation.invoke(human_prompt)
-        llm_response = result['response']
+        # Only the catalog rows matching the message are sent, retrieved from a
+        # local index; the memory keeps the message without them
+        with timed("chat.retrieve") as retrieve_fields:
+            sites = [site for site, _ in get_site_index().search(human_prompt)]
+            # Nothing matched, or the message is about earlier places: add the recommended sites
+            if not sites or refers_back(human_prompt):
+                catalog = get_catalog()
+                recommended = [catalog[name] for name in st.session_state.recommended_sites if name in catalog]
+                sites += [site for site in recommended if site not in sites]
+                retrieve_fields["recommended"] = len(recommended)
+            retrieve_fields["rows"] = len(sites)
+        conversation = get_conversation()
+        history = conversation.memory.load_memory_variables({})["history"]
+        chat_prompt = CHAT_PROMPT.format(
+            sites=format_site_rows(sites) or "(none)",
+            history=history,
+            input=human_prompt,
+        )
+        try:
+            llm_response = conversation.llm.invoke(chat_prompt).content
+            conversation.memory.save_context({"input": human_prompt}, {"response": llm_response})
+        except GatewayBusy:
+            llm_response = "Many travelers are asking right now, please send your message again in a minute."
+        fields.update(prompt_tokens=cb.prompt_tokens, completion_tokens=cb.completion_tokens)
         st.session_state.history.append(Message("human", human_prompt))
         st.session_state.history.append(Message("ai", llm_response))
         st.session_state.token_count += cb.total_tokens
@@ -313,10 +442,27 @@ with prompt_placeholder:
         on_click=on_click_callback,
     )
 
+# Background summaries of the chat history are counted separately, see memory.py
+token_usage = f"Used {st.session_state.token_count} tokens"
+if "conversation" in st.session_state:
+    summary_tokens = getattr(st.session_state.conversation.memory, "summary_tokens", 0)
+    if summary_tokens:
+        token_usage += f" and {summary_tokens} tokens for history summaries"
 token_usage_placeholder.caption(f"""
-    Used {st.session_state.token_count} tokens.
+    {token_usage}.
 """)
 
+# Per-stage latency of this server process, see metrics.py
+metrics_summary = get_metrics().summary()
+if metrics_summary:
+    with st.sidebar.expander("Performance"):
+        if "conversation" in st.session_state:
+            from llm_gateway import get_llm_gateway
+
+            gateway_stats = get_llm_gateway(st.secrets["openai_api_key"]).stats()
+            st.caption(" · ".join(f"{name} {value}" for name, value in gateway_stats.items()))
+        st.code(format_summary(metrics_summary), language=None)
+
 components.html("""
 <script>
     const streamlitDoc = window.parent.document;
@@ -0,0 +1,77 @@
+"""
+Benchmark the survey prompt: the legacy prompt embedding the full catalog CSV
+against the compact, pre-filtered prompt from prompts.build_survey_prompt.
+
+    python bench_prompt.py --samples 200
+    python bench_prompt.py --samples 5 --live   # also end-to-end LLM latency, needs OPENAI_API_KEY
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+
+from catalog import get_catalog
+from prompts import SURVEY_QUESTIONS, build_survey_prompt, count_tokens
+
+
+def build_legacy_survey_prompt(questions, responses, catalog) -> str:
+    """The survey prompt as it was before prompts.py, for comparison."""
+    prompt = f"Based on the six responses to the travel preference questions answered on a scale of 1 (strongly disagree) to 5 (strongly agree), please classify my traveler type into one of the following categories: Tech-savvy, Community-focused, or Practical Leisure Seeker. Provide a brief explanation for your classification.\n\nThen, recommend three to four relevant touristic sites or activities specifically in Daejeon, South Korea, by selecting them from the following CSV data:\n\n{catalog.df.to_string(index=False)}\n\nEnsure that the recommended sites are exactly matched with the names provided in the CSV data. Do not include any sites that are not present in the CSV.\n\nFinally, present the recommendations as a connected single-day itinerary, including estimated travel times between each location based on the preferred mode of transportation (public or private). Present the information in an organized markdown format with concise details and proper usage of bold fonts for better readability, using the following format:\n\n**Traveler Type:** <traveler_type>\n\n**Explanation:** <explanation>\n\n**Recommended Sites:**\n- <site1>\n- <site2>\n- <site3>\n\n**Itinerary:** <itinerary>\n"
+    for i, (question, response) in enumerate(zip(questions, responses)):
+        prompt += f"{i+1}. {question} (Response: {response})\n"
+    return prompt
+
+
+def summarize(name: str, values: list, unit: str) -> str:
+    return (
+        f"{name:<28} mean {statistics.mean(values):9.1f} {unit}"
+        f"  p50 {statistics.median(values):9.1f}  max {max(values):9.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--token-budget", type=int, default=None)
+    parser.add_argument("--live", action="store_true", help="call the OpenAI API for latency")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = get_catalog()
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.integers(1, 6, size=(args.samples, len(SURVEY_QUESTIONS))).tolist()
+    budget = {} if args.token_budget is None else {"token_budget": args.token_budget}
+
+    prompts = {"legacy": [], "compact": []}
+    build_ms = {"legacy": [], "compact": []}
+    for responses in vectors:
+        start = time.perf_counter()
+        prompts["legacy"].append(build_legacy_survey_prompt(SURVEY_QUESTIONS, responses, catalog))
+        build_ms["legacy"].append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        prompts["compact"].append(build_survey_prompt(SURVEY_QUESTIONS, responses, catalog, **budget).text)
+        build_ms["compact"].append((time.perf_counter() - start) * 1000)
+
+    print(f"{args.samples} survey vectors")
+    for name in prompts:
+        print(summarize(f"{name} prompt tokens", [count_tokens(p) for p in prompts[name]], "tok"))
+        print(summarize(f"{name} build time", build_ms[name], "ms "))
+
+    if args.live:
+        from langchain_openai import ChatOpenAI
+
+        llm = ChatOpenAI(temperature=0, openai_api_key=os.environ["OPENAI_API_KEY"], model_name=args.model)
+        for name in prompts:
+            latencies = []
+            for prompt in prompts[name]:
+                start = time.perf_counter()
+                llm.invoke(prompt)
+                latencies.append(time.perf_counter() - start)
+            print(summarize(f"{name} end-to-end latency", latencies, "s  "))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Benchmark and evaluate the survey recommendation paths on the same surveys.
+
+- llm: build_survey_prompt, the model's JSON answer (StubLLM with a
+  configurable latency, or the app's OpenAI model), and validating it against
+  the catalog with repairs of the invalid fields (survey_output.py)
+- local: the NumPy recommender of daetrip_v1 (recommender.py), no model call
+
+Surveys are the answers recorded by the app (the cache keys of the
+llm.survey_cache records of the metrics file, hashes of the answers) followed
+by random ones. Per path the report has p50/p99 latency overall and per
+stage, prompt and completion tokens, the share of answers that needed a
+repair or stayed invalid (parse failures) and the share of first-answer sites
+that match a catalog row; then how often both paths agree.
+
+    python bench_recommend.py --synthetic 200 --latency 0.05
+    python bench_recommend.py --synthetic 200 --invalid-rate 0.1   # stub answers with invalid sites
+    python bench_recommend.py --recorded data/metrics.jsonl --synthetic 0 --llm openai
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from catalog import get_catalog
+from config import MODEL_NAME
+from metrics import METRICS_FILE
+from prompts import PROMPT_VERSION, SURVEY_QUESTIONS, build_survey_prompt, count_tokens
+from rec_cache import RecommendationCache
+from survey_output import complete_recommendation, parse_answer, response_format
+
+LOCAL_RECOMMENDER = Path(__file__).resolve().parent.parent / "daetrip_v1" / "recommender.py"
+# Survey answer feeding each question of the daetrip_v1 survey (technology,
+# community, practical, adventure, comfort, culture, splurge); None is neutral
+LOCAL_QUESTIONS = (0, 1, None, 2, 3, 4, None)
+NEUTRAL_ANSWER = 3
+
+
+def load_recorded(path: Path) -> list:
+    """
+    Survey answers of the llm.survey_cache records of a metrics JSONL file.
+    Records hold the recommendation cache key of the answers, which are found
+    by hashing every possible survey the same way.
+    """
+    keys = []
+    if not path.exists():
+        return keys
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("stage") == "llm.survey_cache" and "survey" in record:
+                keys.append(record["survey"])
+    if not keys:
+        return []
+    surveys = {
+        RecommendationCache.make_key(responses, PROMPT_VERSION, MODEL_NAME): list(responses)
+        for responses in itertools.product(range(1, 6), repeat=len(SURVEY_QUESTIONS))
+    }
+    # Keys of another prompt version or model are skipped
+    return [surveys[key] for key in keys if key in surveys]
+
+
+def load_local_recommender(path: Path = LOCAL_RECOMMENDER):
+    """The recommender module of daetrip_v1, which is not a package."""
+    spec = importlib.util.spec_from_file_location("daetrip_v1_recommender", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def local_answers(responses: list) -> list:
+    return [NEUTRAL_ANSWER if i is None else responses[i] for i in LOCAL_QUESTIONS]
+
+
+class PathStats:
+    """Latencies and counters of one recommendation path."""
+
+    def __init__(self):
+        self.seconds = []
+        self.stages = defaultdict(list)
+        self.prompt_tokens = []
+        self.completion_tokens = []
+        self.parse_failures = 0
+        self.repaired = 0
+        self.repair_tokens = 0
+        self.recommended = 0
+        self.matched = 0
+
+    def report(self) -> dict:
+        def ms(values, q):
+            return round(float(np.quantile(values, q)) * 1000, 3)
+
+        report = {
+            "surveys": len(self.seconds),
+            "p50_ms": ms(self.seconds, 0.5),
+            "p99_ms": ms(self.seconds, 0.99),
+            "stages_p50_ms": {stage: ms(values, 0.5) for stage, values in self.stages.items()},
+            "parse_failure_rate": round(self.parse_failures / len(self.seconds), 4),
+            "repair_rate": round(self.repaired / len(self.seconds), 4),
+            "catalog_match_rate": round(self.matched / self.recommended, 4) if self.recommended else None,
+        }
+        if self.prompt_tokens:
+            report["prompt_tokens_mean"] = round(float(np.mean(self.prompt_tokens)), 1)
+            report["completion_tokens_mean"] = round(float(np.mean(self.completion_tokens)), 1)
+            report["repair_tokens"] = self.repair_tokens
+            report["tokens_total"] = int(sum(self.prompt_tokens) + sum(self.completion_tokens) + self.repair_tokens)
+        return report
+
+
+def run_llm(llm, surveys: list, catalog) -> tuple:
+    """(PathStats, results) of the LLM path, results are (traveler type, site names) per survey."""
+    stats = PathStats()
+    results = []
+    for responses in surveys:
+        timings = {}
+        start = time.perf_counter()
+        survey_prompt = build_survey_prompt(SURVEY_QUESTIONS, responses, catalog)
+        timings["prompt"] = time.perf_counter()
+        answer = llm.complete(survey_prompt.text, response_format(survey_prompt))
+        timings["llm"] = time.perf_counter()
+        recommendation = complete_recommendation(llm.complete, survey_prompt, catalog, answer)
+        timings["validate"] = time.perf_counter()
+
+        previous = start
+        for stage, end in timings.items():
+            stats.stages[stage].append(end - previous)
+            previous = end
+        stats.seconds.append(previous - start)
+        stats.prompt_tokens.append(survey_prompt.tokens)
+        stats.completion_tokens.append(count_tokens(answer))
+        stats.parse_failures += bool(recommendation.errors)
+        stats.repaired += bool(recommendation.repairs)
+        stats.repair_tokens += recommendation.repair_tokens
+        first_sites = parse_answer(answer).get("sites")
+        if isinstance(first_sites, list):
+            stats.recommended += len(first_sites)
+            stats.matched += len(survey_prompt.resolve_sites([str(site) for site in first_sites], catalog))
+        results.append((recommendation.traveler_type, [site.name for site in recommendation.sites]))
+    return stats, results
+
+
+def run_local(recommender_module, surveys: list, catalog, within_m: float | None) -> tuple:
+    """(PathStats, results) of the local recommender."""
+    recommender = recommender_module.get_recommender()
+    stats = PathStats()
+    results = []
+    for responses in surveys:
+        start = time.perf_counter()
+        recommendation = recommender.recommend(local_answers(responses), within_m=within_m)
+        stats.seconds.append(time.perf_counter() - start)
+        stats.stages["recommend"].append(stats.seconds[-1])
+        names = [site.name for site in recommendation.sites]
+        stats.recommended += len(names)
+        stats.matched += sum(name in catalog for name in names)
+        results.append((recommendation.traveler_type, names))
+    return stats, results
+
+
+def agreement(results_a: list, results_b: list) -> dict:
+    """Share of surveys with the same traveler type, and mean Jaccard overlap of the sites."""
+    same_type = [a[0] == b[0] for a, b in zip(results_a, results_b)]
+    overlap = [
+        len(set(a[1]) & set(b[1])) / len(set(a[1]) | set(b[1])) if a[1] or b[1] else 1.0
+        for a, b in zip(results_a, results_b)
+    ]
+    return {
+        "traveler_type": round(float(np.mean(same_type)), 4),
+        "site_jaccard": round(float(np.mean(overlap)), 4),
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = []
+    for name, stats in report["paths"].items():
+        lines.append(
+            f"{name:<6} {stats['surveys']:5d} surveys  p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms"
+            f"  parse failures {stats['parse_failure_rate']:.1%}  repairs {stats['repair_rate']:.1%}"
+            f"  catalog matches {stats['catalog_match_rate'] or 0:.1%}"
+        )
+        lines.append("       stages p50 " + "  ".join(f"{s} {v:.3f} ms" for s, v in stats["stages_p50_ms"].items()))
+        if "prompt_tokens_mean" in stats:
+            lines.append(
+                f"       tokens prompt {stats['prompt_tokens_mean']:.0f}  completion"
+                f" {stats['completion_tokens_mean']:.0f}  repairs {stats['repair_tokens']}  total {stats['tokens_total']}"
+            )
+    if "agreement" in report:
+        agree = report["agreement"]
+        lines.append(f"agreement  traveler type {agree['traveler_type']:.1%}  sites (Jaccard) {agree['site_jaccard']:.2f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recorded", type=Path, default=Path(METRICS_FILE) if METRICS_FILE else None,
+                        help="metrics JSONL with the recorded surveys")
+    parser.add_argument("--synthetic", type=int, default=200, help="random surveys added to the recorded ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--paths", nargs="+", choices=("llm", "local"), default=["llm", "local"])
+    parser.add_argument("--llm", choices=("stub", "openai"), default="stub")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per stub LLM call")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="share of stub answers with an invalid site")
+    parser.add_argument("--within", type=float, default=3000, help="site spread of the local recommender in meters, 0 for none")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    surveys = load_recorded(args.recorded) if args.recorded else []
+    recorded = len(surveys)
+    rng = np.random.default_rng(args.seed)
+    surveys += rng.integers(1, 6, size=(args.synthetic, len(SURVEY_QUESTIONS))).tolist()
+    if not surveys:
+        parser.error("no recorded surveys, pass --synthetic")
+
+    catalog = get_catalog()
+    # Load the tokenizer before timing, the first count_tokens call reads its encoding
+    count_tokens(build_survey_prompt(SURVEY_QUESTIONS, surveys[0], catalog).text)
+    report = {"recorded": recorded, "synthetic": args.synthetic, "paths": {}}
+    results = {}
+    if "llm" in args.paths:
+        if args.llm == "stub":
+            from stub_llm import StubLLM
+
+            llm = StubLLM(latency=args.latency, invalid_rate=args.invalid_rate, seed=args.seed)
+        else:
+            from rec_cache import OpenAICompletion
+
+            llm = OpenAICompletion()
+        stats, results["llm"] = run_llm(llm, surveys, catalog)
+        report["paths"]["llm"] = {"model": llm.model_name, **stats.report()}
+    if "local" in args.paths:
+        stats, results["local"] = run_local(load_local_recommender(), surveys, catalog, args.within or None)
+        report["paths"]["local"] = stats.report()
+    if len(results) == 2:
+        report["agreement"] = agreement(results["llm"], results["local"])
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
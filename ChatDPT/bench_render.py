@@ -0,0 +1,120 @@
+"""
+Benchmark map rendering: prettymapp's Plot against the resolution-aware
+FastPlot, rendering a 4 km radius AOI to PNG at 300 dpi as the app does.
+
+Each render runs in a fresh process so peak memory is comparable. The fixture
+AOI is synthetic and deterministic (dense buildings and roads at full vertex
+precision); pass --store to use the local geometry store instead.
+
+    python bench_render.py --repeat 3
+    python bench_render.py --store --lat 36.3504 --lon 127.3845
+"""
+import argparse
+import resource
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import shapely
+from geopandas import GeoDataFrame
+from prettymapp.geo import get_aoi
+from prettymapp.settings import STYLES
+
+DAEJEON_CENTER = (36.3504, 127.3845)
+
+
+def make_fixture(aoi, n_buildings: int = 40_000, n_streets: int = 8_000, seed: int = 0) -> GeoDataFrame:
+    """Synthetic prettymapp geometries within aoi, with OSM-like vertex density."""
+    rng = np.random.default_rng(seed)
+    west, south, east, north = aoi.bounds
+    meter = (north - south) / (2 * 4000)
+
+    def random_points(n):
+        return np.column_stack([rng.uniform(west, east, n), rng.uniform(south, north, n)])
+
+    buildings = shapely.buffer(shapely.points(random_points(n_buildings)), rng.uniform(5, 25, n_buildings) * meter, quad_segs=8)
+    areas = shapely.buffer(shapely.points(random_points(600)), rng.uniform(50, 400, 600) * meter, quad_segs=32)
+    steps = rng.normal(0, 15 * meter, (n_streets, 20, 2)).cumsum(axis=1) + random_points(n_streets)[:, None, :]
+    streets = shapely.linestrings(steps)
+    highway = rng.choice(["residential", "service", "primary", "footway", "tertiary"], n_streets)
+
+    geometry = np.concatenate([buildings, areas, streets])
+    landcover_class = (
+        ["urban"] * n_buildings
+        + rng.choice(["water", "grassland", "woodland", "other"], len(areas)).tolist()
+        + ["streets"] * n_streets
+    )
+    df = GeoDataFrame(
+        {"landcover_class": landcover_class, "highway": [None] * (n_buildings + len(areas)) + highway.tolist()},
+        geometry=geometry,
+        crs=4326,
+    )
+    return df.clip(aoi).explode(index_parts=False).reset_index(drop=True)
+
+
+def render(mode: str, df, aoi_bounds, dpi: int, trace_memory: bool = False) -> dict:
+    """
+    Render in the current process, returns time, peak memory and PNG size.
+    Python heap tracing slows rendering down a lot, so it is a separate run.
+    """
+    from prettymapp.plotting import Plot
+
+    from fast_plot import FastPlot
+
+    plot_class = FastPlot if mode == "fast" else Plot
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    fig = plot_class(df, aoi_bounds=aoi_bounds, draw_settings=STYLES["Citrus"], dpi=dpi, shape="circle", contour_width=2).plot_all()
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", pad_inches=0, bbox_inches="tight", transparent=True, dpi=dpi)
+    seconds = time.perf_counter() - start
+    python_peak = 0
+    if trace_memory:
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "python_peak_mb": python_peak / 1024**2,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "png_mb": len(buffer.getvalue()) / 1024**2,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--radius", type=int, default=4000)
+    parser.add_argument("--lat", type=float, default=DAEJEON_CENTER[0])
+    parser.add_argument("--lon", type=float, default=DAEJEON_CENTER[1])
+    parser.add_argument("--store", action="store_true", help="read the AOI from the geometry store")
+    args = parser.parse_args()
+
+    aoi = get_aoi(coordinates=(args.lat, args.lon), radius=args.radius)
+    if args.store:
+        from geometry_store import GeometryStore
+
+        df = GeometryStore.load().query(aoi)
+    else:
+        df = make_fixture(aoi)
+    print(f"{len(df)} geometries, {shapely.get_num_coordinates(df.geometry.to_numpy()).sum()} vertices")
+
+    for mode in ("plot", "fast"):
+        runs = []
+        for trace_memory in [False] * args.repeat + [True]:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                runs.append(executor.submit(render, mode, df, aoi.bounds, args.dpi, trace_memory).result())
+        print(
+            f"{mode:<5} render p50 {statistics.median(r['seconds'] for r in runs[:-1]):6.2f} s"
+            f"  python peak {runs[-1]['python_peak_mb']:7.1f} MB"
+            f"  max rss {max(r['max_rss_mb'] for r in runs):7.1f} MB"
+            f"  png {runs[0]['png_mb']:5.2f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Process-wide index over the Daejeon tourist site catalog.
+
+The English and Korean CSVs are loaded once and indexed by exact name, by a
+normalized key (``slugify`` without dashes) and by character trigrams, so
+site names emitted by the LLM resolve to catalog rows even when they differ
+slightly from the CSV spelling.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
+
+from utils import slugify
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+CATALOG_DIR = Path(__file__).resolve().parent
+CATALOG_CSV = CATALOG_DIR / "daejeon_touristic_sites_en.csv"
+CATALOG_CSV_KR = CATALOG_DIR / "daejeon_touristic_sites_kr.csv"
+
+
+@dataclass(frozen=True)
+class Site:
+    """One row of the tourist site catalog."""
+    index: int
+    name: str
+    name_kr: str
+    category: str
+    type: str
+    address: str
+    lat: float
+    lon: float
+
+
+def normalize_name(name: str) -> str:
+    """Lookup key ignoring case, accents, punctuation and spacing."""
+    return slugify(name, allow_unicode=True).replace("-", "")
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SiteCatalog:
+    def __init__(self, df: pd.DataFrame, df_kr: pd.DataFrame | None = None):
+        self.df = df
+        self.df_kr = df_kr
+        names_kr = df_kr["Name"].tolist() if df_kr is not None else [""] * len(df)
+        self.sites = [
+            Site(
+                index=i,
+                name=row.Name,
+                name_kr=name_kr,
+                category=row.Category,
+                type=row.Type,
+                address=row.Address,
+                lat=float(row.lat),
+                lon=float(row.lon),
+            )
+            for i, (row, name_kr) in enumerate(zip(df.itertuples(index=False), names_kr))
+        ]
+        self._by_name = {site.name: site for site in self.sites}
+        self._by_key = {}
+        self._trigrams = {}
+        for site in self.sites:
+            for name in (site.name, site.name_kr):
+                key = normalize_name(name)
+                if not key:
+                    continue
+                self._by_key.setdefault(key, site)
+                for trigram in trigrams(key):
+                    self._trigrams.setdefault(trigram, set()).add(key)
+
+    @classmethod
+    def from_csv(cls, path: Path = CATALOG_CSV, path_kr: Path | None = CATALOG_CSV_KR):
+        import pandas as pd
+
+        df_kr = pd.read_csv(path_kr) if path_kr is not None else None
+        return cls(pd.read_csv(path), df_kr)
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    def __iter__(self):
+        return iter(self.sites)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __getitem__(self, name: str) -> Site:
+        return self._by_name[name]
+
+    @property
+    def names(self) -> list:
+        return [site.name for site in self.sites]
+
+    def resolve(self, name: str, min_similarity: float = 0.5) -> Site | None:
+        """
+        Resolve an (LLM-emitted) site name in English or Korean to a catalog site.
+        Tries the exact name, then the normalized key, then the most similar key
+        by trigram Jaccard similarity if that is at least min_similarity.
+        """
+        site = self._by_name.get(name)
+        if site is not None:
+            return site
+        key = normalize_name(name)
+        if not key:
+            return None
+        site = self._by_key.get(key)
+        if site is not None:
+            return site
+
+        query = trigrams(key)
+        shared = Counter(
+            candidate for trigram in query for candidate in self._trigrams.get(trigram, ())
+        )
+        best_key, best_similarity = None, 0.0
+        for candidate, count in shared.items():
+            similarity = count / (len(query) + len(trigrams(candidate)) - count)
+            if similarity > best_similarity:
+                best_key, best_similarity = candidate, similarity
+        if best_similarity < min_similarity:
+            return None
+        return self._by_key[best_key]
+
+    def resolve_all(self, names: Iterable[str]) -> list:
+        """Resolve names to catalog sites, dropping unknown names and duplicates."""
+        sites = []
+        for name in names:
+            site = self.resolve(name)
+            if site is not None and site not in sites:
+                sites.append(site)
+        return sites
+
+
+@lru_cache(maxsize=None)
+def get_catalog() -> SiteCatalog:
+    """SiteCatalog shared by every session in the process."""
+    return SiteCatalog.from_csv()
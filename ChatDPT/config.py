@@ -0,0 +1,29 @@
+import os
+from pathlib import Path
+
+# Built artifacts (road graph, route matrix, caches) live under this directory.
+# Override with DAETRIP_DATA_DIR, e.g. to point several containers at one volume.
+DATA_DIR = Path(
+    os.environ.get("DAETRIP_DATA_DIR", Path(__file__).resolve().parent / "data")
+)
+
+# Place name used when a data store has to be built from a fresh OSM download.
+DAEJEON_PLACE = "Daejeon, South Korea"
+
+# Chat model used for the survey and the chat, part of the recommendation cache key.
+MODEL_NAME = "gpt-4o"
+
+# Spacing in meters of the grid map AOI centers are snapped to, see aoi_cache.py.
+AOI_GRID_METERS = float(os.environ.get("DAETRIP_AOI_GRID_METERS", 500))
+
+# Chat memory: "window" keeps recent messages verbatim and summarizes older ones
+# in the background (memory.py), "summary" summarizes every turn before answering.
+CHAT_MEMORY = os.environ.get("DAETRIP_CHAT_MEMORY", "window")
+
+# Process-wide LLM gateway (llm_gateway.py): upstream calls at the same time, calls
+# allowed to wait for a slot, the seconds a call may wait before failing, and the
+# seconds callers wait for its answer (or each further chunk) after that.
+LLM_MAX_CONCURRENCY = int(os.environ.get("DAETRIP_LLM_MAX_CONCURRENCY", 4))
+LLM_MAX_QUEUE = int(os.environ.get("DAETRIP_LLM_MAX_QUEUE", 32))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("DAETRIP_LLM_QUEUE_TIMEOUT", 60))
+LLM_REQUEST_TIMEOUT = float(os.environ.get("DAETRIP_LLM_REQUEST_TIMEOUT", 120))
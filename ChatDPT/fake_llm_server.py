@@ -0,0 +1,146 @@
+"""
+Local fake of the OpenAI chat completions API, for load tests of the LLM
+gateway without network access or API costs.
+
+Answers come from StubLLM (survey prompts get a well-formed recommendation, as
+JSON when a response_format is requested), after a configurable latency,
+streamed in chunks when requested. Like the real API under load, requests
+beyond max_concurrency at the same time are answered with 429. GET /stats
+returns the request counters.
+
+    python fake_llm_server.py --port 8765 --latency 2 --max-concurrency 4
+    # then point the app or the gateway at it, e.g. OPENAI_API_BASE=http://127.0.0.1:8765/v1
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stub_llm import StubLLM
+
+CHUNK_CHARS = 40
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 1.0, max_concurrency: int = 4):
+        super().__init__(address, FakeLLMHandler)
+        self.llm = StubLLM()
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "active": self.active,
+                "max_active": self.max_active,
+            }
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    server: FakeLLMServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            if server.active >= server.max_concurrency:
+                server.rate_limited += 1
+                limited = True
+            else:
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+                limited = False
+        if limited:
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+            return
+        try:
+            self.answer(request)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def answer(self, request: dict):
+        prompt = request["messages"][-1]["content"]
+        content = self.server.llm.complete(prompt, request.get("response_format"))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        base = {"id": completion_id, "created": int(time.time()), "model": request.get("model", "fake")}
+        usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4,
+        }
+        if not request.get("stream"):
+            time.sleep(self.server.latency)
+            self.send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunks = [content[i:i + CHUNK_CHARS] for i in range(0, len(content), CHUNK_CHARS)]
+        for i, text in enumerate(chunks):
+            time.sleep(self.server.latency / len(chunks))
+            delta = {"role": "assistant", "content": text} if i == 0 else {"content": text}
+            self.send_event({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self.send_event({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def send_event(self, data: dict):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_fake_server(port: int = 0, latency: float = 1.0, max_concurrency: int = 4) -> FakeLLMServer:
+    """Start the fake server on a background thread, port 0 picks a free port."""
+    server = FakeLLMServer(("127.0.0.1", port), latency=latency, max_concurrency=max_concurrency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per answer")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="concurrent requests before answering 429")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(("127.0.0.1", args.port), latency=args.latency, max_concurrency=args.max_concurrency)
+    print(f"Fake OpenAI API on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
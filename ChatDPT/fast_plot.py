@@ -0,0 +1,157 @@
+"""
+Resolution-aware render mode for prettymapp.
+
+FastPlot draws the same map as prettymapp's Plot, but first reduces the
+geometries to what the output raster can show: geometries are clipped to the
+plot extent, simplified with a tolerance of half an output pixel, features
+smaller than a pixel are dropped, and polygon classes sharing a zorder are
+drawn as one PathCollection with per-path colors instead of one PathPatch
+collection per class.
+"""
+from collections import defaultdict
+
+import numpy as np
+import shapely
+from matplotlib.collections import LineCollection, PathCollection
+from matplotlib.colors import to_rgba
+from matplotlib.path import Path as MplPath
+
+from prettymapp.plotting import Plot
+from prettymapp.settings import STREETS_WIDTH
+
+TOLERANCE_PIXELS = 0.5
+MIN_FEATURE_PIXELS = 1.0
+
+
+def polygon_paths(polygons) -> list:
+    """matplotlib Paths (with holes) of an array of shapely Polygons."""
+    if len(polygons) == 0:
+        return []
+    rings_per_polygon = shapely.get_num_interior_rings(polygons) + 1
+    rings = shapely.get_rings(polygons)
+    vertices, ring_index = shapely.get_coordinates(rings, return_index=True)
+    ring_lengths = np.bincount(ring_index, minlength=len(rings))
+    ring_ends = np.cumsum(ring_lengths)
+    codes = np.full(len(vertices), MplPath.LINETO, dtype=MplPath.code_type)
+    codes[ring_ends - ring_lengths] = MplPath.MOVETO
+    codes[ring_ends - 1] = MplPath.CLOSEPOLY
+    polygon_ends = ring_ends[np.cumsum(rings_per_polygon) - 1]
+    return [
+        MplPath(v, c)
+        for v, c in zip(np.split(vertices, polygon_ends[:-1]), np.split(codes, polygon_ends[:-1]))
+    ]
+
+
+def line_segments(lines) -> list:
+    """Vertex arrays of an array of shapely LineStrings, for a LineCollection."""
+    if len(lines) == 0:
+        return []
+    vertices, line_index = shapely.get_coordinates(lines, return_index=True)
+    line_ends = np.cumsum(np.bincount(line_index, minlength=len(lines)))
+    return np.split(vertices, line_ends[:-1])
+
+
+class FastPlot(Plot):
+    """
+    prettymapp Plot with resolution-aware simplification, see module docstring.
+    Takes the same arguments as Plot.
+    """
+
+    @property
+    def pixel_size(self) -> float:
+        """Size of an output pixel in degrees, the smaller of both axes."""
+        width, height = self.fig.get_size_inches() * self.dpi
+        return min(
+            (self.xdif + 2 * self.bg_buffer_x) / width,
+            (self.ydif + 2 * self.bg_buffer_y) / height,
+        )
+
+    def reduce(self, geoms, geom_type: str):
+        """
+        Clip, simplify and drop sub-pixel geometries. Returns the single-part
+        geometries of geom_type and the position of the input geometry each
+        one comes from.
+        """
+        pixel = self.pixel_size
+        geoms = shapely.clip_by_rect(
+            geoms,
+            self.xmin - self.bg_buffer_x,
+            self.ymin - self.bg_buffer_y,
+            self.xmax + self.bg_buffer_x,
+            self.ymax + self.bg_buffer_y,
+        )
+        geoms = shapely.simplify(geoms, TOLERANCE_PIXELS * pixel, preserve_topology=False)
+        parts, index = shapely.get_parts(geoms, return_index=True)
+        keep = shapely.get_type_id(parts) == shapely.GeometryType[geom_type.upper()].value
+        bounds = shapely.bounds(parts)
+        extent = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+        keep &= extent >= MIN_FEATURE_PIXELS * pixel
+        return parts[keep], index[keep]
+
+    def set_geometries(self):
+        # Seeded rng drawn in the same order as Plot, so both render the same colors
+        rng = np.random.default_rng(42)
+        batches = defaultdict(lambda: defaultdict(list))
+        for lc_class in self.df["landcover_class"].unique():
+            df_class = self.df[self.df["landcover_class"] == lc_class]
+            try:
+                draw_settings_class = self.draw_settings[lc_class].copy()
+            except KeyError:
+                continue
+
+            if lc_class == "streets":
+                df_class = df_class[df_class.geom_type == "LineString"]
+                lines, index = self.reduce(df_class.geometry.to_numpy(), "LineString")
+                linewidths = df_class["highway"].map(STREETS_WIDTH).fillna(1).to_numpy()[index]
+                draw_settings_class["ec"] = draw_settings_class.pop("fc")
+                collection = LineCollection(line_segments(lines), **draw_settings_class)
+                collection.set_linewidth(linewidths)
+                self.ax.add_collection(collection, autolim=True)
+                continue
+
+            df_class = df_class[df_class.geom_type == "Polygon"]
+            polygons, index = self.reduce(df_class.geometry.to_numpy(), "Polygon")
+            paths = polygon_paths(polygons)
+
+            if "hatch_c" in draw_settings_class:
+                outline = PathCollection(
+                    paths, facecolors="none", edgecolors=draw_settings_class.pop("hatch_c"), linewidths=1, zorder=6
+                )
+                self.ax.add_collection(outline, autolim=True)
+
+            if "cmap" in draw_settings_class:
+                cmap_colors = draw_settings_class.pop("cmap")
+                cmap_values = rng.integers(0, len(cmap_colors), df_class.shape[0])
+                facecolors = np.array([to_rgba(color) for color in cmap_colors])[cmap_values[index]]
+            else:
+                facecolors = np.tile(to_rgba(draw_settings_class.pop("fc")), (len(paths), 1))
+
+            if "hatch" in draw_settings_class:
+                # Hatching is set per collection, hatched classes keep their own
+                collection = PathCollection(
+                    paths,
+                    facecolors=facecolors,
+                    edgecolors=draw_settings_class.get("ec", "none"),
+                    linewidths=draw_settings_class.get("lw", 1),
+                    hatch=draw_settings_class["hatch"],
+                    zorder=draw_settings_class.get("zorder", 1),
+                )
+                self.ax.add_collection(collection, autolim=True)
+                continue
+
+            # Batch the remaining classes into one collection per zorder
+            batch = batches[draw_settings_class.get("zorder", 1)]
+            batch["paths"].extend(paths)
+            batch["facecolors"].append(facecolors)
+            batch["edgecolors"].append(np.tile(to_rgba(draw_settings_class.get("ec", "none")), (len(paths), 1)))
+            batch["linewidths"].append(np.full(len(paths), draw_settings_class.get("lw", 1), dtype=float))
+
+        for zorder, batch in batches.items():
+            collection = PathCollection(
+                batch["paths"],
+                facecolors=np.concatenate(batch["facecolors"]),
+                edgecolors=np.concatenate(batch["edgecolors"]),
+                linewidths=np.concatenate(batch["linewidths"]),
+                zorder=zorder,
+            )
+            self.ax.add_collection(collection, autolim=True)
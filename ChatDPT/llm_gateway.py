@@ -0,0 +1,355 @@
+"""
+Process-wide gateway in front of the chat model.
+
+Every Streamlit session talks to the model through one LLMGateway per
+process, which
+- runs at most max_concurrency calls at a time, on its own worker threads
+- queues further calls, rejecting new ones with GatewayBusy once max_queue
+  calls are waiting (backpressure instead of 429s and retries)
+- coalesces identical in-flight calls, e.g. the same survey submitted by
+  several sessions at once, into one upstream call whose answer (or stream of
+  chunks) every caller receives
+- stops waiting for a call, also for the callers that joined it, after the
+  queue and request timeouts, so a hanging upstream call does not hang them
+- reports queue depth, active calls and queue wait times (stats, and the
+  llm.gateway metric)
+
+GatewayChatModel wraps the gateway as a LangChain chat model, so
+ConversationChain, the chat memory and the survey stream use it unchanged.
+
+Load test against the local fake OpenAI server (fake_llm_server.py):
+
+    python llm_gateway.py load --sessions 40 --distinct 8 --max-concurrency 4
+    python llm_gateway.py load --sessions 40 --distinct 8 --direct   # without the gateway
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT, LLM_REQUEST_TIMEOUT, MODEL_NAME
+from metrics import get_metrics
+
+# Queue wait times kept for the stats percentiles
+WAIT_WINDOW = 1024
+
+
+class GatewayBusy(RuntimeError):
+    """The gateway queue is full, or a call waited longer than the queue timeout."""
+
+
+class GatewayTimeout(GatewayBusy):
+    """A caller got no answer, or no next chunk, within the timeout, e.g. of a hanging call."""
+
+
+class Flight:
+    """
+    One upstream call, shared by every caller of the same messages.
+
+    Args:
+        first_timeout: Seconds a caller waits from the submission for the first item
+        timeout: Seconds a caller waits for each further item
+    """
+
+    def __init__(self, first_timeout: Optional[float] = None, timeout: Optional[float] = None):
+        self.first_timeout = first_timeout
+        self.timeout = timeout
+        self.items = []
+        self.done = False
+        self.error = None
+        self.callers = 1
+        self.submitted = time.perf_counter()
+        self._cond = threading.Condition()
+
+    def push(self, item):
+        with self._cond:
+            self.items.append(item)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def __iter__(self):
+        """
+        The items pushed so far, then the ones still to come; raises the call's
+        error, or GatewayTimeout when the next item takes longer than the timeouts.
+        """
+        i = 0
+        while True:
+            with self._cond:
+                if i == 0 and self.first_timeout is not None:
+                    deadline = self.submitted + self.first_timeout
+                elif self.timeout is not None:
+                    deadline = time.perf_counter() + self.timeout
+                else:
+                    deadline = None
+                while i >= len(self.items) and not self.done:
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        # The upstream call keeps running, this caller stops waiting for it
+                        raise GatewayTimeout(f"No answer from the LLM call within {self.first_timeout if i == 0 else self.timeout:.0f} s")
+                    self._cond.wait(remaining)
+                if i < len(self.items):
+                    item = self.items[i]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            i += 1
+            yield item
+
+
+def call_key(stream: bool, messages: List[BaseMessage], **kwargs) -> str:
+    """Coalescing key of a call: identical messages and call arguments."""
+    payload = json.dumps(
+        {"stream": stream, "messages": [(m.type, m.content) for m in messages], "kwargs": kwargs},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    """
+    Args:
+        llm: Upstream LangChain chat model, e.g. ChatOpenAI
+        max_concurrency: Upstream calls running at the same time
+        max_queue: Calls waiting for a free slot before new calls are rejected
+        queue_timeout: Seconds a call may wait in the queue before it fails with GatewayBusy
+        request_timeout: Seconds a caller, also of a coalesced call, waits for the
+            answer after the queue, and for each further chunk of a stream
+    """
+
+    def __init__(
+        self,
+        llm,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        request_timeout: float = LLM_REQUEST_TIMEOUT,
+    ):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.queued = 0
+        self.active = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._waits = deque(maxlen=WAIT_WINDOW)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-gateway")
+
+    def submit(self, messages: List[BaseMessage], stream: bool = False, **kwargs) -> tuple:
+        """
+        Returns (Flight, coalesced): the upstream call of messages, joined if an
+        identical call is in flight (coalesced True), started otherwise.
+        """
+        key = call_key(stream, messages, **kwargs)
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                flight.callers += 1
+                self.coalesced += 1
+                return flight, True
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                get_metrics().record("llm.gateway", 0.0, error="GatewayBusy", queued=self.queued)
+                raise GatewayBusy(f"{self.queued} LLM calls are already waiting")
+            flight = Flight(self.queue_timeout + self.request_timeout, self.request_timeout)
+            self._in_flight[key] = flight
+            self.queued += 1
+            self.calls += 1
+        self._executor.submit(self._run, key, flight, messages, stream, kwargs)
+        return flight, False
+
+    def _run(self, key: str, flight: Flight, messages, stream: bool, kwargs: dict):
+        wait = time.perf_counter() - flight.submitted
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self._waits.append(wait)
+        error = None
+        try:
+            if wait > self.queue_timeout:
+                raise GatewayBusy(f"LLM call waited {wait:.0f} s in the queue")
+            if stream:
+                for chunk in self.llm.stream(messages, **kwargs):
+                    flight.push(chunk)
+            else:
+                flight.push(self.llm.invoke(messages, **kwargs))
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                self.active -= 1
+                del self._in_flight[key]
+            flight.finish(error)
+            get_metrics().record(
+                "llm.gateway",
+                time.perf_counter() - flight.submitted,
+                wait_seconds=wait,
+                callers=flight.callers,
+                stream=stream,
+                **({"error": type(error).__name__} if error is not None else {}),
+            )
+
+    def invoke(self, messages: List[BaseMessage], **kwargs) -> AIMessage:
+        flight, _ = self.submit(messages, **kwargs)
+        return list(flight)[0]
+
+    def stream(self, messages: List[BaseMessage], **kwargs) -> Iterator:
+        flight, _ = self.submit(messages, stream=True, **kwargs)
+        yield from flight
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = list(self._waits)
+            stats = {
+                "queued": self.queued,
+                "active": self.active,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+        if waits:
+            stats["wait_p50"] = round(statistics.median(waits), 3)
+            stats["wait_p95"] = round(sorted(waits)[min(len(waits) - 1, round(0.95 * (len(waits) - 1)))], 3)
+        return stats
+
+
+class GatewayChatModel(BaseChatModel):
+    """LangChain chat model running its calls through an LLMGateway."""
+
+    gateway: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-gateway"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        flight, coalesced = self.gateway.submit(messages, **({"stop": stop} if stop else {}), **kwargs)
+        message = list(flight)[0]
+        llm_output = {"model_name": message.response_metadata.get("model_name")}
+        if coalesced:
+            # Tokens are only counted once, by the caller that started the upstream call
+            message = message.copy(update={"usage_metadata": None})
+        else:
+            llm_output["token_usage"] = message.response_metadata.get("token_usage", {})
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output=llm_output)
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        flight, _ = self.gateway.submit(messages, stream=True, **({"stop": stop} if stop else {}), **kwargs)
+        for chunk in flight:
+            generation_chunk = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=generation_chunk)
+            yield generation_chunk
+
+
+def make_chat_openai(api_key: str, base_url: Optional[str] = None, model_name: str = MODEL_NAME):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(temperature=0, openai_api_key=api_key, openai_api_base=base_url, model_name=model_name)
+
+
+@lru_cache(maxsize=None)
+def get_llm_gateway(api_key: str, base_url: Optional[str] = None) -> LLMGateway:
+    """LLMGateway in front of the app's ChatOpenAI, shared by every session in the process."""
+    return LLMGateway(make_chat_openai(api_key, base_url))
+
+
+def load_test(llm, sessions: int, distinct: int, stream: bool) -> dict:
+    """Submit the survey prompts of `sessions` sessions at once, `distinct` different ones."""
+    from catalog import get_catalog
+    from prompts import SURVEY_QUESTIONS, build_survey_prompt
+    from langchain_core.messages import HumanMessage
+
+    catalog = get_catalog()
+    combinations = itertools.product(range(1, 6), repeat=len(SURVEY_QUESTIONS))
+    prompts = [
+        build_survey_prompt(SURVEY_QUESTIONS, responses, catalog).text
+        for responses in itertools.islice(combinations, distinct)
+    ]
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def session(i: int):
+        start = time.perf_counter()
+        try:
+            messages = [HumanMessage(content=prompts[i % distinct])]
+            if stream:
+                "".join(chunk.content for chunk in llm.stream(messages))
+            else:
+                llm.invoke(messages)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "ok": len(latencies),
+        "errors": {name: errors.count(name) for name in set(errors)},
+        "latency_p50": round(statistics.median(latencies), 3) if latencies else None,
+        "latency_max": round(max(latencies), 3) if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("load",))
+    parser.add_argument("--base-url", default=None, help="OpenAI compatible API, defaults to a local fake server")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--distinct", type=int, default=8, help="different survey prompts among the sessions")
+    parser.add_argument("--invoke", action="store_true", help="invoke instead of streaming")
+    parser.add_argument("--direct", action="store_true", help="call ChatOpenAI directly, without the gateway")
+    parser.add_argument("--max-concurrency", type=int, default=LLM_MAX_CONCURRENCY)
+    parser.add_argument("--max-queue", type=int, default=LLM_MAX_QUEUE)
+    parser.add_argument("--fake-latency", type=float, default=1.0, help="seconds per answer of the fake server")
+    parser.add_argument("--fake-rate-limit", type=int, default=4, help="concurrent requests before the fake server answers 429")
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url is None:
+        from fake_llm_server import start_fake_server
+
+        server = start_fake_server(latency=args.fake_latency, max_concurrency=args.fake_rate_limit)
+        args.base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    upstream = make_chat_openai("sk-fake", args.base_url)
+    if args.direct:
+        llm = upstream
+    else:
+        gateway = LLMGateway(upstream, max_concurrency=args.max_concurrency, max_queue=args.max_queue)
+        llm = GatewayChatModel(gateway=gateway)
+    report = load_test(llm, args.sessions, args.distinct, stream=not args.invoke)
+    if not args.direct:
+        report["gateway"] = gateway.stats()
+    if server is not None:
+        report["server"] = server.stats()
+        server.shutdown()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,141 @@
+"""
+Chat memory that keeps the summarization call off the critical path.
+
+ConversationSummaryMemory asks the chat model for a new summary after every
+turn, before the answer is returned. WindowSummaryMemory instead keeps the
+recent messages verbatim within a token budget. Only messages that overflow
+the window are summarized, by a background thread, and they stay in the
+history verbatim until their summary is ready. Tokens spent on summaries are
+counted separately from the chat tokens.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from metrics import timed
+from prompts import count_tokens
+
+# Tokens of recent messages kept verbatim, the last exchange is always kept
+WINDOW_TOKENS = 1500
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-memory")
+
+
+def message_usage(message: BaseMessage, prompt: str) -> tuple:
+    """(prompt tokens, completion tokens) of a chat model answer, estimated if not reported."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage["input_tokens"], usage["output_tokens"]
+    usage = message.response_metadata.get("token_usage")
+    if usage:
+        return usage["prompt_tokens"], usage["completion_tokens"]
+    return count_tokens(prompt), count_tokens(message.content)
+
+
+class WindowSummaryMemory(BaseMemory):
+    """
+    Args:
+        llm: Chat model writing the summaries
+        window_tokens: Token budget of the messages kept verbatim
+    """
+
+    llm: BaseLanguageModel
+    window_tokens: int = WINDOW_TOKENS
+    memory_key: str = "history"
+    summary: str = ""
+    messages: List[BaseMessage] = []
+    summary_calls: int = 0
+    summary_prompt_tokens: int = 0
+    summary_completion_tokens: int = 0
+
+    # Messages evicted from the window, waiting to be summarized
+    _pending: List[BaseMessage] = PrivateAttr(default_factory=list)
+    _future: Any = PrivateAttr(default=None)
+    # Incremented by clear, so a summary of cleared messages is dropped
+    _generation: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def summary_tokens(self) -> int:
+        return self.summary_prompt_tokens + self.summary_completion_tokens
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, str]:
+        with self._lock:
+            messages = [SystemMessage(content=self.summary)] if self.summary else []
+            messages += self._pending + self.messages
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        with self._lock:
+            self.messages.extend([HumanMessage(content=input_str), AIMessage(content=output_str)])
+            while len(self.messages) > 2 and sum(count_tokens(m.content) for m in self.messages) > self.window_tokens:
+                self._pending.append(self.messages.pop(0))
+        self._summarize_pending()
+
+    def _get_input_output(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> tuple:
+        prompt_keys = [key for key in inputs if key != self.memory_key]
+        output_key = "response" if "response" in outputs else next(iter(outputs))
+        return inputs[prompt_keys[0]], outputs[output_key]
+
+    def _summarize_pending(self):
+        """Summarize the pending messages in the background, one summary at a time."""
+        with self._lock:
+            if self._future is not None or not self._pending:
+                return
+            batch = list(self._pending)
+            self._future = _executor.submit(self._summarize, batch, self._generation)
+
+    def _summarize(self, batch: List[BaseMessage], generation: int):
+        prompt = SUMMARY_PROMPT.format(summary=self.summary, new_lines=get_buffer_string(batch))
+        try:
+            with timed("memory.summarize", messages=len(batch)) as fields:
+                message = self.llm.invoke(prompt)
+                prompt_tokens, completion_tokens = message_usage(message, prompt)
+                fields.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        except Exception as e:
+            # Counted as a memory.summarize error; the pending messages stay in
+            # the history verbatim and are retried on the next turn
+            logger.warning("Chat summarization failed: %s: %s", type(e).__name__, e)
+            with self._lock:
+                self._future = None
+            return
+        with self._lock:
+            self.summary_calls += 1
+            self.summary_prompt_tokens += prompt_tokens
+            self.summary_completion_tokens += completion_tokens
+            if generation == self._generation:
+                self.summary = message.content
+                del self._pending[:len(batch)]
+            self._future = None
+        # Messages evicted while this summary was written
+        self._summarize_pending()
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until no summary is being written, e.g. before reading summary."""
+        while True:
+            with self._lock:
+                future = self._future
+            if future is None:
+                return
+            future.result(timeout)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self.messages = []
+            self._pending.clear()
+            self._generation += 1
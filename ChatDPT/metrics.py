@@ -0,0 +1,223 @@
+"""
+Per-stage latency and size instrumentation.
+
+Stages of a trip (LLM calls, OSM geometries, routing, rendering, the folium
+payload, exports) are timed with ``timed`` or ``instrument`` and recorded with
+their wall time and numeric fields such as tokens, rows, bytes or cache hits.
+Every record is appended to a JSONL file (``data/metrics.jsonl``, set
+``DAETRIP_METRICS_FILE`` to another path, or to an empty string to only keep
+the in-process summaries). Once the file reaches ``DAETRIP_METRICS_MAX_MB``
+it is rotated to ``metrics.jsonl.1``, replacing the previous one, so the
+records take at most twice that on disk. Recent records are summarized per stage as
+p50/p95/p99 and totals, also in the Prometheus text format.
+
+    python metrics.py summary                  # p50/p95/p99 per stage of the JSONL file
+    python metrics.py prometheus               # the same in Prometheus text format
+    python metrics.py serve --port 9108        # /metrics endpoint for Prometheus
+"""
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+from config import DATA_DIR
+
+METRICS_FILE = os.environ.get("DAETRIP_METRICS_FILE", str(DATA_DIR / "metrics.jsonl"))
+# Latency samples kept per stage for the percentiles
+WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+# Size of the JSONL file before it is rotated
+MAX_BYTES = int(float(os.environ.get("DAETRIP_METRICS_MAX_MB", 64)) * 1024**2)
+
+
+class Metrics:
+    """
+    Args:
+        path: JSONL file the records are appended to, None to not write them
+        window: Number of recent durations per stage the percentiles are computed from
+        max_bytes: Size the file is rotated at, 0 to let it grow
+    """
+
+    def __init__(self, path: Path | None = None, window: int = WINDOW, max_bytes: int = MAX_BYTES):
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self._seconds = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+        self._sums = defaultdict(float)
+        self._errors = defaultdict(int)
+        self._totals = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, **fields):
+        """Record one call of stage; numeric and boolean fields are summed up per stage."""
+        with self._lock:
+            self._add(stage, seconds, fields)
+        if self.path is not None:
+            line = json.dumps(
+                {"ts": round(time.time(), 3), "stage": stage, "seconds": round(seconds, 6), **fields}, default=str
+            )
+            with self._write_lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                    size = f.tell()
+                if self.max_bytes and size >= self.max_bytes:
+                    # Other processes append to the new file from their next record on
+                    os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+
+    def _add(self, stage: str, seconds: float, fields: dict):
+        self._seconds[stage].append(seconds)
+        self._counts[stage] += 1
+        self._sums[stage] += seconds
+        if fields.get("error"):
+            self._errors[stage] += 1
+        for name, value in fields.items():
+            if isinstance(value, (bool, int, float)):
+                self._totals[stage][name] += value
+
+    @contextmanager
+    def timed(self, stage: str, **fields):
+        """
+        Times the block as stage. Yields the fields dict, so the block can add
+        e.g. rows or bytes; an exception is recorded as the error field.
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, **fields)
+
+    def summary(self) -> dict:
+        """stage : count, errors, total, p50/p95/p99 seconds and field totals."""
+        with self._lock:
+            return {
+                stage: {
+                    "count": self._counts[stage],
+                    "errors": self._errors[stage],
+                    "seconds": self._sums[stage],
+                    **{
+                        f"p{round(q * 100)}": float(value)
+                        for q, value in zip(QUANTILES, np.quantile(list(seconds), QUANTILES))
+                    },
+                    "totals": dict(self._totals[stage]),
+                }
+                for stage, seconds in sorted(self._seconds.items())
+            }
+
+    def prometheus(self) -> str:
+        """Summaries in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = ["# TYPE daetrip_stage_seconds summary"]
+        for stage, stats in summary.items():
+            lines += [f'daetrip_stage_seconds{{stage="{stage}",quantile="{q}"}} {stats[f"p{round(q * 100)}"]:.6f}' for q in QUANTILES]
+            lines.append(f'daetrip_stage_seconds_sum{{stage="{stage}"}} {stats["seconds"]:.6f}')
+            lines.append(f'daetrip_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append("# TYPE daetrip_stage_errors_total counter")
+        lines += [f'daetrip_stage_errors_total{{stage="{stage}"}} {stats["errors"]}' for stage, stats in summary.items()]
+        lines.append("# TYPE daetrip_stage_field_total counter")
+        for stage, stats in summary.items():
+            lines += [
+                f'daetrip_stage_field_total{{stage="{stage}",field="{name}"}} {value:g}'
+                for name, value in sorted(stats["totals"].items())
+            ]
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def from_jsonl(cls, path: Path, window: int = WINDOW) -> "Metrics":
+        """Metrics of the records in a JSONL file, e.g. written by another process."""
+        metrics = cls(window=window)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                record.pop("ts", None)
+                metrics._add(record.pop("stage"), record.pop("seconds"), record)
+        return metrics
+
+
+@lru_cache(maxsize=None)
+def get_metrics() -> Metrics:
+    """Metrics shared by every session in the process."""
+    return Metrics(METRICS_FILE or None)
+
+
+def timed(stage: str, **fields):
+    """Metrics.timed of the process-wide metrics."""
+    return get_metrics().timed(stage, **fields)
+
+
+def instrument(stage: str, measure=None):
+    """
+    Decorator timing every call as stage. measure(result, *args, **kwargs),
+    called with the result and arguments of the call, returns extra fields,
+    e.g. lambda df, *args, **kwargs: {"rows": len(df)}.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage) as fields:
+                result = fn(*args, **kwargs)
+                if measure is not None:
+                    fields.update(measure(result, *args, **kwargs))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def format_summary(summary: dict) -> str:
+    lines = [f"{'stage':<24} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  totals"]
+    for stage, stats in summary.items():
+        totals = "  ".join(f"{name} {value:.10g}" for name, value in sorted(stats["totals"].items()))
+        lines.append(
+            f"{stage:<24} {stats['count']:6d} {stats['errors']:6d} {stats['p50'] * 1000:9.1f}"
+            f" {stats['p95'] * 1000:9.1f} {stats['p99'] * 1000:9.1f}  {totals}"
+        )
+    return "\n".join(lines)
+
+
+def serve(path: Path, port: int):
+    """Serve the summaries of the JSONL file on /metrics, re-read on every scrape."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = Metrics.from_jsonl(path).prometheus().encode("utf-8") if path.exists() else b""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    print(f"Serving {path} on http://localhost:{port}/metrics")
+    ThreadingHTTPServer(("", port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("summary", "prometheus", "serve"))
+    parser.add_argument("--file", type=Path, default=Path(METRICS_FILE or DATA_DIR / "metrics.jsonl"))
+    parser.add_argument("--port", type=int, default=9108)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.file, args.port)
+    else:
+        metrics = Metrics.from_jsonl(args.file)
+        print(format_summary(metrics.summary()) if args.command == "summary" else metrics.prometheus().rstrip())
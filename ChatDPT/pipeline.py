@@ -0,0 +1,101 @@
+"""
+Map pipeline: turns recommended sites into the trip map.
+
+The stages run on process-wide thread pools through the stage scheduler, so
+they can start as soon as the recommended sites are known, and the stages that
+only need the AOI run side by side:
+
+    aoi ─┬─ geometries ── image
+         └─ routes ────── route_map
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from prettymapp.geo import get_aoi
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from aoi_cache import get_aoi_cache
+from metrics import instrument
+from scheduler import Stage, StageScheduler
+from utils import build_route_map, get_route_coords, render_map
+
+# Seconds before a stage is abandoned; the route stages are optional for the map
+GEOMETRIES_TIMEOUT = 120
+ROUTES_TIMEOUT = 60
+IMAGE_TIMEOUT = 60
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="map-pipeline")
+# Stages with a timeout (OSM fetch, routing, rendering); an abandoned call keeps
+# its worker until it returns, without holding up the AOI and route map stages
+_timeout_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="map-pipeline-slow")
+# Thread attribute add_script_run_ctx sets, what get_script_run_ctx reads
+SCRIPT_RUN_CTX_ATTR = "streamlit_script_run_ctx"
+
+
+def with_script_run_ctx(fn):
+    """
+    Wrap fn to run attached to the calling session's script context, for
+    st.cache_data. The pooled thread gets its previous context back afterwards.
+    """
+    ctx = get_script_run_ctx()
+
+    def run(**kwargs):
+        thread = threading.current_thread()
+        previous = getattr(thread, SCRIPT_RUN_CTX_ATTR, None)
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(**kwargs)
+        finally:
+            setattr(thread, SCRIPT_RUN_CTX_ATTR, previous)
+
+    return run
+
+
+def start_map_pipeline(
+    coordinates, radius, recommended_sites, plot_settings, executor=_executor, timeout_executor=_timeout_executor
+) -> StageScheduler:
+    """
+    Start building the map of recommended_sites (dict of name : {'lat', 'lon'})
+    around coordinates. plot_settings are the prettymapp Plot arguments apart
+    from aoi_bounds. Pass executor=None to run the stages synchronously;
+    the stages with a timeout run on timeout_executor.
+
+    Returns the started StageScheduler with stages aoi, geometries, routes,
+    image (png bytes) and route_map.
+    """
+    stages = [
+        Stage("aoi", lambda: get_aoi(coordinates=coordinates, radius=radius, rectangular=False)),
+        Stage(
+            "geometries",
+            lambda aoi: get_aoi_cache().geometries(aoi, coordinates, radius),
+            deps=("aoi",),
+            timeout=GEOMETRIES_TIMEOUT,
+        ),
+        Stage(
+            "routes",
+            lambda aoi: get_route_coords(aoi.bounds, recommended_sites),
+            deps=("aoi",),
+            timeout=ROUTES_TIMEOUT,
+        ),
+        Stage(
+            "image",
+            lambda aoi, geometries: render_map(_df=geometries, aoi_bounds=aoi.bounds, **plot_settings),
+            deps=("aoi", "geometries"),
+            timeout=IMAGE_TIMEOUT,
+        ),
+        Stage(
+            "route_map",
+            lambda aoi, routes: build_route_map(aoi.bounds, recommended_sites, routes),
+            deps=("aoi", "routes"),
+        ),
+    ]
+    stages = [
+        Stage(stage.name, instrument(f"pipeline.{stage.name}")(stage.fn), stage.deps, stage.timeout)
+        for stage in stages
+    ]
+    if executor is not None:
+        stages = [
+            Stage(stage.name, with_script_run_ctx(stage.fn), stage.deps, stage.timeout)
+            for stage in stages
+        ]
+    return StageScheduler(stages, executor=executor, timeout_executor=timeout_executor).start()
@@ -0,0 +1,148 @@
+"""
+Profile the startup and rerun cost of a Streamlit app.
+
+The app runs headless with Streamlit's AppTest in a fresh Python process
+started with -X importtime, which reports:
+
+- cold start: process start until the first script run has finished, and the
+  first script run alone (imports included)
+- import time per package (self time summed over its modules) and the slowest
+  modules by cumulative time
+- rerun cost: wall time of each rerun after moving a survey slider, as
+  Streamlit does on every widget interaction
+- which heavy modules the first page load imported (besides those Streamlit
+  and AppTest import themselves)
+
+    python profile_app.py --reruns 20
+    python profile_app.py ../daetrip_v1/app.py --top 15
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+HEAVY_MODULES = ("osmnx", "networkx", "geopandas", "matplotlib", "folium", "pandas", "pyarrow", "langchain", "openai")
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_app(app_path: Path, reruns: int) -> dict:
+    """Runs the app with AppTest in the current process, returns its timings."""
+    from streamlit.testing.v1 import AppTest
+
+    # Run from the app directory as `streamlit run app.py` does, for its
+    # relative paths (static files, CSVs) and flat module imports
+    os.chdir(app_path.parent)
+    sys.path.insert(0, str(app_path.parent))
+
+    app = AppTest.from_file(str(app_path), default_timeout=120)
+    app.secrets["openai_api_key"] = "sk-profile"
+    imported_before = set(sys.modules)
+    start = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - start
+    first_run_finished = time.time()
+    loaded = sorted(name for name in HEAVY_MODULES if name in sys.modules and name not in imported_before)
+
+    rerun_seconds = []
+    for i in range(reruns):
+        if not app.slider:
+            break
+        slider = app.slider[i % len(app.slider)]
+        start = time.perf_counter()
+        slider.set_value(slider.value % 5 + 1).run()
+        rerun_seconds.append(time.perf_counter() - start)
+
+    return {
+        "first_run_seconds": first_run,
+        "first_run_finished": first_run_finished,
+        "rerun_seconds": rerun_seconds,
+        "heavy_modules_loaded": loaded,
+        "exceptions": [exception.message for exception in app.exception],
+    }
+
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self seconds, cumulative seconds) of -X importtime output."""
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, module = match.groups()
+            imports.append((module, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return imports
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def profile(app_path: Path, reruns: int) -> dict:
+    """Profiles app_path in a fresh process, see module docstring."""
+    started = time.time()
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, str(app_path), "--child", "--reruns", str(reruns)],
+        capture_output=True,
+        text=True,
+    )
+    if child.returncode != 0:
+        raise RuntimeError(f"profiling {app_path} failed:\n{child.stderr[-2000:]}")
+    result = json.loads(child.stdout.splitlines()[-1])
+
+    imports = parse_importtime(child.stderr)
+    packages = defaultdict(float)
+    for module, self_seconds, _ in imports:
+        packages[module.split(".")[0]] += self_seconds
+    return {
+        "app": str(app_path),
+        "cold_start_seconds": result.pop("first_run_finished") - started,
+        "import_seconds": sum(self_seconds for _, self_seconds, _ in imports),
+        "packages": dict(sorted(packages.items(), key=lambda item: -item[1])),
+        "modules": sorted(((module, cumulative) for module, _, cumulative in imports), key=lambda item: -item[1]),
+        **result,
+    }
+
+
+def format_profile(report: dict, top: int) -> str:
+    lines = [
+        f"{report['app']}",
+        f"cold start      {report['cold_start_seconds']:6.2f} s (process start to first run finished)",
+        f"first run       {report['first_run_seconds']:6.2f} s",
+        f"imports         {report['import_seconds']:6.2f} s (whole process)",
+    ]
+    if report["rerun_seconds"]:
+        reruns = report["rerun_seconds"]
+        lines.append(
+            f"slider rerun    p50 {statistics.median(reruns) * 1000:6.1f} ms  p95 {percentile(reruns, 0.95) * 1000:6.1f} ms"
+            f"  max {max(reruns) * 1000:6.1f} ms  ({len(reruns)} reruns)"
+        )
+    lines.append(f"heavy modules   {', '.join(report['heavy_modules_loaded']) or 'none'}")
+    if report["exceptions"]:
+        lines.append(f"exceptions      {report['exceptions']}")
+    lines.append(f"\nimport time by package (self), top {top}")
+    lines += [f"  {package:<28} {seconds * 1000:8.1f} ms" for package, seconds in list(report["packages"].items())[:top]]
+    lines.append(f"\nslowest modules (cumulative), top {top}")
+    lines += [f"  {module:<40} {seconds * 1000:8.1f} ms" for module, seconds in report["modules"][:top]]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("app", type=Path, nargs="?", default=Path(__file__).resolve().parent / "app.py")
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_app(args.app.resolve(), args.reruns)))
+    else:
+        report = profile(args.app.resolve(), args.reruns)
+        print(json.dumps(report, indent=2) if args.json else format_profile(report, args.top))
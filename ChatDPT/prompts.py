@@ -0,0 +1,185 @@
+"""
+Prompt builder for the traveler-type survey.
+
+Instead of embedding the full catalog CSV (names, categories, types and street
+addresses of every site), candidate sites are pre-filtered with the slider
+responses and encoded as one short line each (``S12|Expo Science Park|MAJ``),
+trimmed to a token budget. The model answers with the site IDs, which are
+mapped back to catalog rows when parsing.
+"""
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+
+from catalog import Site, SiteCatalog
+
+# Bump when the prompt wording or format changes, cached results depend on it.
+PROMPT_VERSION = "survey-v3"
+DEFAULT_TOKEN_BUDGET = 900
+DEFAULT_MAX_SITES = 30
+CATEGORY_RANK_SHIFT = 10
+
+SURVEY_QUESTIONS = [
+    "I prefer travel experiences that incorporate technology and efficiency.",
+    "I enjoy participating in local events and engaging with the community when traveling.",
+    "I am open to trying new and adventurous activities during my trips.",
+    "I prioritize comfort and relaxation over exploring new places.",
+    "I value cultural immersion and learning about local traditions.",
+    "I prefer using public transportation over private transportation when traveling."
+]
+
+SITE_ID_PATTERN = re.compile(r"\bS\d{2,3}\b\s?")
+
+TRAVELER_TYPES = ("Tech-savvy", "Community-focused", "Practical Leisure Seeker")
+
+CATEGORY_CODES = {
+    "Major Attractions": "MAJ",
+    "Science Attractions": "SCI",
+    "Cultural Attractions": "CUL",
+    "Historical Sites": "HIS",
+    "Ecological Attractions": "ECO",
+    "Others": "OTH",
+}
+
+# Affinity of each category to the six survey questions (technology, community,
+# adventure, comfort, culture, public transport), applied to centered responses.
+CATEGORY_WEIGHTS = {
+    "Major Attractions": [0.05, 0.05, 0.05, 0.10, 0.05, 0.05],
+    "Science Attractions": [0.30, -0.05, 0.10, -0.05, 0.00, 0.05],
+    "Cultural Attractions": [-0.05, 0.15, 0.00, 0.00, 0.25, 0.05],
+    "Historical Sites": [-0.10, 0.05, 0.00, 0.00, 0.30, 0.00],
+    "Ecological Attractions": [-0.10, 0.00, 0.20, 0.15, 0.00, -0.05],
+    "Others": [0.05, 0.20, 0.10, 0.10, -0.05, 0.05],
+}
+
+INSTRUCTIONS = (
+    "Classify my traveler type as one of: {traveler_types}, based on my answers "
+    "below (1 = strongly disagree, 5 = strongly agree), with a brief explanation.\n\n"
+    "Then recommend three to four sites in Daejeon, South Korea, chosen only from "
+    "this list (ID|name|category; {category_legend}):\n{site_lines}\n\n"
+    "Finally, present them as a connected single-day itinerary (travel times are "
+    "added separately) in concise markdown with bold labels.\n\n"
+    "Answer with a JSON object with the fields traveler_type, explanation, sites "
+    "(the IDs of the recommended sites) and itinerary.\n\nMy answers:\n{answers}"
+)
+
+# ConversationChain's default prompt, with the catalog rows retrieved for the
+# message (site_index.py) instead of no site data at all
+CHAT_PROMPT = (
+    "The following is a friendly conversation between a human and an AI travel "
+    "assistant for Daejeon, South Korea. The AI is talkative and provides lots of "
+    "specific details from its context. If the AI does not know the answer to a "
+    "question, it truthfully says it does not know.\n\n"
+    "Catalog sites matching the question (name|Korean name|category|address):\n{sites}\n\n"
+    "Current conversation:\n{history}\nHuman: {input}\nAI:"
+)
+
+
+@dataclass
+class SurveyPrompt:
+    """Prompt text plus the mapping from the short site IDs it uses to sites."""
+    text: str
+    sites: dict = field(default_factory=dict)
+    tokens: int = 0
+
+    def resolve_sites(self, lines: list, catalog: SiteCatalog) -> list:
+        """Map recommended site lines (ID and/or name) back to catalog sites."""
+        sites = []
+        for line in lines:
+            match = SITE_ID_PATTERN.search(line)
+            site = self.sites.get(match.group(0).strip()) if match else None
+            if site is None:
+                site = catalog.resolve(strip_site_ids(line).strip(" -*|"))
+            if site is not None and site not in sites:
+                sites.append(site)
+        return sites
+
+
+def strip_site_ids(text: str) -> str:
+    """Remove the short site IDs from model output before showing it to the user."""
+    return SITE_ID_PATTERN.sub("", text)
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken if available, otherwise a ~4 characters/token estimate."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # tiktoken missing or its encoding file cannot be downloaded
+        return None
+
+
+def site_id(site: Site) -> str:
+    return f"S{site.index:02d}"
+
+
+def rank_sites(catalog: SiteCatalog, responses: list) -> list:
+    """
+    Catalog sites interleaved across categories, with categories that match the
+    survey responses better moved up by CATEGORY_RANK_SHIFT positions per unit
+    of affinity, so the candidate list stays diverse but favors the traveler.
+    """
+    centered = np.asarray(responses, dtype=np.float64) - 3
+    category_scores = {
+        category: float(np.dot(weights, centered))
+        for category, weights in CATEGORY_WEIGHTS.items()
+    }
+    rank_in_category = {}
+    keys = {}
+    for site in catalog.sites:
+        rank = rank_in_category.get(site.category, 0)
+        rank_in_category[site.category] = rank + 1
+        keys[site.index] = rank - CATEGORY_RANK_SHIFT * category_scores.get(site.category, 0.0)
+    return sorted(catalog.sites, key=lambda site: (keys[site.index], site.index))
+
+
+def build_survey_prompt(
+    questions: list,
+    responses: list,
+    catalog: SiteCatalog,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    max_sites: int = DEFAULT_MAX_SITES,
+) -> SurveyPrompt:
+    """
+    Build the survey prompt with the best matching candidate sites that fit
+    into token_budget (at least three sites are always included).
+    """
+    candidates = rank_sites(catalog, responses)[:max_sites]
+    answers = "\n".join(
+        f"{i + 1}. {question} ({response})"
+        for i, (question, response) in enumerate(zip(questions, responses))
+    )
+
+    def render(sites):
+        used_codes = sorted({site.category for site in sites}, key=list(CATEGORY_CODES).index)
+        return INSTRUCTIONS.format(
+            traveler_types=", ".join(TRAVELER_TYPES),
+            category_legend=", ".join(f"{CATEGORY_CODES[c]}={c}" for c in used_codes),
+            site_lines="\n".join(
+                f"{site_id(site)}|{site.name}|{CATEGORY_CODES[site.category]}" for site in sites
+            ),
+            answers=answers,
+        )
+
+    # Drop the lowest ranked sites until the prompt fits the budget
+    n_sites = len(candidates)
+    text = render(candidates)
+    tokens = count_tokens(text)
+    while tokens > token_budget and n_sites > 3:
+        n_sites -= 1
+        text = render(candidates[:n_sites])
+        tokens = count_tokens(text)
+
+    sites = candidates[:n_sites]
+    return SurveyPrompt(text=text, sites={site_id(site): site for site in sites}, tokens=tokens)
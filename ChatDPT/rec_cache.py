@@ -0,0 +1,178 @@
+"""
+Persistent recommendation cache.
+
+The survey has only 5**6 = 15,625 distinct answers and the model runs with
+temperature 0, so the parsed result (traveler type, sites and itinerary text)
+is cached in SQLite, keyed by the response vector, prompt version and model
+name. SQLite in WAL mode makes the cache shareable between sessions and
+processes; it is bounded to max_entries with least-recently-used eviction.
+
+Pre-populate every combination with
+    python rec_cache.py warm --llm stub
+    python rec_cache.py warm --llm openai --limit 500
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from catalog import get_catalog
+from config import DATA_DIR, MODEL_NAME
+from prompts import PROMPT_VERSION, SURVEY_QUESTIONS, build_survey_prompt
+from survey_output import complete_recommendation, response_format
+
+CACHE_PATH = DATA_DIR / "recommendations.sqlite"
+DEFAULT_MAX_ENTRIES = 20_000
+
+
+class RecommendationCache:
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS recommendations "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS recommendations_last_used ON recommendations (last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(responses, prompt_version: str, model_name: str) -> str:
+        payload = json.dumps([[int(r) for r in responses], prompt_version, model_name])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, responses, prompt_version: str, model_name: str) -> dict | None:
+        key = self.make_key(responses, prompt_version, model_name)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM recommendations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE recommendations SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, responses, prompt_version: str, model_name: str, value: dict):
+        key = self.make_key(responses, prompt_version, model_name)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recommendations (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            # Evict the least recently used entries beyond max_entries
+            self._conn.execute(
+                "DELETE FROM recommendations WHERE key IN (SELECT key FROM recommendations "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM recommendations").fetchone()[0]
+
+    def __contains__(self, key: tuple) -> bool:
+        responses, prompt_version, model_name = key
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM recommendations WHERE key = ?",
+                (self.make_key(responses, prompt_version, model_name),),
+            ).fetchone() is not None
+
+
+@lru_cache(maxsize=None)
+def get_recommendation_cache() -> RecommendationCache:
+    """RecommendationCache shared by every session in the process."""
+    return RecommendationCache()
+
+
+def recommend(llm, responses, catalog) -> dict | None:
+    """
+    Run the survey prompt through llm (with a complete(prompt, response_format)
+    method), validate the answer and repair its invalid fields.
+    """
+    survey_prompt = build_survey_prompt(SURVEY_QUESTIONS, responses, catalog)
+    answer = llm.complete(survey_prompt.text, response_format(survey_prompt))
+    recommendation = complete_recommendation(llm.complete, survey_prompt, catalog, answer)
+    if recommendation.errors:
+        return None
+    return {
+        "traveler_type": recommendation.traveler_type,
+        "sites": [site.name for site in recommendation.sites],
+        "summary": recommendation.summary,
+    }
+
+
+class OpenAICompletion:
+    """complete(prompt, response_format) adapter around the same ChatOpenAI configuration as the app."""
+
+    def __init__(self, model_name: str = MODEL_NAME):
+        from langchain_openai import ChatOpenAI
+
+        self.model_name = model_name
+        self.llm = ChatOpenAI(
+            temperature=0, openai_api_key=os.environ["OPENAI_API_KEY"], model_name=model_name
+        )
+
+    def complete(self, prompt: str, response_format: dict | None = None) -> str:
+        if response_format is None:
+            return self.llm.invoke(prompt).content
+        return self.llm.invoke(prompt, response_format=response_format).content
+
+
+def warm(cache: RecommendationCache, llm, model_name: str, limit: int | None = None) -> dict:
+    """Fill the cache for every response combination not cached yet."""
+    catalog = get_catalog()
+    counts = {"cached": 0, "added": 0, "failed": 0}
+    combinations = itertools.product(range(1, 6), repeat=len(SURVEY_QUESTIONS))
+    for responses in itertools.islice(combinations, limit):
+        if (responses, PROMPT_VERSION, model_name) in cache:
+            counts["cached"] += 1
+            continue
+        value = recommend(llm, responses, catalog)
+        if value is None:
+            counts["failed"] += 1
+            continue
+        cache.put(responses, PROMPT_VERSION, model_name, value)
+        counts["added"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the DaeTrip recommendation cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm_parser = subparsers.add_parser("warm")
+    warm_parser.add_argument("--llm", choices=("stub", "openai"), default="stub")
+    warm_parser.add_argument("--model", default=None, help="defaults to 'stub' or the app's model")
+    warm_parser.add_argument("--limit", type=int, default=None)
+    warm_parser.add_argument("--path", type=Path, default=CACHE_PATH)
+    args = parser.parse_args()
+
+    if args.llm == "stub":
+        from stub_llm import StubLLM
+
+        llm = StubLLM(model_name=args.model or "stub")
+    else:
+        llm = OpenAICompletion(args.model or MODEL_NAME)
+    start = time.perf_counter()
+    counts = warm(RecommendationCache(args.path), llm, llm.model_name, args.limit)
+    print(f"{counts} in {time.perf_counter() - start:.1f} s")
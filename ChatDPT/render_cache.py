@@ -0,0 +1,114 @@
+"""
+Content-addressed render cache.
+
+Rendered maps are stored as encoded PNG or SVG bytes, keyed by a hash of the
+plotted geometries and every setting that changes the image (style, draw
+settings, text and shape config, format and dpi). Repeat
+views are served from disk without building or rasterizing a matplotlib
+Figure. The cache is bounded by total size with least-recently-used eviction.
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import shapely
+
+from config import DATA_DIR
+
+CACHE_DIR = DATA_DIR / "renders"
+DEFAULT_MAX_BYTES = 512 * 1024**2
+FORMATS = ("png", "svg")
+
+
+def geometry_digest(df) -> str:
+    """Hash of the geometries and landcover columns of a prettymapp GeoDataFrame."""
+    digest = hashlib.sha256()
+    for wkb in shapely.to_wkb(df.geometry.to_numpy()):
+        digest.update(wkb)
+    for column in ("landcover_class", "highway"):
+        if column in df.columns:
+            digest.update(np.asarray(df[column].astype(str), dtype=str).tobytes())
+    return digest.hexdigest()
+
+
+def render_key(df, format: str = "png", dpi: int = 300, **settings) -> str:
+    payload = json.dumps(
+        {
+            "geometry": geometry_digest(df),
+            "settings": settings,
+            "format": format,
+            "dpi": dpi,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, key: str, format: str) -> Path:
+        return self.cache_dir / f"{key}.{format}"
+
+    def get(self, key: str, format: str = "png") -> bytes | None:
+        path = self.path(key, format)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # Not touch(), which would recreate an empty file evicted meanwhile
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes, format: str = "png"):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_dir / f"{key}.{format}.{os.getpid()}.tmp"
+        tmp_path.write_bytes(data)
+        tmp_path.replace(self.path(key, format))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used renders beyond max_bytes."""
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix[1:] in FORMATS:
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    # Evicted by another process, e.g. a batch_render worker
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def __len__(self) -> int:
+        if not self.cache_dir.exists():
+            return 0
+        return sum(1 for path in self.cache_dir.iterdir() if path.suffix[1:] in FORMATS)
+
+
+@lru_cache(maxsize=None)
+def get_render_cache() -> RenderCache:
+    """RenderCache shared by every session in the process."""
+    return RenderCache()
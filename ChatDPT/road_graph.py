@@ -0,0 +1,252 @@
+"""
+Persistent road graph store.
+
+The Daejeon road network is built once from a local OSM extract and saved as
+flat numpy arrays: nodes sorted by OSM id and edges in CSR order (``indptr`` /
+``targets`` index into the node arrays). The arrays are opened with
+``mmap_mode="r"`` so every session in the process shares the same pages, and
+``RoadGraph.subgraph`` replaces the per-render ``ox.graph_from_bbox`` download.
+
+Build the store with e.g.
+    python road_graph.py build --source daejeon.osm --network-type drive
+"""
+import argparse
+import hashlib
+import json
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from config import DATA_DIR, DAEJEON_PLACE
+
+GRAPH_DIR = DATA_DIR / "road_graph"
+NETWORK_TYPES = ("drive", "walk")
+# Speeds for edges without an osmnx travel_time
+SPEEDS_KPH = {"drive": 30.0, "walk": 4.5}
+# Zero-length ways get this weight so sparse operations don't drop the edge
+MIN_EDGE_WEIGHT = 1e-3
+
+_ARRAYS = ("node_ids", "x", "y", "indptr", "targets", "length", "travel_time")
+
+
+class RoadGraph:
+    """Read-only road graph backed by (memory-mapped) numpy arrays."""
+
+    def __init__(self, arrays: dict, meta: dict):
+        self.node_ids = arrays["node_ids"]
+        self.x = arrays["x"]
+        self.y = arrays["y"]
+        self.indptr = arrays["indptr"]
+        self.targets = arrays["targets"]
+        self.length = arrays["length"]
+        self.travel_time = arrays["travel_time"]
+        self.meta = meta
+        self._sources = None
+
+    @classmethod
+    def load(cls, network_type: str = "drive", graph_dir: Path = GRAPH_DIR):
+        path = Path(graph_dir) / network_type
+        meta = json.loads((path / "meta.json").read_text())
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r") for name in _ARRAYS
+        }
+        return cls(arrays, meta)
+
+    @property
+    def version(self) -> str:
+        return self.meta["version"]
+
+    @property
+    def network_type(self) -> str:
+        return self.meta["network_type"]
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.targets)
+
+    @property
+    def sources(self) -> np.ndarray:
+        """Source node position of every edge (expanded from the CSR indptr)."""
+        if self._sources is None:
+            self._sources = np.repeat(
+                np.arange(self.n_nodes, dtype=np.int32), np.diff(self.indptr)
+            )
+        return self._sources
+
+    def node_position(self, node_id: int) -> int:
+        """Array position of an OSM node id."""
+        pos = int(np.searchsorted(self.node_ids, node_id))
+        if pos == self.n_nodes or self.node_ids[pos] != node_id:
+            raise KeyError(node_id)
+        return pos
+
+    def bbox_mask(self, bbox) -> np.ndarray:
+        """Boolean node mask for bbox given as (west, south, east, north)."""
+        west, south, east, north = bbox
+        return (self.x >= west) & (self.x <= east) & (self.y >= south) & (self.y <= north)
+
+    def edge_weights(self, weight: str = "length") -> np.ndarray:
+        if weight not in ("length", "travel_time"):
+            raise ValueError(f"Unknown edge weight '{weight}'")
+        return getattr(self, weight)
+
+    def to_csgraph(self, weight: str = "length"):
+        """scipy CSR matrix of the full graph, for scipy.sparse.csgraph searches."""
+        from scipy.sparse import csr_matrix
+
+        weights = np.maximum(np.asarray(self.edge_weights(weight)), np.float32(MIN_EDGE_WEIGHT))
+        return csr_matrix(
+            (weights, self.targets, self.indptr),
+            shape=(self.n_nodes, self.n_nodes),
+        )
+
+    def subgraph(self, bbox):
+        """
+        Extract the part of the graph within bbox (west, south, east, north) as
+        an osmnx-compatible networkx MultiDiGraph.
+        """
+        import networkx as nx
+
+        keep = self.bbox_mask(bbox)
+        positions = np.flatnonzero(keep)
+        edges = np.flatnonzero(keep[self.sources] & keep[self.targets])
+
+        G = nx.MultiDiGraph(crs="epsg:4326", network_type=self.network_type)
+        node_ids = self.node_ids[positions].tolist()
+        G.add_nodes_from(
+            (node_id, {"x": x, "y": y})
+            for node_id, x, y in zip(
+                node_ids, self.x[positions].tolist(), self.y[positions].tolist()
+            )
+        )
+        G.add_edges_from(
+            (u, v, {"length": length, "travel_time": travel_time})
+            for u, v, length, travel_time in zip(
+                self.node_ids[self.sources[edges]].tolist(),
+                self.node_ids[self.targets[edges]].tolist(),
+                self.length[edges].tolist(),
+                self.travel_time[edges].tolist(),
+            )
+        )
+        return G
+
+
+@lru_cache(maxsize=None)
+def get_road_graph(network_type: str = "drive"):
+    """Process-wide RoadGraph for network_type, or None if it was not built yet."""
+    try:
+        return RoadGraph.load(network_type)
+    except FileNotFoundError:
+        return None
+
+
+def graph_to_arrays(G, network_type: str) -> dict:
+    """Convert an osmnx MultiDiGraph into the flat arrays of the store."""
+    node_ids = np.array(sorted(G.nodes), dtype=np.int64)
+    x = np.array([G.nodes[n]["x"] for n in node_ids.tolist()], dtype=np.float64)
+    y = np.array([G.nodes[n]["y"] for n in node_ids.tolist()], dtype=np.float64)
+
+    edges = [
+        (u, v, data["length"], data.get("travel_time"))
+        for u, v, data in G.edges(data=True)
+        if u != v
+    ]
+    u = np.searchsorted(node_ids, np.array([e[0] for e in edges], dtype=np.int64))
+    v = np.searchsorted(node_ids, np.array([e[1] for e in edges], dtype=np.int64))
+    length = np.array([e[2] for e in edges], dtype=np.float32)
+    speed = np.float32(SPEEDS_KPH[network_type] / 3.6)
+    if network_type == "walk":
+        travel_time = length / speed
+    else:
+        travel_time = np.array([np.nan if e[3] is None else e[3] for e in edges], dtype=np.float32)
+        missing = np.isnan(travel_time)
+        travel_time[missing] = length[missing] / speed
+
+    # Keep only the shortest of parallel edges, sorted by source for CSR.
+    order = np.lexsort((length, v, u))
+    u, v, length, travel_time = u[order], v[order], length[order], travel_time[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+    u, v, length, travel_time = u[first], v[first], length[first], travel_time[first]
+
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(u, minlength=len(node_ids)), out=indptr[1:])
+    return {
+        "node_ids": node_ids,
+        "x": x,
+        "y": y,
+        "indptr": indptr,
+        "targets": v.astype(np.int32),
+        "length": length,
+        "travel_time": travel_time.astype(np.float32),
+    }
+
+
+def build_road_graph(
+    source: Path | None = None,
+    network_type: str = "drive",
+    graph_dir: Path = GRAPH_DIR,
+) -> RoadGraph:
+    """
+    Build and save the store for network_type.
+
+    source may be an OSM XML extract (already filtered to the network type, e.g.
+    with osmium tags-filter) or a .graphml file. Without a source, the graph of
+    Daejeon is downloaded once via osmnx.
+    """
+    import osmnx as ox
+
+    if network_type not in NETWORK_TYPES:
+        raise ValueError(f"network_type must be one of {NETWORK_TYPES}")
+    if source is None:
+        G = ox.graph_from_place(DAEJEON_PLACE, network_type=network_type)
+    elif Path(source).suffix == ".graphml":
+        G = ox.load_graphml(source)
+    else:
+        G = ox.graph_from_xml(source, bidirectional=network_type == "walk")
+    if network_type == "drive":
+        G = ox.add_edge_speeds(G)
+        G = ox.add_edge_travel_times(G)
+
+    arrays = graph_to_arrays(G, network_type)
+    digest = hashlib.sha1()
+    for name in _ARRAYS:
+        digest.update(arrays[name].tobytes())
+
+    path = Path(graph_dir) / network_type
+    path.mkdir(parents=True, exist_ok=True)
+    for name in _ARRAYS:
+        np.save(path / f"{name}.npy", arrays[name])
+    meta = {
+        "network_type": network_type,
+        "version": digest.hexdigest()[:12],
+        "n_nodes": len(arrays["node_ids"]),
+        "n_edges": len(arrays["targets"]),
+        "source": str(source) if source is not None else DAEJEON_PLACE,
+        "built": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    (path / "meta.json").write_text(json.dumps(meta, indent=2))
+    get_road_graph.cache_clear()
+    return RoadGraph.load(network_type, graph_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the DaeTrip road graph store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--source", type=Path, default=None)
+    build_parser.add_argument(
+        "--network-type", choices=NETWORK_TYPES + ("all",), default="all"
+    )
+    args = parser.parse_args()
+
+    network_types = NETWORK_TYPES if args.network_type == "all" else (args.network_type,)
+    for network_type in network_types:
+        graph = build_road_graph(args.source, network_type)
+        print(f"{network_type}: {graph.n_nodes} nodes, {graph.n_edges} edges, version {graph.version}")
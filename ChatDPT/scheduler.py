@@ -0,0 +1,197 @@
+"""
+Small stage scheduler for the map pipeline.
+
+Stages form a dependency graph; each stage is started on the executor as soon
+as all of its dependencies have finished, so independent stages (e.g. the OSM
+geometry fetch and the road routing, which both only need the AOI) run in
+parallel. A stage receives the results of its dependencies as keyword
+arguments named after them:
+
+    scheduler = StageScheduler([
+        Stage("aoi", lambda: get_aoi(...)),
+        Stage("geometries", lambda aoi: st_get_osm_geometries(aoi=aoi), deps=("aoi",)),
+        Stage("routes", lambda aoi: get_route_coords(aoi.bounds, sites), deps=("aoi",), timeout=60),
+    ], executor=executor).start()
+    df = scheduler.result("geometries")
+
+Failed, timed out or cancelled stages cancel everything that depends on them.
+A timeout only abandons a stage: its result is dropped and its dependents are
+cancelled, but Python threads cannot be interrupted, so the stage keeps its
+thread until the call returns. Stages with a timeout therefore run on
+timeout_executor when one is given, so abandoned calls (e.g. a hanging
+Overpass request) cannot use up the workers of the other stages. Without an
+executor (or once it is shut down) the stages run synchronously in dependency
+order, in which case timeouts are not enforced.
+"""
+import threading
+from concurrent.futures import CancelledError, Executor, Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Callable
+
+
+class StageTimeout(FutureTimeoutError):
+    """Raised for a stage that did not finish within its timeout."""
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Args:
+        name: Unique stage name, also the keyword its result is passed to dependents as
+        fn: Callable taking the results of deps as keyword arguments
+        deps: Names of the stages this stage needs
+        timeout: Seconds the stage may run before it is abandoned (not interrupted)
+    """
+
+    name: str
+    fn: Callable
+    deps: tuple = ()
+    timeout: float | None = None
+
+
+class StageScheduler:
+    """
+    Args:
+        stages: The Stages, in any order
+        executor: Executor the stages run on, None to run them synchronously
+        timeout_executor: Executor of the stages with a timeout, defaults to executor
+    """
+
+    def __init__(self, stages, executor: Executor | None = None, timeout_executor: Executor | None = None):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.executor = executor
+        self.timeout_executor = timeout_executor or executor
+        self.order = self._topological_order()
+        self.dependents = {name: [] for name in self.stages}
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                self.dependents[dep].append(stage.name)
+        self._futures = {name: Future() for name in self.stages}
+        self._started = set()
+        self._lock = threading.Lock()
+
+    def _topological_order(self) -> list:
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle through {name!r}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}")
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def start(self) -> "StageScheduler":
+        """Start every stage without dependencies; the rest follow as their deps finish."""
+        if self.executor is None:
+            for name in self.order:
+                self._run(name)
+            return self
+        for name in self.order:
+            if not self.stages[name].deps:
+                self._submit(name)
+        return self
+
+    def _submit(self, name: str):
+        with self._lock:
+            if name in self._started:
+                return
+            self._started.add(name)
+        future = self._futures[name]
+        if future.done():
+            return
+        executor = self.timeout_executor if self.stages[name].timeout is not None else self.executor
+        try:
+            executor.submit(self._run, name)
+        except RuntimeError:
+            # Executor shut down, fall back to running the stage in this thread
+            self._run(name)
+            return
+        if self.stages[name].timeout is not None:
+            timer = threading.Timer(self.stages[name].timeout, self._expire, args=(name,))
+            timer.daemon = True
+            timer.start()
+            future.add_done_callback(lambda _: timer.cancel())
+
+    def _run(self, name: str):
+        future = self._futures[name]
+        if future.done():
+            return
+        stage = self.stages[name]
+        try:
+            kwargs = {dep: self._futures[dep].result() for dep in stage.deps}
+            result = stage.fn(**kwargs)
+        except CancelledError:
+            self.cancel(name)
+        except BaseException as e:
+            self._settle(name, exception=e)
+        else:
+            self._settle(name, result=result)
+
+    def _settle(self, name: str, result=None, exception: BaseException | None = None):
+        future = self._futures[name]
+        with self._lock:
+            if future.done():
+                # Cancelled or timed out while running, the late outcome is dropped
+                return
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+        self._on_done(name)
+
+    def _expire(self, name: str):
+        self._settle(name, exception=StageTimeout(f"Stage {name!r} timed out"))
+
+    def _on_done(self, name: str):
+        future = self._futures[name]
+        failed = future.cancelled() or future.exception() is not None
+        for dependent in self.dependents[name]:
+            if failed:
+                self.cancel(dependent)
+            elif all(self._futures[dep].done() for dep in self.stages[dependent].deps):
+                if self.executor is not None:
+                    self._submit(dependent)
+
+    def cancel(self, name: str) -> bool:
+        """Cancel a stage and its dependents. A stage already running is abandoned, not interrupted."""
+        future = self._futures[name]
+        with self._lock:
+            cancelled = future.cancel()
+        if cancelled:
+            self._on_done(name)
+        return cancelled
+
+    def cancel_all(self):
+        for name in self.order:
+            self.cancel(name)
+
+    def future(self, name: str) -> Future:
+        return self._futures[name]
+
+    def result(self, name: str, timeout: float | None = None):
+        """Wait for a stage; raises its exception, CancelledError or StageTimeout."""
+        return self._futures[name].result(timeout=timeout)
+
+    def results(self, timeout: float | None = None) -> dict:
+        """Wait for all stages, returns dict of stage name : result for the ones that succeeded."""
+        results = {}
+        for name in self.order:
+            try:
+                results[name] = self.result(name, timeout=timeout)
+            except (CancelledError, Exception):
+                continue
+        return results
@@ -0,0 +1,143 @@
+"""
+Local TF-IDF index over the bilingual site catalog, for chat retrieval.
+
+Each site is indexed by the name, category, type and address columns of both
+the English and the Korean CSV. Terms are lowercased words plus character 2-
+and 3-grams within words, so Korean text (no spaces between particles and
+names, e.g. "유성온천에서") and small spelling differences still match.
+Rows are sublinear TF-IDF weighted and L2 normalized into a dense matrix;
+a query is scored against the columns of its terms only, in well under a
+millisecond for the 81 catalog sites, without any embedding API.
+
+    python site_index.py "hot spring with a foot bath" -k 3
+"""
+import re
+import time
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+from catalog import Site, SiteCatalog, get_catalog
+
+WORD_PATTERN = re.compile(r"\w+")
+NGRAM_SIZES = (2, 3)
+# Names are the strongest signal, their terms count this many times
+NAME_WEIGHT = 2
+DEFAULT_TOP_K = 5
+# Scores below this are unrelated sites sharing a common n-gram
+MIN_SCORE = 0.1
+# Chat filler words, their n-grams would match random sites
+STOP_WORDS = frozenset(
+    "a about among an and any are at be best can could do first for from go how i "
+    "in is it me my near of on or place places recommend should some the there "
+    "these this those to visit want we what when where which with would you".split()
+)
+# Messages about places of earlier turns, e.g. "Among these places, where should I visit first?"
+BACK_REFERENCE = re.compile(
+    r"\b(these|those|the same|there|them|that place|this place|which one)\b|이\s*중|이\s*곳|그\s*곳|거기|여기|추천(해\s*준|한)",
+    re.IGNORECASE,
+)
+
+
+def refers_back(text: str) -> bool:
+    """Whether a chat message points back at places of earlier turns."""
+    return BACK_REFERENCE.search(unicodedata.normalize("NFKC", text)) is not None
+
+
+def terms(text: str) -> list:
+    """Words and in-word character n-grams of text."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    result = []
+    for word in WORD_PATTERN.findall(text):
+        if word in STOP_WORDS:
+            continue
+        result.append(word)
+        padded = f"^{word}$"
+        for n in NGRAM_SIZES:
+            result.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return result
+
+
+def field(value) -> str:
+    """CSV value as text, empty for missing values."""
+    return value if isinstance(value, str) else ""
+
+
+def site_text(site: Site, row_kr=None) -> tuple:
+    """(name text, other fields text) of a site, in English and Korean."""
+    names = f"{site.name} {site.name_kr}"
+    fields = [site.category, field(site.type), site.address]
+    if row_kr is not None:
+        fields += [field(row_kr.Category), field(row_kr.Type), field(row_kr.Address)]
+    return names, " ".join(fields)
+
+
+class SiteIndex:
+    def __init__(self, catalog: SiteCatalog):
+        self.sites = catalog.sites
+        rows_kr = list(catalog.df_kr.itertuples(index=False)) if catalog.df_kr is not None else [None] * len(self.sites)
+        documents = []
+        for site, row_kr in zip(self.sites, rows_kr):
+            names, fields = site_text(site, row_kr)
+            documents.append(terms(names) * NAME_WEIGHT + terms(fields))
+
+        self.vocabulary = {}
+        for document in documents:
+            for term in document:
+                self.vocabulary.setdefault(term, len(self.vocabulary))
+        counts = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for i, document in enumerate(documents):
+            for term in document:
+                counts[i, self.vocabulary[term]] += 1
+
+        document_frequency = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(documents)) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0) * self.idf
+        self.matrix = weights / np.linalg.norm(weights, axis=1, keepdims=True)
+
+    def search(self, query: str, k: int = DEFAULT_TOP_K, min_score: float = MIN_SCORE) -> list:
+        """Up to k (Site, score) pairs most similar to query, best first."""
+        query_counts = {}
+        for term in terms(query):
+            column = self.vocabulary.get(term)
+            if column is not None:
+                query_counts[column] = query_counts.get(column, 0) + 1
+        if not query_counts:
+            return []
+        columns = np.fromiter(query_counts, dtype=np.int64, count=len(query_counts))
+        weights = (1 + np.log(np.fromiter(query_counts.values(), dtype=np.float32))) * self.idf[columns]
+        scores = self.matrix[:, columns] @ (weights / np.linalg.norm(weights))
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.sites[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+def format_site_rows(sites) -> str:
+    """Compact catalog rows of sites for the chat prompt."""
+    return "\n".join(
+        f"{site.name}|{site.name_kr}|{site.category}|{site.address}" for site in sites
+    )
+
+
+@lru_cache(maxsize=None)
+def get_site_index() -> SiteIndex:
+    """SiteIndex shared by every session in the process."""
+    return SiteIndex(get_catalog())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("query")
+    parser.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    args = parser.parse_args()
+
+    index = get_site_index()
+    start = time.perf_counter()
+    results = index.search(args.query, args.k)
+    elapsed = time.perf_counter() - start
+    for site, score in results:
+        print(f"{score:.3f}  {site.name} ({site.name_kr}) · {site.category}")
+    print(f"{len(index.vocabulary)} terms, searched in {elapsed * 1e3:.3f} ms")
@@ -0,0 +1,84 @@
+"""
+Incremental parser for the streamed survey answer.
+
+Chunks of the model's JSON answer (survey_output.py) are fed in as they
+arrive. The traveler type and the site list become available as soon as
+their JSON values are complete, so the map pipeline can start while the model
+is still writing the itinerary; the explanation and itinerary are decoded
+as far as they have arrived, to show the answer as markdown while it streams.
+"""
+import json
+import re
+
+from survey_output import format_recommendation
+
+DECODER = json.JSONDecoder()
+# An escape sequence cut off at the end of the received text
+PARTIAL_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{0,3})?$")
+
+
+def value_start(text: str, key: str, opening: str) -> int:
+    """Index of the value of key starting with opening in partial JSON, -1 if not there yet."""
+    match = re.search(rf'"{key}"\s*:\s*{re.escape(opening)}', text)
+    return match.end() - 1 if match else -1
+
+
+def complete_value(text: str, key: str, opening: str):
+    """The JSON value of key once it is complete, otherwise None."""
+    start = value_start(text, key, opening)
+    if start < 0:
+        return None
+    try:
+        return DECODER.raw_decode(text, start)[0]
+    except json.JSONDecodeError:
+        return None
+
+
+def partial_string(text: str, key: str) -> str | None:
+    """The string value of key as far as it has been received."""
+    value = complete_value(text, key, '"')
+    if value is not None:
+        return value
+    start = value_start(text, key, '"')
+    if start < 0:
+        return None
+    try:
+        return json.loads('"' + PARTIAL_ESCAPE.sub("", text[start + 1:]) + '"')
+    except json.JSONDecodeError:
+        return None
+
+
+class RecommendationStreamParser:
+    """
+    Args:
+        site_names: Site ID : name, to show the recommended sites by name
+    """
+
+    def __init__(self, site_names: dict | None = None):
+        self.site_names = site_names or {}
+        self.text = ""
+        self.traveler_type = None
+        self.sites = None
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        if self.traveler_type is None:
+            self.traveler_type = complete_value(self.text, "traveler_type", '"')
+        if self.sites is None:
+            sites = complete_value(self.text, "sites", "[")
+            if isinstance(sites, list):
+                self.sites = [str(site) for site in sites]
+
+    @property
+    def sites_complete(self) -> bool:
+        return self.sites is not None
+
+    @property
+    def markdown(self) -> str:
+        """The answer received so far, as markdown."""
+        return format_recommendation(
+            self.traveler_type,
+            partial_string(self.text, "explanation"),
+            [self.site_names.get(site, site) for site in self.sites or []],
+            partial_string(self.text, "itinerary"),
+        )
@@ -0,0 +1,77 @@
+"""
+Deterministic local stand-in for the chat model.
+
+Answers survey prompts from prompts.build_survey_prompt without any network
+access, as the JSON object of the requested response_format (survey_output.py)
+or in the markdown format otherwise: the traveler type is scored from the
+answers in the prompt and the first listed candidate sites are recommended.
+Used to warm the recommendation cache and in tests/benchmarks.
+"""
+import json
+import random
+import re
+import time
+
+import numpy as np
+
+from prompts import TRAVELER_TYPES
+
+# Weights of the six survey answers per traveler type
+TRAVELER_TYPE_WEIGHTS = np.array([
+    [0.30, -0.10, 0.10, -0.10, -0.10, 0.10],
+    [-0.10, 0.30, 0.05, -0.05, 0.20, 0.10],
+    [-0.05, -0.05, -0.10, 0.30, 0.05, -0.05],
+])
+
+
+class StubLLM:
+    """
+    Args:
+        latency: Seconds to sleep per call, to simulate model latency
+        n_sites: Number of candidate sites to recommend
+        invalid_rate: Share of complete JSON answers recommending a site that is
+            not in the prompt, to exercise validation and repairs
+    """
+
+    def __init__(self, latency: float = 0.0, n_sites: int = 3, model_name: str = "stub", invalid_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.n_sites = n_sites
+        self.model_name = model_name
+        self.invalid_rate = invalid_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def complete(self, prompt: str, response_format: dict | None = None) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        answers = [int(a) for a in re.findall(r"^\d+\. .*\((\d)\)$", prompt, re.MULTILINE)]
+        if len(answers) == TRAVELER_TYPE_WEIGHTS.shape[1]:
+            traveler_type = TRAVELER_TYPES[int(np.argmax(TRAVELER_TYPE_WEIGHTS @ answers))]
+        else:
+            traveler_type = TRAVELER_TYPES[0]
+        sites = re.findall(r"^(S\d{2,3})\|([^|\n]+)\|", prompt, re.MULTILINE)[: self.n_sites]
+        if not sites:
+            # Repair prompts only list the candidate IDs
+            line = prompt.partition("candidate site IDs: ")[2].partition("\n")[0]
+            sites = [(site_id, site_id) for site_id in re.findall(r"S\d{2,3}", line)][: self.n_sites]
+        site_lines = "\n".join(f"- {site_id} {name}" for site_id, name in sites)
+        itinerary = ", then ".join(name for _, name in sites)
+        if response_format is not None:
+            properties = response_format["json_schema"]["schema"]["properties"]
+            answer = {
+                "traveler_type": traveler_type,
+                "explanation": f"Your answers match a {traveler_type} traveler.",
+                "sites": [site_id for site_id, _ in sites],
+                "itinerary": f"Start at {itinerary}.",
+            }
+            # Only answers with every field get invalid sites, repairs are always valid
+            if len(properties) == len(answer) and self._random.random() < self.invalid_rate:
+                answer["sites"][-1] = "S999"
+            return json.dumps({name: answer[name] for name in properties}, ensure_ascii=False)
+        return (
+            f"**Traveler Type:** {traveler_type}\n\n"
+            f"**Explanation:** Your answers match a {traveler_type} traveler.\n\n"
+            f"**Recommended Sites:**\n{site_lines}\n\n"
+            f"**Itinerary:** Start at {itinerary}.\n"
+        )
@@ -0,0 +1,202 @@
+"""
+Structured survey answer: JSON schema, validation and field-level repair.
+
+The survey call asks for a JSON object constrained by a strict JSON schema
+(OpenAI structured outputs): the traveler type, an explanation, the IDs of
+the recommended sites, limited to the candidates of the prompt, and the
+itinerary. Sites come before the itinerary, so the stream parser
+(streaming.py) has them while the itinerary is still being written.
+
+The complete answer is validated field by field against the catalog. Only
+the invalid fields are re-requested, with their values and errors and a
+schema of just those fields, and merged into the answer, instead of repeating
+the whole survey call.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+
+from catalog import SiteCatalog
+from metrics import timed
+from prompts import TRAVELER_TYPES, SurveyPrompt, count_tokens
+
+FIELDS = ("traveler_type", "explanation", "sites", "itinerary")
+MIN_SITES = 3
+MAX_SITES = 4
+MAX_REPAIRS = 2
+
+logger = logging.getLogger(__name__)
+
+# A repair sends the invalid values and what is needed to correct them, not
+# the survey prompt and the first answer again
+REPAIR_INSTRUCTIONS = (
+    "Correct these fields of a JSON recommendation of sites in Daejeon, South Korea.\n"
+    "{context}Invalid fields:\n{errors}\n\n"
+    "Answer with a JSON object with only the corrected fields: {fields}."
+)
+# Characters of an invalid value quoted in the repair prompt
+MAX_VALUE_CHARS = 120
+
+
+def field_schemas(survey_prompt: SurveyPrompt) -> dict:
+    return {
+        "traveler_type": {"type": "string", "enum": list(TRAVELER_TYPES)},
+        "explanation": {"type": "string"},
+        "sites": {
+            "type": "array",
+            "description": f"IDs of {MIN_SITES} to {MAX_SITES} recommended sites",
+            "items": {"type": "string", "enum": list(survey_prompt.sites)},
+        },
+        "itinerary": {"type": "string"},
+    }
+
+
+def response_format(survey_prompt: SurveyPrompt, fields=FIELDS) -> dict:
+    """OpenAI response_format with the JSON schema of fields, in their answer order."""
+    schemas = field_schemas(survey_prompt)
+    fields = [name for name in FIELDS if name in fields]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "survey_recommendation",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {name: schemas[name] for name in fields},
+                "required": fields,
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def format_recommendation(traveler_type=None, explanation=None, site_names=None, itinerary=None) -> str:
+    """The fields as markdown with bold labels, leaving out missing ones."""
+    parts = []
+    if traveler_type:
+        parts.append(f"**Traveler Type:** {traveler_type}")
+    if explanation:
+        parts.append(f"**Explanation:** {explanation}")
+    if site_names:
+        parts.append("**Recommended Sites:**\n" + "\n".join(f"- {name}" for name in site_names))
+    if itinerary:
+        parts.append(f"**Itinerary:** {itinerary}")
+    return "\n\n".join(parts)
+
+
+@dataclass
+class Recommendation:
+    traveler_type: str | None = None
+    explanation: str = ""
+    sites: list = field(default_factory=list)
+    itinerary: str = ""
+    # field : error of the fields still invalid after the repairs
+    errors: dict = field(default_factory=dict)
+    repairs: int = 0
+    repair_tokens: int = 0
+
+    @property
+    def summary(self) -> str:
+        return format_recommendation(
+            self.traveler_type, self.explanation, [site.name for site in self.sites], self.itinerary
+        )
+
+
+def parse_answer(text: str) -> dict:
+    """JSON object of an answer, empty if it is not one, e.g. cut off."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def validate(data: dict, survey_prompt: SurveyPrompt, catalog: SiteCatalog, fields=FIELDS) -> tuple:
+    """(values, errors) of fields of a parsed answer, dicts of field : valid value or error."""
+    values, errors = {}, {}
+    for name in fields:
+        value = data.get(name)
+        if name == "traveler_type":
+            if value in TRAVELER_TYPES:
+                values[name] = value
+            else:
+                errors[name] = f"{value!r} is not one of {', '.join(TRAVELER_TYPES)}"
+        elif name == "sites":
+            if not isinstance(value, list):
+                errors[name] = "missing, expected a list of site IDs"
+                continue
+            unknown = [item for item in value if not survey_prompt.resolve_sites([str(item)], catalog)]
+            sites = survey_prompt.resolve_sites([str(item) for item in value], catalog)
+            if unknown:
+                errors[name] = f"{', '.join(map(str, unknown))} not in the list of sites"
+            elif not MIN_SITES <= len(sites) <= MAX_SITES:
+                errors[name] = f"{len(sites)} different sites, expected {MIN_SITES} to {MAX_SITES}"
+            else:
+                values[name] = sites
+        elif isinstance(value, str) and value.strip():
+            values[name] = value.strip()
+        else:
+            errors[name] = "missing or empty"
+    return values, errors
+
+
+def repair_prompt(survey_prompt: SurveyPrompt, data: dict, values: dict, errors: dict) -> str:
+    """
+    Prompt re-requesting the fields in errors: their values and errors, the
+    candidate site IDs when the sites are invalid and the valid fields the texts
+    are about.
+    """
+    ids = {site: sid for sid, site in survey_prompt.sites.items()}
+    context = []
+    if "sites" in errors:
+        context.append("candidate site IDs: " + ", ".join(survey_prompt.sites))
+    if "traveler_type" in values:
+        context.append(f"traveler_type: {values['traveler_type']}")
+    if "sites" in values:
+        context.append("sites: " + ", ".join(f"{ids[site]} {site.name}" for site in values["sites"]))
+    return REPAIR_INSTRUCTIONS.format(
+        context="".join(f"- {line}\n" for line in context),
+        errors="\n".join(
+            f"- {name} = {json.dumps(data.get(name), ensure_ascii=False)[:MAX_VALUE_CHARS]}: {error}"
+            for name, error in errors.items()
+        ),
+        fields=", ".join(errors),
+    )
+
+
+def complete_recommendation(
+    complete,
+    survey_prompt: SurveyPrompt,
+    catalog: SiteCatalog,
+    answer: str,
+    max_repairs: int = MAX_REPAIRS,
+) -> Recommendation:
+    """
+    Recommendation of a survey answer, re-requesting its invalid fields up to
+    max_repairs times. complete(prompt, response_format) returns the model's
+    answer text. Fields still invalid afterwards are left out and listed in
+    errors.
+    """
+    data = parse_answer(answer)
+    values, errors = validate(data, survey_prompt, catalog)
+    recommendation = Recommendation()
+    while errors and recommendation.repairs < max_repairs:
+        prompt = repair_prompt(survey_prompt, data, values, errors)
+        try:
+            with timed("llm.survey_repair", fields=len(errors)) as fields:
+                answer = complete(prompt, response_format(survey_prompt, errors))
+                fields.update(prompt_tokens=count_tokens(prompt), completion_tokens=count_tokens(answer))
+        except Exception as e:
+            # Counted as an llm.survey_repair error; the valid fields are kept,
+            # e.g. when the gateway is busy
+            logger.warning("Survey answer repair failed: %s: %s", type(e).__name__, e)
+            break
+        recommendation.repairs += 1
+        recommendation.repair_tokens += fields["prompt_tokens"] + fields["completion_tokens"]
+        data = parse_answer(answer)
+        repaired, errors = validate(data, survey_prompt, catalog, errors)
+        values.update(repaired)
+    for name, value in values.items():
+        setattr(recommendation, name, value)
+    recommendation.errors = errors
+    return recommendation
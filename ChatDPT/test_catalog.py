@@ -0,0 +1,49 @@
+"""
+Site name resolution of the catalog, as the LLM may spell the names.
+
+    python -m pytest test_catalog.py
+"""
+import pytest
+
+from catalog import get_catalog, normalize_name
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return get_catalog()
+
+
+def test_catalog_loads_every_site(catalog):
+    assert len(catalog) == 81
+    assert all(site.name_kr for site in catalog)
+    assert all(site.name in catalog for site in catalog)
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "Yuseong Hot Spring",
+        "yuseong hot-spring!",
+        "  YUSEONG HOT SPRING ",
+        "유성온천",
+        "Yusong Hot Springs",
+    ],
+)
+def test_resolve_variants(catalog, name):
+    assert catalog.resolve(name).name == "Yuseong Hot Spring"
+
+
+@pytest.mark.parametrize("name", ["Eiffel Tower", "", "!!!"])
+def test_resolve_unknown(catalog, name):
+    assert catalog.resolve(name) is None
+
+
+def test_every_site_resolves_to_itself(catalog):
+    for site in catalog:
+        assert catalog.resolve(normalize_name(site.name)) == site
+        assert catalog.resolve(site.name_kr) == site
+
+
+def test_resolve_all_drops_unknown_and_duplicates(catalog):
+    sites = catalog.resolve_all(["유성온천", "Eiffel Tower", "Yuseong Hot Spring", "Expo Science Park"])
+    assert [site.name for site in sites] == ["Yuseong Hot Spring", "Expo Science Park"]
@@ -0,0 +1,62 @@
+"""
+Recommendation cache lookups, least-recently-used eviction and warming.
+
+    python -m pytest test_rec_cache.py
+"""
+import itertools
+
+import pytest
+
+import rec_cache
+from prompts import PROMPT_VERSION
+from rec_cache import RecommendationCache, warm
+from stub_llm import StubLLM
+
+SURVEYS = [(1, 2, 3, 4, 5, 1), (5, 4, 3, 2, 1, 5), (3, 3, 3, 3, 3, 3)]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time(), so last_used never ties."""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(rec_cache.time, "time", lambda: float(next(ticks)))
+
+
+def value(i):
+    return {"traveler_type": "Explorer", "sites": [f"site {i}"], "summary": f"trip {i}"}
+
+
+def test_get_and_put(tmp_path):
+    cache = RecommendationCache(tmp_path / "cache.sqlite")
+    assert cache.get(SURVEYS[0], PROMPT_VERSION, "stub") is None
+    cache.put(SURVEYS[0], PROMPT_VERSION, "stub", value(0))
+    assert cache.get(SURVEYS[0], PROMPT_VERSION, "stub") == value(0)
+    # The prompt version and model are part of the key
+    assert cache.get(SURVEYS[0], "other", "stub") is None
+    assert cache.get(SURVEYS[0], PROMPT_VERSION, "other") is None
+    assert (cache.hits, cache.misses) == (1, 3)
+    # Shared between processes through the file
+    assert RecommendationCache(tmp_path / "cache.sqlite").get(SURVEYS[0], PROMPT_VERSION, "stub") == value(0)
+
+
+def test_least_recently_used_is_evicted(tmp_path, clock):
+    cache = RecommendationCache(tmp_path / "cache.sqlite", max_entries=2)
+    cache.put(SURVEYS[0], PROMPT_VERSION, "stub", value(0))
+    cache.put(SURVEYS[1], PROMPT_VERSION, "stub", value(1))
+    # Reading the first entry makes the second the least recently used
+    assert cache.get(SURVEYS[0], PROMPT_VERSION, "stub") == value(0)
+    cache.put(SURVEYS[2], PROMPT_VERSION, "stub", value(2))
+    assert len(cache) == 2
+    assert (SURVEYS[0], PROMPT_VERSION, "stub") in cache
+    assert (SURVEYS[1], PROMPT_VERSION, "stub") not in cache
+    assert (SURVEYS[2], PROMPT_VERSION, "stub") in cache
+
+
+def test_warm_fills_missing_entries(tmp_path):
+    cache = RecommendationCache(tmp_path / "cache.sqlite")
+    llm = StubLLM()
+    assert warm(cache, llm, "stub", limit=5) == {"cached": 0, "added": 5, "failed": 0}
+    assert warm(cache, llm, "stub", limit=6) == {"cached": 5, "added": 1, "failed": 0}
+    assert llm.calls == 6
+    for responses in itertools.islice(itertools.product(range(1, 6), repeat=6), 6):
+        assert cache.get(responses, PROMPT_VERSION, "stub")["sites"]
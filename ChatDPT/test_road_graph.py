@@ -0,0 +1,46 @@
+"""
+Road graph arrays and route matrix searches on a small hand-made graph.
+
+    python -m pytest test_road_graph.py
+"""
+import networkx as nx
+import numpy as np
+import pytest
+
+from road_graph import SPEEDS_KPH, RoadGraph, graph_to_arrays
+from route_matrix import compute_mode
+
+
+def make_graph(travel_times):
+    """Path 1 -> 2 -> 3 -> 4 where 2 -> 3 is a zero-length way."""
+    G = nx.MultiDiGraph()
+    for node in (1, 2, 3, 4):
+        G.add_node(node, x=127.38 + node * 1e-3, y=36.35)
+    for (u, v, length), travel_time in zip([(1, 2, 100.0), (2, 3, 0.0), (3, 4, 50.0)], travel_times):
+        G.add_edge(u, v, length=length, travel_time=travel_time)
+    return G
+
+
+def test_missing_travel_time_uses_network_speed():
+    arrays = graph_to_arrays(make_graph([10.0, 0.0, None]), "drive")
+    travel_time = dict(zip(arrays["length"].tolist(), arrays["travel_time"].tolist()))
+    assert travel_time[100.0] == pytest.approx(10.0)
+    assert travel_time[50.0] == pytest.approx(50.0 / (SPEEDS_KPH["drive"] / 3.6))
+
+    arrays = graph_to_arrays(make_graph([None, None, None]), "walk")
+    assert arrays["travel_time"].max() == pytest.approx(100.0 / (SPEEDS_KPH["walk"] / 3.6))
+
+
+def test_zero_length_edges_keep_connectivity():
+    graph = RoadGraph(graph_to_arrays(make_graph([10.0, 0.0, 5.0]), "drive"), {})
+    csgraph = graph.to_csgraph("length")
+    csgraph.eliminate_zeros()
+    assert csgraph.nnz == graph.n_edges
+
+    sites = np.array([graph.node_position(1), graph.node_position(4)])
+    mode = compute_mode(graph, sites)
+    assert mode["time"][0, 1] == pytest.approx(15.0, abs=1e-2)
+    assert mode["length"][0, 1] == pytest.approx(150.0, abs=1e-2)
+    assert np.isinf(mode["time"][1, 0])
+    # The route passes through all four nodes
+    assert mode["offsets"][2] - mode["offsets"][1] == 4
@@ -0,0 +1,81 @@
+"""
+Route matrix searches against networkx shortest paths on a random street grid.
+
+    python -m pytest test_route_matrix.py
+"""
+import json
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from road_graph import RoadGraph, graph_to_arrays
+from route_matrix import RouteMatrix, compute_mode
+
+
+def grid_graph(size=6, seed=0):
+    """Directed size x size grid with random lengths, a few one-way and missing streets."""
+    rng = np.random.default_rng(seed)
+    G = nx.MultiDiGraph()
+    for i in range(size):
+        for j in range(size):
+            G.add_node(i * size + j + 1000, x=127.38 + j * 1e-3, y=36.35 + i * 1e-3)
+    for i in range(size):
+        for j in range(size):
+            node = i * size + j + 1000
+            for neighbour in (node + 1 if j + 1 < size else None, node + size if i + 1 < size else None):
+                if neighbour is None or rng.random() < 0.1:
+                    continue
+                length = float(rng.uniform(50, 150))
+                G.add_edge(node, neighbour, length=length, travel_time=length / rng.uniform(5, 15))
+                if rng.random() < 0.8:
+                    G.add_edge(neighbour, node, length=length, travel_time=length / rng.uniform(5, 15))
+    return G
+
+
+@pytest.fixture(scope="module")
+def grid():
+    G = grid_graph()
+    graph = RoadGraph(graph_to_arrays(G, "drive"), {"version": "test", "network_type": "drive"})
+    sites = np.random.default_rng(1).choice(graph.n_nodes, size=8, replace=False)
+    return G, graph, sites
+
+
+def test_times_match_networkx(grid):
+    G, graph, sites = grid
+    mode = compute_mode(graph, sites)
+    nodes = graph.node_ids[sites].tolist()
+    for i, source in enumerate(nodes):
+        expected = nx.single_source_dijkstra_path_length(G, source, weight="travel_time")
+        for j, target in enumerate(nodes):
+            if target in expected:
+                assert mode["time"][i, j] == pytest.approx(expected[target], rel=1e-4)
+            else:
+                assert np.isinf(mode["time"][i, j])
+                assert np.isinf(mode["length"][i, j])
+
+
+def test_saved_matrix_round_trip(grid, tmp_path):
+    G, graph, sites = grid
+    names = [f"site {i}" for i in range(len(sites))]
+    arrays = {"names": np.array(names)}
+    for key, value in compute_mode(graph, sites).items():
+        arrays[f"drive_{key}"] = value
+    arrays["meta"] = np.array(json.dumps({"graph_versions": {"drive": graph.version}}))
+    np.savez_compressed(tmp_path / "route_matrix.npz", **arrays)
+
+    matrix = RouteMatrix.load(tmp_path / "route_matrix.npz")
+    assert matrix.modes == ("drive",)
+    assert "site 0" in matrix and "elsewhere" not in matrix
+    assert not matrix.has_route("site 0", "elsewhere")
+    for i, origin in enumerate(names):
+        for j, destination in enumerate(names):
+            assert matrix.cost(origin, destination) == arrays["drive_time"][i, j]
+            coords = matrix.route_coords(origin, destination)
+            if not matrix.has_route(origin, destination):
+                assert coords == []
+                continue
+            # Routes run from the origin node to the destination node
+            assert coords[0] == pytest.approx((graph.y[sites[i]], graph.x[sites[i]]))
+            assert coords[-1] == pytest.approx((graph.y[sites[j]], graph.x[sites[j]]))
+            assert matrix.cost(origin, destination, metric="length") >= 0
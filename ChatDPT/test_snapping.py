@@ -0,0 +1,60 @@
+"""
+Nearest road node lookups of the KD-tree index against brute force.
+
+    python -m pytest test_snapping.py
+"""
+import pickle
+
+import numpy as np
+import pytest
+
+from road_graph import RoadGraph
+from snapping import EARTH_RADIUS_M, NodeIndex
+
+
+def haversine(lon, lat, lons, lats):
+    lon, lat, lons, lats = map(np.radians, (lon, lat, lons, lats))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+@pytest.fixture(scope="module")
+def graph():
+    rng = np.random.default_rng(0)
+    n = 500
+    arrays = {
+        "node_ids": np.arange(n, dtype=np.int64) * 7 + 100,
+        "x": rng.uniform(127.25, 127.50, n),
+        "y": rng.uniform(36.20, 36.50, n),
+        "indptr": np.zeros(n + 1, dtype=np.int64),
+        "targets": np.empty(0, dtype=np.int32),
+        "length": np.empty(0, dtype=np.float32),
+        "travel_time": np.empty(0, dtype=np.float32),
+    }
+    return RoadGraph(arrays, {"version": "test", "network_type": "drive"})
+
+
+def test_query_matches_brute_force(graph):
+    index = NodeIndex.build(graph)
+    rng = np.random.default_rng(1)
+    lons, lats = rng.uniform(127.25, 127.50, 200), rng.uniform(36.20, 36.50, 200)
+    positions, distances = index.query(lons, lats)
+    for lon, lat, position, distance in zip(lons, lats, positions, distances):
+        exact = haversine(lon, lat, graph.x, graph.y)
+        # The equirectangular projection is within 0.5% of great-circle distances here
+        assert exact[position] <= exact.min() * 1.005 + 1e-6
+        assert distance == pytest.approx(exact[position], rel=5e-3)
+
+
+def test_query_beyond_max_distance(graph):
+    index = NodeIndex.build(graph)
+    positions, distances = index.query([127.0, graph.x[3]], [36.0, graph.y[3]], max_distance=500)
+    assert positions.tolist() == [-1, 3]
+    assert np.isinf(distances[0])
+    assert distances[1] == pytest.approx(0)
+
+
+def test_index_pickles(graph):
+    index = pickle.loads(pickle.dumps(NodeIndex.build(graph)))
+    assert index.graph_version == "test"
+    assert index.query(graph.x[10], graph.y[10])[0].tolist() == [10]
@@ -0,0 +1,116 @@
+"""
+Validation and field-level repair of structured survey answers, with the stub model.
+
+    python -m pytest test_survey_output.py
+"""
+import json
+import logging
+
+import pytest
+
+import survey_output
+from catalog import get_catalog
+from metrics import Metrics
+from prompts import SURVEY_QUESTIONS, TRAVELER_TYPES, build_survey_prompt
+from stub_llm import StubLLM
+from survey_output import MAX_REPAIRS, complete_recommendation, parse_answer, response_format, validate
+
+RESPONSES = (4, 2, 5, 1, 3, 4)
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return get_catalog()
+
+
+@pytest.fixture(scope="module")
+def survey_prompt(catalog):
+    return build_survey_prompt(SURVEY_QUESTIONS, RESPONSES, catalog)
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """In-memory metrics for the repair calls."""
+    metrics = Metrics()
+    monkeypatch.setattr(survey_output, "timed", metrics.timed)
+    return metrics
+
+
+def stub_answer(survey_prompt, **changes):
+    answer = json.loads(StubLLM().complete(survey_prompt.text, response_format(survey_prompt)))
+    answer.update(changes)
+    return json.dumps(answer)
+
+
+def test_valid_answer_needs_no_repair(survey_prompt, catalog, metrics):
+    llm = StubLLM()
+    answer = llm.complete(survey_prompt.text, response_format(survey_prompt))
+    recommendation = complete_recommendation(llm.complete, survey_prompt, catalog, answer)
+    assert recommendation.errors == {}
+    assert recommendation.repairs == 0
+    assert recommendation.traveler_type in TRAVELER_TYPES
+    assert len(recommendation.sites) == 3
+    assert llm.calls == 1
+    assert metrics.summary() == {}
+
+
+@pytest.mark.parametrize("answer", ["", '{"traveler_type": "Expl', "[1, 2, 3]", "null"])
+def test_bad_json_is_repaired(survey_prompt, catalog, metrics, answer):
+    assert parse_answer(answer) == {}
+    llm = StubLLM()
+    recommendation = complete_recommendation(llm.complete, survey_prompt, catalog, answer)
+    assert recommendation.errors == {}
+    assert recommendation.repairs == 1
+    assert recommendation.repair_tokens > 0
+    assert recommendation.sites and recommendation.itinerary
+    assert metrics.summary()["llm.survey_repair"]["totals"]["fields"] == len(survey_output.FIELDS)
+
+
+def test_only_invalid_fields_are_requested(survey_prompt, catalog, metrics):
+    answer = stub_answer(survey_prompt, traveler_type="Tourist", sites=["S999"], explanation="Kept as is.")
+    prompts = []
+
+    def complete(prompt, response_format):
+        prompts.append(prompt)
+        assert list(response_format["json_schema"]["schema"]["properties"]) == ["traveler_type", "sites"]
+        return StubLLM().complete(prompt, response_format)
+
+    recommendation = complete_recommendation(complete, survey_prompt, catalog, answer)
+    assert len(prompts) == 1
+    assert "S999" in prompts[0] and "candidate site IDs: " in prompts[0]
+    assert recommendation.errors == {}
+    assert recommendation.explanation == "Kept as is."
+    assert recommendation.traveler_type in TRAVELER_TYPES
+
+
+def test_repairs_are_bounded(survey_prompt, catalog, metrics):
+    answer = stub_answer(survey_prompt, sites=["S999"])
+    recommendation = complete_recommendation(lambda prompt, format: "not json", survey_prompt, catalog, answer)
+    assert recommendation.repairs == MAX_REPAIRS
+    assert set(recommendation.errors) == {"sites"}
+    assert recommendation.sites == []
+    assert recommendation.itinerary
+    assert metrics.summary()["llm.survey_repair"]["count"] == MAX_REPAIRS
+
+
+def test_failed_repair_keeps_valid_fields(survey_prompt, catalog, metrics, caplog):
+    answer = stub_answer(survey_prompt, itinerary="")
+
+    def complete(prompt, response_format):
+        raise TimeoutError("gateway busy")
+
+    with caplog.at_level(logging.WARNING, logger="survey_output"):
+        recommendation = complete_recommendation(complete, survey_prompt, catalog, answer)
+    assert recommendation.errors == {"itinerary": "missing or empty"}
+    assert recommendation.repairs == 0
+    assert len(recommendation.sites) == 3
+    assert "TimeoutError: gateway busy" in caplog.text
+    assert metrics.summary()["llm.survey_repair"]["errors"] == 1
+
+
+def test_validate_site_count(survey_prompt, catalog):
+    site_ids = list(survey_prompt.sites)
+    values, errors = validate({"sites": site_ids[:2]}, survey_prompt, catalog, ["sites"])
+    assert values == {} and "expected 3 to 4" in errors["sites"]
+    values, errors = validate({"sites": site_ids[:4] + site_ids[:1]}, survey_prompt, catalog, ["sites"])
+    assert errors == {} and len(values["sites"]) == 4
@@ -1,88 +1,237 @@
+from __future__ import annotations
+
 import base64
 from io import StringIO, BytesIO
 import unicodedata
 import re
-from typing import Any
+from typing import TYPE_CHECKING, Any
+import gzip
 import io
 import json
+import math
+import time
+
+import numpy as np
+import shapely
 
-from matplotlib.pyplot import figure
 import streamlit as st
-from geopandas import GeoDataFrame
-from shapely.geometry import Polygon
+import streamlit.components.v1 as components
+from shapely.geometry import LineString, Polygon
+
+from metrics import instrument, timed
+from render_cache import get_render_cache, render_key
+
+# matplotlib, geopandas, osmnx, networkx and folium take about two seconds to
+# import together, so they are imported by the functions using them: a slider rerun or the first
+# page load does not pay for the map stack
+if TYPE_CHECKING:
+    import folium
+    from geopandas import GeoDataFrame
+    from matplotlib.figure import Figure
+
+# Routes on the folium map are simplified to about a pixel at this zoom level
+# and their coordinates rounded to ROUTE_PRECISION decimals (about 1 m)
+ROUTE_SIMPLIFY_ZOOM = 16
+ROUTE_PRECISION = 5
+
+
+def rows_measure(df, *args, **kwargs) -> dict:
+    """Metrics fields of a call returning a GeoDataFrame."""
+    return {"rows": len(df)}
+
 
-from prettymapp.plotting import Plot
-from prettymapp.osm import get_osm_geometries
-from prettymapp.settings import STYLES
+def export_measure(bytesio, geodataframe, *args, **kwargs) -> dict:
+    """Metrics fields of a gdf_to_bytesio_* export."""
+    return {"rows": len(geodataframe), "bytes": bytesio.getbuffer().nbytes}
 
-import osmnx as ox
-import networkx as nx
-import folium
-from streamlit_folium import folium_static
 
+@instrument("osm.st_geometries", measure=rows_measure)
 @st.cache_data(
     show_spinner=False, hash_funcs={Polygon: lambda x: json.dumps(x.__geo_interface__)}
 )
 def st_get_osm_geometries(aoi):
     """Wrapper to enable streamlit caching for package function"""
-    df = get_osm_geometries(aoi=aoi)
+    df = fetch_osm_geometries(aoi=aoi)
     return df
 
 
-# @st.cache_data(show_spinner=False)
-# def st_plot_all(_df: GeoDataFrame, **kwargs):
-#     """Wrapper to enable streamlit caching for package function"""
-#     fig = Plot(_df, **kwargs).plot_all()
-#     return fig
-@st.cache_data(show_spinner=False)
-def st_plot_all(_df: GeoDataFrame, recommended_sites, **kwargs):
-    """Wrapper to enable streamlit caching for package function"""
-    fig = Plot(_df, **kwargs).plot_all()
-    
-    # Create a Folium map centered around the center coordinates
-    center_lat = (_df.total_bounds[1] + _df.total_bounds[3]) / 2
-    center_lon = (_df.total_bounds[0] + _df.total_bounds[2]) / 2
-    map_obj = folium.Map(location=[center_lat, center_lon], zoom_start=13)
-    
-    # Add map pins for recommended sites
-    for site, coords in recommended_sites.items():
-        folium.Marker(location=[coords['lat'], coords['lon']], popup=site).add_to(map_obj)
-    
-    # Connect road networks between recommended sites
-    bbox = (_df.total_bounds[3], _df.total_bounds[1], _df.total_bounds[2], _df.total_bounds[0])
-    G = ox.graph_from_bbox(bbox=bbox, network_type='drive')
+def fetch_osm_geometries(aoi):
+    """
+    Reads the geometries from the local geometry store when it covers the aoi,
+    querying Overpass otherwise.
+    """
+    from prettymapp.osm import get_osm_geometries
 
-    site_nodes = []
-    for site, coords in recommended_sites.items():
-        nearest_node = ox.distance.nearest_nodes(G, coords['lon'], coords['lat'])
-        site_nodes.append(nearest_node)
-    
+    from geometry_store import get_geometry_store
+
+    with timed("osm.fetch") as fields:
+        geometry_store = get_geometry_store()
+        if geometry_store is not None and geometry_store.covers(aoi):
+            fields["source"] = "store"
+            df = geometry_store.query(aoi)
+        else:
+            fields["source"] = "overpass"
+            df = get_osm_geometries(aoi=aoi)
+        fields["rows"] = len(df)
+    return df
+
+
+def render_map(
+    _df: GeoDataFrame, format: str = "png", dpi: int = 300, fast: bool = False, **kwargs
+) -> bytes:
+    """
+    Returns the map of _df rendered with prettymapp as png or svg bytes, served
+    from the render cache when the same geometries and settings were rendered
+    before. fast renders with FastPlot, simplified to the output resolution, an
+    opt-in compared against prettymapp in bench_render.py.
+    """
+    from matplotlib.pyplot import close
+    from prettymapp.plotting import Plot
+
+    from fast_plot import FastPlot
+
+    with timed("map.render", format=format, rows=len(_df)) as fields:
+        render_cache = get_render_cache()
+        key = render_key(_df, format, dpi, fast=fast, **kwargs)
+        data = render_cache.get(key, format)
+        fields["cache_hit"] = data is not None
+        if data is None:
+            plot_class = FastPlot if fast else Plot
+            fig = plot_class(_df, dpi=dpi, **kwargs).plot_all()
+            buffer = BytesIO()
+            fig.savefig(buffer, format=format, pad_inches=0, bbox_inches="tight", transparent=True, dpi=dpi)
+            close(fig)
+            data = buffer.getvalue()
+            render_cache.put(key, data, format)
+        fields["bytes"] = len(data)
+    return data
+
+
+@instrument("map.route_map", measure=lambda route_map, bounds, recommended_sites, routes: {"routes": len(routes)})
+def build_route_map(bounds, recommended_sites, routes) -> folium.Map:
+    """
+    Returns folium map of the routes (see get_route_coords) with a marker for
+    each recommended site, centered on bounds (west, south, east, north). The
+    routes are simplified to about a screen pixel at ROUTE_SIMPLIFY_ZOOM and
+    sent as a single GeoJSON layer.
+    """
+    import folium
+
+    center_lat = (bounds[1] + bounds[3]) / 2
+    center_lon = (bounds[0] + bounds[2]) / 2
     route_map = folium.Map(location=[center_lat, center_lon], zoom_start=13)
-    
-    for i in range(len(site_nodes)):
-        if i < len(site_nodes) - 1:
-            try:
-                route = nx.shortest_path(G, site_nodes[i], site_nodes[i + 1], weight='length')
-                route_coords = [(G.nodes[node]['y'], G.nodes[node]['x']) for node in route]
-                folium.PolyLine(route_coords, color='dodgerblue', weight=5, opacity=1).add_to(route_map)
-            except nx.NetworkXNoPath:
-                print(f"No path found between {site_nodes[i]} and {site_nodes[i + 1]}. Skipping route.")
-        
-        # Add markers for each site
-        site = list(recommended_sites.keys())[i]
-        coords = recommended_sites[site]
+
+    tolerance = 156543.03 * math.cos(math.radians(center_lat)) / 2**ROUTE_SIMPLIFY_ZOOM / 111_320
+    lines = [
+        shapely.simplify(LineString([(lon, lat) for lat, lon in route_coords]), tolerance)
+        for route_coords in routes
+        if len(route_coords) > 1
+    ]
+    if lines:
+        folium.GeoJson(
+            {
+                "type": "Feature",
+                "properties": {},
+                "geometry": {
+                    "type": "MultiLineString",
+                    "coordinates": [
+                        np.round(shapely.get_coordinates(line), ROUTE_PRECISION).tolist() for line in lines
+                    ],
+                },
+            },
+            name="routes",
+            style_function=lambda _: {"color": "dodgerblue", "weight": 5, "opacity": 1},
+        ).add_to(route_map)
+
+    # Add markers for each site
+    for site, coords in recommended_sites.items():
         folium.Marker(location=[coords['lat'], coords['lon']], popup=site).add_to(route_map)
-    
-    # Display the route map in Streamlit
-    folium_static(route_map)
-    
-    return fig
+    return route_map
+
+
+def show_folium_map(folium_map, width: int = 700, height: int = 500) -> int:
+    """
+    Renders folium_map as a static component, like streamlit_folium's
+    folium_static. Returns the size in bytes of the HTML sent to the browser,
+    also summed up per session in st.session_state.map_payload_bytes.
+    """
+    import folium
+
+    with timed("map.folium_payload") as fields:
+        fig = folium.Figure().add_child(folium_map)
+        html = fig.render()
+        components.html(html, height=(fig.height or height) + 10, width=width)
+        payload_bytes = len(html.encode("utf-8"))
+        fields["bytes"] = payload_bytes
+    st.session_state.map_payload_bytes = st.session_state.get("map_payload_bytes", 0) + payload_bytes
+    return payload_bytes
+
+
+@instrument("routes", measure=lambda routes, *args, **kwargs: {"routes": len(routes)})
+def get_route_coords(bounds, recommended_sites) -> list:
+    """
+    Returns the road route, as a list of (lat, lon) tuples, between each pair of
+    consecutive recommended sites. Pairs covered by the precomputed route matrix
+    are read from it, the road graph is only searched for the remaining pairs.
+    """
+    import networkx as nx
+
+    from road_graph import get_road_graph
+    from route_matrix import get_route_matrix
+
+    sites = list(recommended_sites.keys())
+    pairs = list(zip(sites[:-1], sites[1:]))
+    routes = {}
+    route_matrix = get_route_matrix()
+    if route_matrix is not None:
+        for origin, destination in pairs:
+            if route_matrix.has_route(origin, destination):
+                routes[(origin, destination)] = route_matrix.route_coords(origin, destination)
+    if len(routes) == len(pairs):
+        return [routes[pair] for pair in pairs]
+
+    # Connect road networks between recommended sites, using the prebuilt road
+    # graph store when available instead of downloading the graph again
+    with timed("routes.graph") as fields:
+        road_graph = get_road_graph("drive")
+        if road_graph is not None:
+            from snapping import snap_points
+
+            fields["source"] = "store"
+            G = road_graph.subgraph(bounds)
+            node_ids, _ = snap_points(
+                [coords['lon'] for coords in recommended_sites.values()],
+                [coords['lat'] for coords in recommended_sites.values()],
+            )
+            site_nodes = dict(zip(sites, node_ids.tolist()))
+        else:
+            import osmnx as ox
+
+            fields["source"] = "osmnx"
+            bbox = (bounds[3], bounds[1], bounds[2], bounds[0])
+            G = ox.graph_from_bbox(bbox=bbox, network_type='drive')
+            site_nodes = {}
+            for site, coords in recommended_sites.items():
+                site_nodes[site] = ox.distance.nearest_nodes(G, coords['lon'], coords['lat'])
+
+    with timed("routes.search", pairs=len(pairs) - len(routes)):
+        for origin, destination in pairs:
+            if (origin, destination) in routes:
+                continue
+            try:
+                route = nx.shortest_path(G, site_nodes[origin], site_nodes[destination], weight='length')
+                routes[(origin, destination)] = [(G.nodes[node]['y'], G.nodes[node]['x']) for node in route]
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                print(f"No path found between {site_nodes[origin]} and {site_nodes[destination]}. Skipping route.")
+    return [routes[pair] for pair in pairs if pair in routes]
 
 
 def get_colors_from_style(style: str) -> dict:
     """
     Returns dict of landcover_class : color
     """
+    from prettymapp.settings import STYLES
+
     lc_class_colors = {}
     for lc_class, class_style in STYLES[style].items():
         colors = class_style.get("cmap", class_style.get("fc"))
@@ -94,7 +243,7 @@ def get_colors_from_style(style: str) -> dict:
     return lc_class_colors
 
 
-def plt_to_svg(fig: figure) -> str:
+def plt_to_svg(fig: Figure) -> str:
     imgdata = StringIO()
     fig.savefig(
         imgdata, format="svg", pad_inches=0, bbox_inches="tight", transparent=True
@@ -112,7 +261,7 @@ def svg_to_html(svg_string: str) -> str:
     return html
 
 
-def plt_to_href(fig: figure, filename: str):
+def plt_to_href(fig: Figure, filename: str):
     buf = BytesIO()
     fig.savefig(buf, format="png", pad_inches=0, bbox_inches="tight", transparent=True)
     img_str = base64.b64encode(buf.getvalue()).decode()
@@ -141,7 +290,66 @@ def slugify(value: Any, allow_unicode: bool = False):
     return re.sub(r"[-\s]+", "-", value).strip("-_")
 
 
+@instrument("export.geojson", measure=export_measure)
 def gdf_to_bytesio_geojson(geodataframe):
     geojson_object = io.BytesIO()
     geodataframe.to_file(geojson_object, driver="GeoJSON")
-    return geojson_object
\ No newline at end of file
+    return geojson_object
+
+
+@instrument("export.geoparquet", measure=export_measure)
+def gdf_to_bytesio_geoparquet(geodataframe):
+    geoparquet_object = io.BytesIO()
+    geodataframe.to_parquet(geoparquet_object, compression="zstd", index=False)
+    return geoparquet_object
+
+
+@instrument("export.flatgeobuf", measure=export_measure)
+def gdf_to_bytesio_flatgeobuf(geodataframe):
+    flatgeobuf_object = io.BytesIO()
+    geodataframe.to_file(flatgeobuf_object, driver="FlatGeobuf", engine="pyogrio")
+    return flatgeobuf_object
+
+
+@instrument("export.geojson_gz", measure=export_measure)
+def gdf_to_bytesio_geojson_gz(geodataframe, precision: int = 6, chunk_size: int = 5000):
+    """
+    Gzip compressed GeoJSON with coordinates rounded to precision decimals
+    (6 is about 0.1 m), written feature chunk by feature chunk.
+    """
+    geojson_gz_object = io.BytesIO()
+    properties = geodataframe.drop(columns=geodataframe.geometry.name)
+    properties = properties.astype(object).where(properties.notna(), None)
+    with gzip.GzipFile(fileobj=geojson_gz_object, mode="wb", compresslevel=6) as f:
+        f.write(b'{"type": "FeatureCollection", "features": [')
+        for start in range(0, len(geodataframe), chunk_size):
+            geometries = shapely.transform(
+                geodataframe.geometry.iloc[start:start + chunk_size].to_numpy(),
+                lambda coords: np.round(coords, precision),
+            )
+            records = properties.iloc[start:start + chunk_size].to_dict("records")
+            features = ",".join(
+                f'{{"type": "Feature", "properties": {json.dumps(record, default=str)}, "geometry": {geometry}}}'
+                for record, geometry in zip(records, shapely.to_geojson(geometries))
+            )
+            f.write((("," if start else "") + features).encode("utf-8"))
+        f.write(b"]}")
+    geojson_gz_object.seek(0)
+    return geojson_gz_object
+
+
+# Export format : (function, file extension, mime type)
+EXPORT_FORMATS = {
+    "GeoParquet": (gdf_to_bytesio_geoparquet, "parquet", "application/vnd.apache.parquet"),
+    "FlatGeobuf": (gdf_to_bytesio_flatgeobuf, "fgb", "application/flatgeobuf"),
+    "GeoJSON (gzip)": (gdf_to_bytesio_geojson_gz, "geojson.gz", "application/gzip"),
+    "GeoJSON": (gdf_to_bytesio_geojson, "geojson", "application/geo+json"),
+}
+
+
+def export_geometries(geodataframe, export_format: str) -> tuple:
+    """Returns (bytes, seconds taken) of the geometries exported in export_format."""
+    to_bytesio = EXPORT_FORMATS[export_format][0]
+    start = time.perf_counter()
+    data = to_bytesio(geodataframe).getvalue()
+    return data, time.perf_counter() - start
\ No newline at end of file
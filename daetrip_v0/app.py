@@ -4,6 +4,8 @@ from folium.plugins import MarkerCluster
 from streamlit_folium import folium_static
 import pandas as pd
 
+from itinerary import plan_itinerary, travel_time_matrix
+
 st.title('DaeTRIP - Daejeon Tourist Route Recommendation System')
 
 # Fetch touristic sites data from Daejeon's centralized tourism database
@@ -18,8 +20,18 @@ def fetch_sites_data_from_database(user_preferences):
 
 # Generate personalized route recommendations
 def generate_route_recommendations(selected_sites, sites_data, user_preferences, transportation_type, max_time):
-    # Placeholder function - replace with actual recommendation logic
-    recommended_route = selected_sites
+    # Order the selected sites by least total travel time, keeping the best rated
+    # sites that can be reached within max_time (minutes) of transportation
+    if not selected_sites:
+        return []
+    cost = travel_time_matrix(
+        [sites_data[site]['lat'] for site in selected_sites],
+        [sites_data[site]['lon'] for site in selected_sites],
+        transportation_type,
+    )
+    scores = [sites_data[site].get('rating', 1) for site in selected_sites]
+    order, _ = plan_itinerary(cost, max_time=max_time, scores=scores)
+    recommended_route = [selected_sites[i] for i in order]
     return recommended_route
 
 # Fetch user-generated reviews from the database
@@ -47,6 +59,7 @@ map_placeholder = st.empty()
 if st.button('Recommend Route'):
     # Generate personalized route recommendations
     recommended_route = generate_route_recommendations(selected_sites, sites_data, user_preferences, transportation_type, max_time)
+    st.write(' → '.join(recommended_route))
     
     # Initialize Folium map
     m = folium.Map(location=[sites_data[selected_sites[0]]['lat'], sites_data[selected_sites[0]]['lon']], zoom_start=13)
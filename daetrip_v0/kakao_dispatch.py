@@ -0,0 +1,326 @@
+"""
+Asynchronous, batched KakaoTalk dispatcher for sharing itineraries.
+
+send_ktalk.py sends one message at a time through PyKakao, synchronously and
+without retries. KakaoDispatcher sends on one pooled aiohttp session instead:
+- friend receivers of the same message are merged into requests of up to
+  MAX_RECEIVERS receiver_uuids (the API limit), flushed when full or after
+  a short linger
+- requests are paced by a token bucket (requests per second) and run on a
+  fixed number of workers
+- rate limited (429), server errors (5xx) and network errors are retried with
+  exponential backoff and jitter; receivers that still fail, or fail for
+  good (e.g. blocked the app), go to a dead-letter queue (and JSONL file)
+- stats.report() has the requests, delivered messages, retries, dead
+  letters, throughput and request latency
+
+Load test against the local mock Kakao API (mock_kakao_server.py):
+
+    python kakao_dispatch.py load --messages 200 --friends 20 --rate 150
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import aiohttp
+
+KAKAO_API_URL = "https://kapi.kakao.com"
+MEMO_PATH = "/v2/api/talk/memo/default/send"
+FRIENDS_PATH = "/v1/api/talk/friends/message/default/send"
+# receiver_uuids per "send to friends" request allowed by the API
+MAX_RECEIVERS = 5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class Batch:
+    """One API request: a message to me, or to up to MAX_RECEIVERS friends."""
+    template: str
+    receiver_uuids: Optional[List[str]] = None
+    attempt: int = 0
+    error: Optional[str] = None
+
+    @property
+    def receivers(self) -> int:
+        return 1 if self.receiver_uuids is None else len(self.receiver_uuids)
+
+
+@dataclass
+class DispatchStats:
+    requests: int = 0
+    delivered: int = 0
+    retries: int = 0
+    dead_letters: int = 0
+    latencies: List[float] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    def report(self) -> dict:
+        seconds = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+
+        def quantile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+
+        return {
+            "seconds": round(seconds, 3),
+            "requests": self.requests,
+            "delivered": self.delivered,
+            "retries": self.retries,
+            "dead_letters": self.dead_letters,
+            "messages_per_second": round(self.delivered / seconds, 1) if seconds else None,
+            "latency_p50_ms": quantile(0.5),
+            "latency_p95_ms": quantile(0.95),
+            "errors": dict(self.errors),
+        }
+
+
+class TokenBucket:
+    """Allows rate acquisitions per second on average, bursts of up to burst."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def template_object(text: str, web_url: str, button_title: str = "바로 확인") -> dict:
+    """Text message template with a link, e.g. an itinerary and its map URL."""
+    return {
+        "object_type": "text",
+        "text": text[:200],
+        "link": {"web_url": web_url, "mobile_web_url": web_url},
+        "button_title": button_title,
+    }
+
+
+class KakaoDispatcher:
+    """
+    Args:
+        access_token: Kakao user access token with the talk_message scope
+        base_url: API URL, e.g. of the mock server
+        workers: Requests in flight at the same time (and pooled connections)
+        rate: Requests per second
+        max_retries: Retries of a request before its receivers are dead-lettered
+        backoff: Seconds before the first retry, doubled on every further one
+        linger: Seconds a partial batch of friends waits for more receivers
+        dead_letter_path: JSONL file the dead letters are appended to
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        base_url: str = KAKAO_API_URL,
+        workers: int = 8,
+        rate: float = 50.0,
+        max_retries: int = 4,
+        backoff: float = 0.2,
+        linger: float = 0.05,
+        dead_letter_path: Optional[str] = None,
+    ):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.linger = linger
+        self.dead_letter_path = dead_letter_path
+        self.bucket = TokenBucket(rate, burst=workers)
+        self.dead_letters = []
+        self.stats = DispatchStats()
+        self._pending = {}
+        self._flush_handles = {}
+        self._retrying = set()
+        self._queue = None
+        self._session = None
+        self._tasks = []
+
+    async def __aenter__(self):
+        self._queue = asyncio.Queue()
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.workers),
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self.stats = DispatchStats()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._session.close()
+
+    def send_to_me(self, template: dict):
+        self._queue.put_nowait(Batch(json.dumps(template, ensure_ascii=False)))
+
+    def send_to_friends(self, template: dict, receiver_uuids: List[str]):
+        """Queue template for receiver_uuids, merged with other receivers of the same template."""
+        key = json.dumps(template, ensure_ascii=False)
+        pending = self._pending.setdefault(key, [])
+        pending.extend(receiver_uuids)
+        while len(pending) >= MAX_RECEIVERS:
+            self._queue.put_nowait(Batch(key, pending[:MAX_RECEIVERS]))
+            del pending[:MAX_RECEIVERS]
+        if pending and key not in self._flush_handles:
+            self._flush_handles[key] = asyncio.get_running_loop().call_later(self.linger, self._flush, key)
+
+    def _flush(self, key: str):
+        self._flush_handles.pop(key, None)
+        pending = self._pending.pop(key, [])
+        if pending:
+            self._queue.put_nowait(Batch(key, pending))
+
+    async def join(self):
+        """Wait until every queued message is delivered or dead-lettered."""
+        for key in list(self._flush_handles):
+            self._flush_handles[key].cancel()
+            self._flush(key)
+        while True:
+            await self._queue.join()
+            if not self._retrying:
+                return
+            await asyncio.gather(*self._retrying)
+
+    async def _retry_later(self, batch: Batch, delay: float):
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(batch)
+
+    async def _worker(self):
+        while True:
+            batch = await self._queue.get()
+            try:
+                await self._send(batch)
+            except Exception as e:
+                # A failed send must not kill the worker, or join() would wait forever
+                batch.error = f"{type(e).__name__}: {e}"
+                self.stats.errors[type(e).__name__] += 1
+                self._dead_letter(batch, batch.receiver_uuids)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, batch: Batch):
+        data = {"template_object": batch.template}
+        if batch.receiver_uuids is not None:
+            data["receiver_uuids"] = json.dumps(batch.receiver_uuids)
+        path = MEMO_PATH if batch.receiver_uuids is None else FRIENDS_PATH
+        await self.bucket.acquire()
+        start = time.perf_counter()
+        try:
+            async with self._session.post(self.base_url + path, data=data) as response:
+                status = response.status
+                body = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            status, body = None, {"msg": f"{type(e).__name__}: {e}"}
+        if not isinstance(body, dict):
+            # e.g. an empty 502 from a proxy
+            body = {"msg": body} if body else {}
+        self.stats.requests += 1
+        self.stats.latencies.append(time.perf_counter() - start)
+
+        if status == 200:
+            self._delivered(batch, body)
+            return
+        batch.error = f"{status or 'network'}: {body.get('msg', body) or 'empty response'}"
+        self.stats.errors[str(status or "network")] += 1
+        if (status is None or status in RETRY_STATUSES) and batch.attempt < self.max_retries:
+            batch.attempt += 1
+            self.stats.retries += 1
+            # Exponential backoff with full jitter, the worker is free meanwhile
+            delay = random.uniform(0, self.backoff * 2 ** (batch.attempt - 1))
+            retry = asyncio.ensure_future(self._retry_later(batch, delay))
+            self._retrying.add(retry)
+            retry.add_done_callback(self._retrying.discard)
+            return
+        self._dead_letter(batch, batch.receiver_uuids)
+
+    def _delivered(self, batch: Batch, body: dict):
+        if batch.receiver_uuids is None:
+            self.stats.delivered += 1
+            return
+        self.stats.delivered += len(body.get("successful_receiver_uuids", []))
+        for failure in body.get("failure_info", []):
+            # Per-receiver failures (blocked, not a friend, daily limit) are not retried
+            failed = Batch(batch.template, failure.get("receiver_uuids", []), batch.attempt,
+                           f"{failure.get('code')}: {failure.get('msg')}")
+            self.stats.errors[str(failure.get("code"))] += 1
+            self._dead_letter(failed, failed.receiver_uuids)
+
+    def _dead_letter(self, batch: Batch, receiver_uuids: Optional[List[str]]):
+        self.stats.dead_letters += batch.receivers
+        letter = {
+            "ts": round(time.time(), 3),
+            "template_object": json.loads(batch.template),
+            "receiver_uuids": receiver_uuids,
+            "attempts": batch.attempt + 1,
+            "error": batch.error,
+        }
+        self.dead_letters.append(letter)
+        if self.dead_letter_path:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(letter, ensure_ascii=False) + "\n")
+
+
+async def load_test(base_url: str, messages: int, friends: int, blocked: float, **kwargs) -> dict:
+    """Share messages itineraries, each with me and friends receivers, through the dispatcher."""
+    rng = random.Random(0)
+    async with KakaoDispatcher("mock-token", base_url, **kwargs) as dispatcher:
+        for i in range(messages):
+            template = template_object(f"DaeTRIP itinerary #{i}", f"https://daetrip.example/trips/{i}")
+            dispatcher.send_to_me(template)
+            receivers = [
+                f"{'blocked' if rng.random() < blocked else 'friend'}-{i}-{j}" for j in range(friends)
+            ]
+            dispatcher.send_to_friends(template, receivers)
+        await dispatcher.join()
+        return dispatcher.stats.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("load",))
+    parser.add_argument("--base-url", default=None, help="Kakao compatible API, defaults to a local mock server")
+    parser.add_argument("--messages", type=int, default=200, help="itineraries to share")
+    parser.add_argument("--friends", type=int, default=20, help="friend receivers per itinerary")
+    parser.add_argument("--blocked", type=float, default=0.01, help="share of friends who blocked the app")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=150, help="requests per second")
+    parser.add_argument("--dead-letters", default=None, help="JSONL file for the dead letters")
+    parser.add_argument("--mock-rate-limit", type=int, default=200, help="requests per second before the mock answers 429")
+    parser.add_argument("--mock-error-rate", type=float, default=0.02, help="share of mock requests failing with 500")
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url is None:
+        from mock_kakao_server import start_mock_server
+
+        server = start_mock_server(rate_limit=args.mock_rate_limit, error_rate=args.mock_error_rate)
+        args.base_url = f"http://127.0.0.1:{server.server_port}"
+    report = asyncio.run(load_test(
+        args.base_url, args.messages, args.friends, args.blocked,
+        workers=args.workers, rate=args.rate, dead_letter_path=args.dead_letters,
+    ))
+    if server is not None:
+        report["server"] = server.stats()
+        server.shutdown()
+    print(json.dumps(report, indent=2))
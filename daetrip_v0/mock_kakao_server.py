@@ -0,0 +1,161 @@
+"""
+Local mock of the KakaoTalk message API, for testing the dispatcher
+(kakao_dispatch.py) without a Kakao app, access tokens or real friends.
+
+Serves the "send to me" (/v2/api/talk/memo/default/send) and "send to
+friends" (/v1/api/talk/friends/message/default/send) endpoints with form
+encoded template_object and receiver_uuids, like kapi.kakao.com. Like the
+real API under load it rejects requests beyond a rate limit (429), fails a
+share of requests with 500, and reports per-receiver failures in
+failure_info, here for receiver UUIDs starting with "blocked". GET /stats
+returns the counters.
+
+    python mock_kakao_server.py --port 8766 --rate-limit 200 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+MEMO_PATH = "/v2/api/talk/memo/default/send"
+FRIENDS_PATH = "/v1/api/talk/friends/message/default/send"
+# Receivers of one "send to friends" request
+MAX_RECEIVERS = 5
+# Kakao error code of a receiver who blocked messages from the app
+BLOCKED_CODE = -530
+
+
+class MockKakaoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rate_limit=200, error_rate=0.0, latency=0.01, seed=0):
+        super().__init__(address, MockKakaoHandler)
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.delivered = 0
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """None if the request is served, otherwise the HTTP status it fails with."""
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_requests = 0
+            self.window_requests += 1
+            if self.window_requests > self.rate_limit:
+                self.rate_limited += 1
+                return 429
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                return 500
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+                "delivered": self.delivered,
+            }
+
+
+class MockKakaoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, keep-alive requests would wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_json(404, {"code": -1, "msg": "not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        if self.path not in (MEMO_PATH, FRIENDS_PATH):
+            self.send_json(404, {"code": -1, "msg": "not found"})
+            return
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.send_json(401, {"code": -401, "msg": "this access token does not exist"})
+            return
+        form = {key: values[0] for key, values in parse_qs(body).items()}
+        try:
+            json.loads(form["template_object"])
+            receivers = json.loads(form["receiver_uuids"]) if self.path == FRIENDS_PATH else ["me"]
+        except (KeyError, ValueError):
+            self.send_json(400, {"code": -2, "msg": "invalid template_object or receiver_uuids"})
+            return
+        if len(receivers) > MAX_RECEIVERS:
+            self.send_json(400, {"code": -2, "msg": f"receiver_uuids exceeds {MAX_RECEIVERS}"})
+            return
+
+        status = self.server.admit()
+        time.sleep(self.server.latency)
+        if status == 429:
+            self.send_json(429, {"code": -10, "msg": "API limit has been exceeded."})
+            return
+        if status is not None:
+            self.send_json(status, {"code": -9798, "msg": "service temporarily unavailable"})
+            return
+
+        if self.path == MEMO_PATH:
+            with self.server.lock:
+                self.server.delivered += 1
+            self.send_json(200, {"result_code": 0})
+            return
+        blocked = [uuid for uuid in receivers if str(uuid).startswith("blocked")]
+        successful = [uuid for uuid in receivers if uuid not in blocked]
+        with self.server.lock:
+            self.server.delivered += len(successful)
+        response = {"successful_receiver_uuids": successful}
+        if blocked:
+            response["failure_info"] = [
+                {"code": BLOCKED_CODE, "msg": "the receiver blocked messages", "receiver_uuids": blocked}
+            ]
+        self.send_json(200, response)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_mock_server(port=0, **kwargs):
+    """Start the mock server on a background thread, port 0 picks a free port."""
+    server = MockKakaoServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--rate-limit", type=int, default=200, help="requests per second before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 500")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds per request")
+    args = parser.parse_args()
+
+    server = MockKakaoServer(
+        ("127.0.0.1", args.port), rate_limit=args.rate_limit, error_rate=args.error_rate, latency=args.latency
+    )
+    print(f"Mock Kakao API on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,85 @@
+"""
+plan_itinerary against brute force over every ordered subset, for small n.
+
+    python -m pytest test_itinerary.py
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from itinerary import EXACT_MAX_SITES, path_cost, plan_itinerary
+
+
+def brute_force(cost, max_time=None, scores=None):
+    """(best total score, least travel time at that score) over every ordered subset."""
+    n = len(cost)
+    scores = np.ones(n) if scores is None else np.asarray(scores, dtype=np.float64)
+    best = (-np.inf, np.inf)
+    for size in range(1, n + 1):
+        for order in itertools.permutations(range(n), size):
+            total = path_cost(cost, order)
+            if max_time is not None and total > max_time:
+                continue
+            score = float(scores[list(order)].sum())
+            if score > best[0] or (score == best[0] and total < best[1]):
+                best = (score, total)
+    return best
+
+
+def random_cost(rng, n, symmetric):
+    cost = rng.uniform(1, 60, size=(n, n))
+    if symmetric:
+        cost = (cost + cost.T) / 2
+    np.fill_diagonal(cost, 0)
+    return cost
+
+
+def check_order(order, n):
+    assert len(order) == len(set(order))
+    assert all(0 <= i < n for i in order)
+
+
+@pytest.mark.parametrize("n", range(2, 8))
+@pytest.mark.parametrize("symmetric", [True, False])
+def test_exact_matches_brute_force(n, symmetric):
+    rng = np.random.default_rng(n)
+    for _ in range(3):
+        cost = random_cost(rng, n, symmetric)
+        order, total = plan_itinerary(cost)
+        check_order(order, n)
+        assert len(order) == n
+        assert total == pytest.approx(path_cost(cost, order))
+        assert total == pytest.approx(brute_force(cost)[1])
+
+
+@pytest.mark.parametrize("n", range(2, 8))
+def test_budget_matches_brute_force(n):
+    rng = np.random.default_rng(100 + n)
+    for _ in range(3):
+        cost = random_cost(rng, n, symmetric=False)
+        scores = rng.integers(1, 4, size=n).astype(np.float64)
+        max_time = float(rng.uniform(10, 40 * n))
+        order, total = plan_itinerary(cost, max_time=max_time, scores=scores)
+        check_order(order, n)
+        assert total <= max_time + 1e-9
+        best_score, best_total = brute_force(cost, max_time, scores)
+        assert scores[order].sum() == pytest.approx(best_score)
+        assert total == pytest.approx(best_total)
+
+
+def test_heuristic_within_budget():
+    n = EXACT_MAX_SITES + 4
+    rng = np.random.default_rng(0)
+    cost = random_cost(rng, n, symmetric=True)
+    order, total = plan_itinerary(cost)
+    check_order(order, n)
+    assert len(order) == n
+    order, total = plan_itinerary(cost, max_time=60.0)
+    check_order(order, n)
+    assert total <= 60.0
+
+
+def test_trivial_sizes():
+    assert plan_itinerary(np.zeros((0, 0))) == ([], 0.0)
+    assert plan_itinerary(np.zeros((1, 1))) == ([0], 0.0)
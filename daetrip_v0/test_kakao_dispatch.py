@@ -0,0 +1,111 @@
+"""
+KakaoDispatcher against the mock Kakao server: batching, retries and dead letters.
+
+    python -m pytest test_kakao_dispatch.py
+"""
+import asyncio
+import json
+
+import pytest
+
+from kakao_dispatch import MAX_RECEIVERS, KakaoDispatcher, template_object
+from mock_kakao_server import BLOCKED_CODE, start_mock_server
+
+
+@pytest.fixture
+def mock_server(request):
+    server = start_mock_server(**getattr(request, "param", {}))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def dispatch(server, sends, **kwargs):
+    """Run sends(dispatcher) and return the dispatcher once everything is delivered or dead-lettered."""
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    async def run():
+        async with KakaoDispatcher("mock-token", base_url, **kwargs) as dispatcher:
+            sends(dispatcher)
+            await dispatcher.join()
+        return dispatcher
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("mock_server", [{"latency": 0.0}], indirect=True)
+def test_friends_are_batched(mock_server):
+    template = template_object("DaeTRIP itinerary", "https://daetrip.example/trips/1")
+    friends = [f"friend-{i}" for i in range(3 * MAX_RECEIVERS + 2)]
+
+    def sends(dispatcher):
+        # Receivers of the same template are merged across calls
+        dispatcher.send_to_friends(template, friends[:3])
+        dispatcher.send_to_friends(template, friends[3:])
+
+    dispatcher = dispatch(mock_server, sends)
+    # Requests over MAX_RECEIVERS would be rejected by the server with 400
+    assert dispatcher.stats.errors == {}
+    assert dispatcher.stats.requests == 4
+    assert dispatcher.stats.delivered == len(friends)
+    assert mock_server.stats()["delivered"] == len(friends)
+    assert dispatcher.dead_letters == []
+
+
+@pytest.mark.parametrize("mock_server", [{"latency": 0.0, "error_rate": 0.3, "seed": 1}], indirect=True)
+def test_failed_requests_are_retried(mock_server):
+    def sends(dispatcher):
+        for i in range(40):
+            dispatcher.send_to_me(template_object(f"itinerary #{i}", f"https://daetrip.example/trips/{i}"))
+
+    dispatcher = dispatch(mock_server, sends, rate=1000, max_retries=10, backoff=0.01)
+    stats = mock_server.stats()
+    assert stats["errors"] > 0
+    assert dispatcher.stats.retries == stats["errors"]
+    assert dispatcher.stats.errors == {"500": stats["errors"]}
+    assert dispatcher.stats.delivered == stats["delivered"] == 40
+    assert dispatcher.dead_letters == []
+
+
+@pytest.mark.parametrize("mock_server", [{"latency": 0.0, "rate_limit": 5}], indirect=True)
+def test_rate_limited_requests_are_retried(mock_server):
+    def sends(dispatcher):
+        for i in range(10):
+            dispatcher.send_to_me(template_object(f"itinerary #{i}", f"https://daetrip.example/trips/{i}"))
+
+    dispatcher = dispatch(mock_server, sends, rate=1000, max_retries=10, backoff=0.5)
+    assert mock_server.stats()["rate_limited"] > 0
+    assert dispatcher.stats.retries >= mock_server.stats()["rate_limited"]
+    assert dispatcher.stats.delivered == 10
+
+
+@pytest.mark.parametrize("mock_server", [{"latency": 0.0}], indirect=True)
+def test_blocked_receivers_are_dead_lettered(mock_server, tmp_path):
+    template = template_object("DaeTRIP itinerary", "https://daetrip.example/trips/1")
+    receivers = ["friend-1", "blocked-1", "friend-2", "blocked-2"]
+    path = tmp_path / "dead_letters.jsonl"
+
+    dispatcher = dispatch(
+        mock_server, lambda d: d.send_to_friends(template, receivers), dead_letter_path=str(path)
+    )
+    assert dispatcher.stats.delivered == 2
+    assert dispatcher.stats.dead_letters == 2
+    assert dispatcher.stats.retries == 0
+    [letter] = dispatcher.dead_letters
+    assert letter["receiver_uuids"] == ["blocked-1", "blocked-2"]
+    assert letter["error"].startswith(str(BLOCKED_CODE))
+    assert letter["template_object"] == template
+    assert [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] == [letter]
+
+
+@pytest.mark.parametrize("mock_server", [{"latency": 0.0, "error_rate": 1.0}], indirect=True)
+def test_exhausted_retries_are_dead_lettered(mock_server):
+    template = template_object("DaeTRIP itinerary", "https://daetrip.example/trips/1")
+    dispatcher = dispatch(
+        mock_server, lambda d: d.send_to_friends(template, ["friend-1"]), max_retries=2, backoff=0.01
+    )
+    assert dispatcher.stats.requests == 3
+    [letter] = dispatcher.dead_letters
+    assert letter["receiver_uuids"] == ["friend-1"]
+    assert letter["attempts"] == 3
+    assert letter["error"].startswith("500")
@@ -6,11 +6,17 @@ import streamlit as st
 
 from utils import (
     st_get_osm_geometries,
-    st_plot_all,
+    build_route_map,
+    get_route_coords,
+    render_map,
+    folium_html,
+    show_folium_html,
     get_colors_from_style,
-    gdf_to_bytesio_geojson,
+    EXPORT_FORMATS,
+    export_geometries,
 )
-from prettymapp.geo import get_aoi
+from presets import TRAVELER_PRESETS, TRAVELER_MAP_CONFIG
+from recommender import SITE_SPREAD_M, get_recommender
 from prettymapp.settings import STYLES
 
 st.set_page_config(
@@ -21,17 +27,6 @@ st.set_page_config(
 # st.write("---")
 st.markdown("## DaeTraveler's Type Survey")
 
-sites_data = {
-    'Daejeon Expo Park': {'lat': 36.3730, 'lon': 127.3847},
-    'Yuseong Hot Springs': {'lat': 36.3565, 'lon': 127.3279},
-    'National Science Museum': {'lat': 36.3746, 'lon': 127.3722},
-    'Hanbat Arboretum': {'lat': 36.3058, 'lon': 127.3381},
-    'Daejeon Museum of Art': {'lat': 36.3519, 'lon': 127.3891},
-    'Gyejoksan Mountain': {'lat': 36.2908, 'lon': 127.3338},
-    'Ppuri Park': {'lat': 36.3414, 'lon': 127.3938},
-    'Daejeon O-World': {'lat': 36.2902, 'lon': 127.4011}
-}
-
 questions = [
     "I prefer travel experiences that incorporate technology and efficiency.",
     "I enjoy participating in local events and engaging with the community when traveling.",
@@ -53,108 +48,91 @@ for i, question in enumerate(questions):
     )
     responses.append(response)
 
-# Define weights for each question and traveler type
-weights = {
-    "Tech-savvy": [0.20, -0.10, -0.05, 0.15, -0.10, -0.05, 0.15],
-    "Community-focused": [-0.10, 0.20, -0.05, 0.05, -0.05, 0.20, 0.05],
-    "Practical Leisure Seeker": [-0.05, -0.05, 0.20, -0.10, 0.20, -0.05, 0.15],
-}
-
+# Keep the finalized survey across reruns, so the export options below can rerun the app
 if st.button("Finalize Survey"):
-    # Calculate scores for each traveler type
-    traveler_scores = {
-        traveler_type: round(sum(response * weight for response, weight in zip(responses, weights[traveler_type])), 1)
-        for traveler_type in weights
-    }
-
-    # Determine the traveler type based on the highest score
-    traveler_type = max(traveler_scores, key=traveler_scores.get)
-
-    # Touristic spots for each traveler type
-    tech_savvy_spots = ['National Science Museum', 'Daejeon Expo Park', 'Daejeon O-World']
-    community_focused_spots = ['Ppuri Park', 'Daejeon Museum of Art', 'Hanbat Arboretum']
-    leisure_seeker_spots = ['Yuseong Hot Springs', 'Gyejoksan Mountain', 'Hanbat Arboretum']
-
-    # Calculate the center coordinates for each traveler type
-    def calculate_center_coordinates(spots):
-        latitudes = [sites_data[spot]['lat'] for spot in spots]
-        longitudes = [sites_data[spot]['lon'] for spot in spots]
-        center_lat = sum(latitudes) / len(latitudes)
-        center_lon = sum(longitudes) / len(longitudes)
-        return center_lat, center_lon
-
-    tech_savvy_coordinates = calculate_center_coordinates(tech_savvy_spots)
-    community_focused_coordinates = calculate_center_coordinates(community_focused_spots)
-    leisure_seeker_coordinates = calculate_center_coordinates(leisure_seeker_spots)
+    st.session_state.survey_responses = responses
+    st.session_state.pop("export", None)
 
+def build_trip(responses) -> dict:
+    """Recommendation, geometries, route map HTML and map image of a finalized survey."""
+    # Traveler type and the best matching catalog sites near each other, see recommender.py
+    recommendation = get_recommender().recommend(responses, within_m=SITE_SPREAD_M)
+    traveler_type = recommendation.traveler_type
 
     # Customize map style and coordinates based on traveler type
-    if traveler_type == "Practical Leisure Seeker":
-        style = "Peach"
-        radius = 4000
-        coordinates = leisure_seeker_coordinates
-        recommended_sites = {site: sites_data[site] for site in leisure_seeker_spots}
-    elif traveler_type == "Community-focused":
-        style = "Flannel"
-        radius = 4000
-        coordinates = community_focused_coordinates
-        recommended_sites = {site: sites_data[site] for site in community_focused_spots}
-    else:  # Tech-savvy
-        style = "Citrus"
-        radius = 4000
-        coordinates = tech_savvy_coordinates
-        recommended_sites = {site: sites_data[site] for site in tech_savvy_spots}
-        
-    st.write(f"## Hello, {traveler_type} traveler!")
-    st.write(traveler_scores)
+    preset = TRAVELER_PRESETS[traveler_type]
+    recommended_sites = recommendation.sites_data()
+    coordinates = recommendation.center()
 
     # Use the fixed coordinates for Daejeon, South Korea
     from datetime import date
     today = date.today()
     address = f"DaeTRIP for Daejeon, South Korea, {today}"
-    # coordinates = [36.3504, 127.3845]
     rectangular = False
 
-    result_container = st.empty()
-    with st.spinner("Creating map... (may take up to a minute)"):
-        aoi = get_aoi(coordinates=coordinates, radius=radius, rectangular=rectangular)
-        df = st_get_osm_geometries(aoi=aoi)
-        draw_settings = STYLES[style]
-        config = {
-            "aoi_bounds": aoi.bounds,
-            "draw_settings": draw_settings,
-            "name_on": True,
-            "name": address,
-            "font_size": 20,
-            "font_color": "black",
-            "text_x": 0,
-            "text_y": -55,
-            "text_rotation": 0,
-            "shape": "circle",
-            "contour_width": 2,
-            "contour_color": "black",
-            "bg_shape": "rectangle",
-            "bg_buffer": 20,
-            "bg_color": "white"
-        }
-        st.write("## Your Recommended Sites")
-        fig = st_plot_all(_df=df, recommended_sites=recommended_sites, **config)
-        st.write("---")
-        st.write("## Share your Instagram-Ready Trip Map!")
-        st.pyplot(fig, pad_inches=0, bbox_inches="tight", transparent=True, dpi=300)
+    # prettymapp.geo imports osmnx, only needed once the survey is finalized
+    from prettymapp.geo import get_aoi
+
+    aoi = get_aoi(coordinates=coordinates, radius=preset["radius"], rectangular=rectangular)
+    df = st_get_osm_geometries(aoi=aoi)
+    config = {
+        "aoi_bounds": aoi.bounds,
+        "draw_settings": STYLES[preset["style"]],
+        "name": address,
+        **TRAVELER_MAP_CONFIG,
+    }
+    routes = get_route_coords(aoi.bounds, recommended_sites)
+    route_html, route_height = folium_html(build_route_map(aoi.bounds, recommended_sites, routes))
+    return {
+        "responses": list(responses),
+        "traveler_type": traveler_type,
+        "traveler_scores": recommendation.traveler_scores,
+        "address": address,
+        "df": df,
+        "config": config,
+        "route_html": route_html,
+        "route_height": route_height,
+        "map_image": render_map(_df=df, **config),
+    }
+
+
+if "survey_responses" in st.session_state:
+    # The trip is built once per finalized survey, reruns of the export options reuse it
+    trip = st.session_state.get("trip")
+    if trip is None or trip["responses"] != st.session_state.survey_responses:
+        with st.spinner("Creating map... (may take up to a minute)"):
+            trip = st.session_state.trip = build_trip(st.session_state.survey_responses)
+    address, df, config = trip["address"], trip["df"], trip["config"]
+
+    st.write(f"## Hello, {trip['traveler_type']} traveler!")
+    st.write(trip["traveler_scores"])
+    st.write("## Your Recommended Sites")
+    show_folium_html(trip["route_html"], trip["route_height"])
+    st.write("---")
+    st.write("## Share your Instagram-Ready Trip Map!")
+    st.image(trip["map_image"], use_column_width=True)
 
     st.markdown("</br>", unsafe_allow_html=True)
     st.markdown("</br>", unsafe_allow_html=True)
     ex1, ex2 = st.columns(2)
 
-    with ex1.expander("Export geometries as GeoJSON"):
+    with ex1.expander("Export geometries"):
         st.write(f"{df.shape[0]} geometries")
-        st.download_button(
-            label="Download",
-            data=gdf_to_bytesio_geojson(df),
-            file_name=f"prettymapp_{address[:10]}.geojson",
-            mime="application/geo+json",
-        )
+        export_format = st.selectbox("Format", list(EXPORT_FORMATS), key="export_format")
+        # Exports are built only when requested, not on every render
+        if st.button("Prepare export"):
+            data, seconds = export_geometries(df, export_format)
+            st.session_state.export = (export_format, data, seconds)
+        if st.session_state.get("export", (None,))[0] == export_format:
+            _, data, seconds = st.session_state.export
+            _, extension, mime = EXPORT_FORMATS[export_format]
+            st.caption(f"{len(data) / 1024**2:.2f} MB, exported in {seconds:.2f} s")
+            st.download_button(
+                label="Download",
+                data=data,
+                file_name=f"prettymapp_{address[:10]}.{extension}",
+                mime=mime,
+            )
 
     config = {"address": address, **config}
     with ex2.expander("Export map configuration"):
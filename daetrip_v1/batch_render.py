@@ -0,0 +1,197 @@
+"""
+Headless batch map renderer.
+
+Renders the trip maps the app shows for the most common surveys and the city
+presets of examples.json in parallel on a process pool, without Streamlit,
+e.g. to pre-render the Instagram-ready maps at deploy time. Trips come from
+the recommender (recommender.py) over every possible survey, most common
+first, and are rendered with the same settings as the app. Geometries come from the local geometry
+store when it covers the AOI (Overpass otherwise), routes from the road graph
+and route matrix, and the images go through the render cache, so the app
+serves pre-rendered maps directly.
+
+    python batch_render.py --out renders --workers 4 --trips 50
+    python batch_render.py --trips 0 --only Macau --formats png geojson
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from presets import TRAVELER_MAP_CONFIG, TRAVELER_PRESETS, load_examples
+from recommender import DIMENSIONS, SITE_SPREAD_M, TRAVELER_TYPES, Recommendation, get_recommender
+
+FORMATS = ("png", "svg", "geojson")
+# Distinct trips rendered by default, the most common 50 of 427 cover close to 80% of the surveys
+DEFAULT_TRIPS = 50
+SURVEY_ANSWERS = range(1, 6)
+# Plot settings of the examples.json presets, other keys are app only
+EXAMPLE_PLOT_KEYS = (
+    "shape", "contour_width", "contour_color", "name_on", "font_size", "font_color",
+    "text_x", "text_y", "text_rotation", "bg_shape", "bg_buffer", "bg_color",
+)
+
+
+def common_trips(n: int | None = DEFAULT_TRIPS) -> list:
+    """(recommendation, surveys) of the n trips recommended for the most surveys, None for all."""
+    recommender = get_recommender()
+    surveys = np.array(list(itertools.product(SURVEY_ANSWERS, repeat=len(DIMENSIONS))))
+    types, top = recommender.recommend_batch(surveys, within_m=SITE_SPREAD_M)
+    trips, counts = np.unique(np.column_stack([types, top]), axis=0, return_counts=True)
+    order = np.argsort(-counts, kind="stable")[:n]
+    return [
+        (
+            Recommendation(TRAVELER_TYPES[trips[i, 0]], {}, [recommender.sites[j] for j in trips[i, 1:] if j >= 0]),
+            int(counts[i]),
+        )
+        for i in order
+    ]
+
+
+def make_jobs(trips: int | None = DEFAULT_TRIPS, only=None) -> list:
+    """
+    Render jobs of the common trips, with the app's map settings, and of
+    examples.json, optionally only the named ones.
+    """
+    jobs = []
+    address = f"DaeTRIP for Daejeon, South Korea, {date.today()}"
+    for recommendation, surveys in common_trips(trips) if trips != 0 else []:
+        preset = TRAVELER_PRESETS[recommendation.traveler_type]
+        jobs.append({
+            "name": f"{recommendation.traveler_type} " + "-".join(str(site.index) for site in recommendation.sites),
+            "surveys": surveys,
+            "coordinates": recommendation.center(),
+            "radius": preset["radius"],
+            "rectangular": False,
+            "style": preset["style"],
+            "recommended_sites": recommendation.sites_data(),
+            "plot": {"name": address, **TRAVELER_MAP_CONFIG},
+        })
+    for name, example in load_examples().items():
+        if not isinstance(example, dict):
+            # Entries without settings, e.g. only an example image
+            continue
+        jobs.append({
+            "name": name,
+            "address": example["address"],
+            "radius": example["radius"],
+            "rectangular": example["shape"] == "rectangle",
+            "style": example["style"],
+            "recommended_sites": None,
+            "plot": {
+                "name": example.get("custom_title") or name,
+                **{key: example[key] for key in EXAMPLE_PLOT_KEYS if key in example},
+            },
+        })
+    if only:
+        jobs = [job for job in jobs if job["name"] in only]
+    return jobs
+
+
+def render_job(job: dict, out_dir: Path, formats) -> dict:
+    """Render one job into out_dir, returns its timing report."""
+    from prettymapp.geo import get_aoi
+    from prettymapp.settings import STYLES
+
+    from utils import fetch_osm_geometries, get_route_coords, gdf_to_bytesio_geojson, render_map, slugify
+
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(step):
+        nonlocal start
+        now = time.perf_counter()
+        timings[step] = round(now - start, 3)
+        start = now
+
+    if "address" in job:
+        aoi = get_aoi(address=job["address"], radius=job["radius"], rectangular=job["rectangular"])
+    else:
+        aoi = get_aoi(coordinates=job["coordinates"], radius=job["radius"], rectangular=job["rectangular"])
+    lap("aoi")
+    df = fetch_osm_geometries(aoi)
+    lap("geometries")
+    routes, routes_error = None, None
+    if job["recommended_sites"]:
+        # Routes are an extra output, a routing failure does not fail the map
+        try:
+            routes = get_route_coords(aoi.bounds, job["recommended_sites"])
+        except Exception as e:
+            routes_error = f"{type(e).__name__}: {e}"
+        lap("routes")
+
+    stem = out_dir / slugify(job["name"])
+    config = {"aoi_bounds": aoi.bounds, "draw_settings": STYLES[job["style"]], **job["plot"]}
+    outputs = {}
+    for format in formats:
+        if format == "geojson":
+            data = gdf_to_bytesio_geojson(df).getvalue()
+        else:
+            data = render_map(_df=df, format=format, **config)
+        path = stem.with_suffix(f".{format}")
+        path.write_bytes(data)
+        outputs[format] = {"path": str(path), "bytes": len(data)}
+        lap(format)
+    if routes is not None:
+        route_path = out_dir / f"{slugify(job['name'])}-routes.json"
+        route_path.write_text(json.dumps(routes))
+        outputs["routes"] = {"path": str(route_path), "bytes": route_path.stat().st_size}
+
+    report = {
+        "name": job["name"],
+        "geometries": len(df),
+        "seconds": timings,
+        "total_seconds": round(sum(timings.values()), 3),
+        "outputs": outputs,
+        "pid": os.getpid(),
+    }
+    if routes_error:
+        report["routes_error"] = routes_error
+    return report
+
+
+def run(jobs, out_dir: Path, formats=FORMATS, workers: int | None = None) -> list:
+    """Render all jobs on a process pool, returns the reports in completion order."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render_job, job, out_dir, formats): job["name"] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                report = {"name": futures[future], "error": f"{type(e).__name__}: {e}"}
+            reports.append(report)
+            print(format_report(report), flush=True)
+    return reports
+
+
+def format_report(report: dict) -> str:
+    if "error" in report:
+        return f"{report['name']:<26} failed  {report['error']}"
+    steps = "  ".join(f"{step} {seconds:6.2f}s" for step, seconds in report["seconds"].items())
+    return f"{report['name']:<26} {report['total_seconds']:7.2f}s  {report['geometries']:6d} geometries  {steps}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", type=Path, default=Path("renders"))
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of CPUs")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--trips", type=int, default=DEFAULT_TRIPS, help="most common trips to render, 0 for none")
+    parser.add_argument("--only", nargs="+", default=None, help="job names to render")
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.trips, args.only)
+    start = time.perf_counter()
+    reports = run(jobs, args.out, args.formats, args.workers)
+    elapsed = time.perf_counter() - start
+    (args.out / "report.json").write_text(json.dumps(reports, indent=2))
+    failed = sum("error" in report for report in reports)
+    print(f"{len(reports) - failed}/{len(jobs)} maps in {elapsed:.1f} s, report in {args.out / 'report.json'}")
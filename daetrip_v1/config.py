@@ -0,0 +1,11 @@
+import os
+from pathlib import Path
+
+# Built artifacts (road graph, route matrix, caches) live under this directory.
+# Override with DAETRIP_DATA_DIR, e.g. to point several containers at one volume.
+DATA_DIR = Path(
+    os.environ.get("DAETRIP_DATA_DIR", Path(__file__).resolve().parent / "data")
+)
+
+# Place name used when a data store has to be built from a fresh OSM download.
+DAEJEON_PLACE = "Daejeon, South Korea"
@@ -0,0 +1,254 @@
+"""
+Local tiled OSM geometry store.
+
+The map geometries of the region are ingested once from a local OSM extract
+(.osm.pbf, OSM XML, or a GeoParquet/GeoPackage/GeoJSON file of OSM features),
+classified into prettymapp landcover classes and split into a regular grid of
+tiles, stored as the row groups of one Parquet file. An AOI query reads only
+the tiles its bounds intersect, filters them with a spatial index and clips
+them to the AOI, returning the same GeoDataFrame schema as prettymapp's
+get_osm_geometries without any Overpass request.
+
+Ingest with e.g.
+    python geometry_store.py ingest south-korea-latest.osm.pbf --bbox 127.25 36.18 127.56 36.50
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import Polygon, box
+
+from prettymapp.geo import explode_multigeometries
+from prettymapp.osm import OsmDataError, cleanup_osm_df, get_osm_tags
+from prettymapp.settings import LANDCOVER_CLASSES
+
+from config import DATA_DIR
+
+STORE_DIR = DATA_DIR / "geometries"
+# About 2.8 x 2.2 km around Daejeon, a 4 km radius AOI reads 5 x 5 tiles
+DEFAULT_TILE_SIZE = 0.025
+
+_OTHER_TAG_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"=>"((?:[^"\\]|\\.)*)"')
+
+
+def landcover_hash(landcover_classes: dict = LANDCOVER_CLASSES) -> str:
+    """Fingerprint of the landcover settings the store was classified with."""
+    payload = json.dumps(landcover_classes, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def tile_key(ix: int, iy: int) -> str:
+    return f"{ix}_{iy}"
+
+
+class GeometryStore:
+    """Read-only tiled geometry store."""
+
+    def __init__(self, path: Path, meta: dict):
+        self.path = Path(path)
+        self.meta = meta
+        self.tile_size = meta["tile_size"]
+        self.extent = box(*meta["extent"])
+        self.tiles = meta["tiles"]
+
+    @classmethod
+    def load(cls, store_dir: Path = STORE_DIR):
+        meta = json.loads((Path(store_dir) / "meta.json").read_text())
+        return cls(store_dir, meta)
+
+    @property
+    def version(self) -> str:
+        return self.meta["version"]
+
+    def covers(self, aoi: Polygon) -> bool:
+        return self.extent.contains(aoi)
+
+    def tile_range(self, bounds):
+        """Tile keys intersecting bounds (west, south, east, north)."""
+        west, south, east, north = bounds
+        for ix in range(math.floor(west / self.tile_size), math.floor(east / self.tile_size) + 1):
+            for iy in range(math.floor(south / self.tile_size), math.floor(north / self.tile_size) + 1):
+                yield tile_key(ix, iy)
+
+    def read_tiles(self, bounds) -> gpd.GeoDataFrame:
+        """Geometries of the tiles intersecting bounds, each feature once."""
+        row_groups = [self.tiles[key] for key in self.tile_range(bounds) if key in self.tiles]
+        table = pq.ParquetFile(self.path / "geometries.parquet").read_row_groups(row_groups)
+        df = table.to_pandas()
+        df = gpd.GeoDataFrame(
+            df.drop(columns="geometry"), geometry=shapely.from_wkb(df["geometry"].to_numpy()), crs=4326
+        )
+        # Features crossing tile borders are stored in every tile they touch
+        return df[~df["feature_id"].duplicated()]
+
+    def query(self, aoi: Polygon) -> gpd.GeoDataFrame:
+        """
+        Geometries within aoi, in the schema of prettymapp's get_osm_geometries.
+
+        Raises:
+            OsmDataError: If the store has no features within aoi.
+        """
+        df = self.read_tiles(aoi.bounds)
+        df = df.iloc[df.sindex.query(aoi, predicate="intersects")]
+        if df.empty:
+            raise OsmDataError("No OSM features found for this area.")
+        df = gpd.clip(df.set_index("feature_id"), aoi)
+        return explode_multigeometries(df)
+
+
+@lru_cache(maxsize=None)
+def get_geometry_store():
+    """
+    Process-wide GeometryStore, or None if it was not ingested yet or was
+    classified with different landcover settings.
+    """
+    try:
+        store = GeometryStore.load()
+    except FileNotFoundError:
+        return None
+    if store.meta.get("landcover_hash") != landcover_hash():
+        return None
+    return store
+
+
+def read_osm_pbf(source: Path, tags: dict) -> gpd.GeoDataFrame:
+    """
+    Read the line and area features of a .osm.pbf extract with the GDAL OSM
+    driver, expanding the hstore other_tags column into the tag columns used
+    by prettymapp.
+    """
+    import pyogrio
+
+    frames = []
+    for layer in ("lines", "multipolygons"):
+        df = pyogrio.read_dataframe(source, layer=layer)
+        missing = [key for key in tags if key not in df.columns]
+        if missing and "other_tags" in df.columns:
+            other_tags = df["other_tags"].fillna("").map(
+                lambda value: dict(_OTHER_TAG_PATTERN.findall(value))
+            )
+            for key in missing:
+                df[key] = other_tags.map(lambda parsed: parsed.get(key))
+        frames.append(df[[key for key in tags if key in df.columns] + ["geometry"]])
+    return gpd.GeoDataFrame(pd.concat(frames), crs=4326)
+
+
+def read_features(source: Path, bbox=None) -> gpd.GeoDataFrame:
+    """OSM features of source with one column per OSM tag used by prettymapp."""
+    import osmnx as ox
+
+    tags = get_osm_tags()
+    name = Path(source).name
+    if name.endswith(".pbf"):
+        df = read_osm_pbf(source, tags)
+    elif name.endswith((".osm", ".xml", ".osm.bz2")):
+        df = ox.features_from_xml(source, tags=tags)
+    elif name.endswith((".parquet", ".geoparquet")):
+        df = gpd.read_parquet(source)
+    else:
+        df = gpd.read_file(source, bbox=bbox)
+    df = df.to_crs(4326)
+    if bbox is not None:
+        df = df.iloc[df.sindex.query(box(*bbox), predicate="intersects")]
+    return df
+
+
+def ingest(source: Path, bbox=None, tile_size: float = DEFAULT_TILE_SIZE, store_dir: Path = STORE_DIR) -> GeometryStore:
+    """
+    Classify the features of source and write them as tiles of tile_size
+    degrees. bbox (west, south, east, north) limits the store to a region of a
+    larger extract.
+    """
+    df = read_features(source, bbox)
+    if "landcover_class" not in df.columns:
+        df = cleanup_osm_df(df, aoi=box(*bbox) if bbox is not None else None)
+    if "highway" not in df.columns:
+        df["highway"] = None
+    df = explode_multigeometries(df[["landcover_class", "highway", "geometry"]])
+    df["feature_id"] = df.index.astype("int64")
+    df = df[["feature_id", "landcover_class", "highway", "geometry"]]
+
+    # Assign every feature to each tile its bounds touch
+    bounds = df.geometry.bounds
+    ix0 = (bounds["minx"] // tile_size).astype(int)
+    ix1 = (bounds["maxx"] // tile_size).astype(int)
+    iy0 = (bounds["miny"] // tile_size).astype(int)
+    iy1 = (bounds["maxy"] // tile_size).astype(int)
+    positions, keys = [], []
+    for position, (x0, x1, y0, y1) in enumerate(zip(ix0, ix1, iy0, iy1)):
+        for ix in range(x0, x1 + 1):
+            for iy in range(y0, y1 + 1):
+                positions.append(position)
+                keys.append(tile_key(ix, iy))
+
+    # One row group per tile, in a single file so a query opens it once
+    path = Path(store_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    table = pa.table({
+        "feature_id": pa.array(df["feature_id"].to_numpy(), pa.int64()),
+        "landcover_class": pa.array(df["landcover_class"].tolist(), pa.string()),
+        "highway": pa.array([None if pd.isna(value) else str(value) for value in df["highway"]], pa.string()),
+        "geometry": pa.array(shapely.to_wkb(df.geometry.to_numpy()), pa.binary()),
+    })
+    assignment = pd.DataFrame({"position": positions, "tile": keys})
+    tiles = {}
+    digest = hashlib.sha1()
+    with pq.ParquetWriter(path / "geometries.parquet", table.schema, compression="zstd") as writer:
+        for key, group in assignment.groupby("tile", sort=True):
+            tile = table.take(group["position"].to_numpy())
+            writer.write_table(tile, row_group_size=len(tile))
+            tiles[key] = len(tiles)
+            digest.update(key.encode("utf-8"))
+            digest.update(tile["feature_id"].to_numpy().tobytes())
+
+    extent = list(bbox) if bbox is not None else df.total_bounds.tolist()
+    meta = {
+        "version": digest.hexdigest()[:12],
+        "tile_size": tile_size,
+        "extent": extent,
+        "tiles": tiles,
+        "n_features": len(df),
+        "landcover_hash": landcover_hash(),
+        "source": str(source),
+        "built": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    (path / "meta.json").write_text(json.dumps(meta, indent=2))
+    get_geometry_store.cache_clear()
+    return GeometryStore.load(store_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the DaeTrip OSM geometry store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest")
+    ingest_parser.add_argument("source", type=Path)
+    ingest_parser.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    ingest_parser.add_argument("--tile-size", type=float, default=DEFAULT_TILE_SIZE)
+    query_parser = subparsers.add_parser("query", help="time an AOI query")
+    query_parser.add_argument("--lat", type=float, default=36.3504)
+    query_parser.add_argument("--lon", type=float, default=127.3845)
+    query_parser.add_argument("--radius", type=int, default=4000)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        store = ingest(args.source, args.bbox, args.tile_size)
+        print(f"{store.meta['n_features']} features in {len(store.tiles)} tiles, version {store.version}")
+    else:
+        from prettymapp.geo import get_aoi
+
+        store = GeometryStore.load()
+        aoi = get_aoi(coordinates=(args.lat, args.lon), radius=args.radius)
+        start = time.perf_counter()
+        df = store.query(aoi)
+        print(f"{len(df)} geometries in {time.perf_counter() - start:.3f} s")
@@ -0,0 +1,46 @@
+"""
+Map presets shared by the app and the batch renderer: the map style of every
+traveler type and the city presets of examples.json.
+"""
+import json
+from pathlib import Path
+
+EXAMPLES_PATH = Path(__file__).resolve().parent / "examples.json"
+
+# Map style and radius for each traveler type, the sites come from recommender.py
+TRAVELER_PRESETS = {
+    "Tech-savvy": {
+        "style": "Citrus",
+        "radius": 4000,
+    },
+    "Community-focused": {
+        "style": "Flannel",
+        "radius": 4000,
+    },
+    "Practical Leisure Seeker": {
+        "style": "Peach",
+        "radius": 4000,
+    },
+}
+
+# Text and shape settings of the traveler type maps
+TRAVELER_MAP_CONFIG = {
+    "name_on": True,
+    "font_size": 20,
+    "font_color": "black",
+    "text_x": 0,
+    "text_y": -55,
+    "text_rotation": 0,
+    "shape": "circle",
+    "contour_width": 2,
+    "contour_color": "black",
+    "bg_shape": "rectangle",
+    "bg_buffer": 20,
+    "bg_color": "white"
+}
+
+
+def load_examples(path: Path = EXAMPLES_PATH) -> dict:
+    """City presets of examples.json, dict of name : settings."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
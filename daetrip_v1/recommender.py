@@ -0,0 +1,243 @@
+"""
+Vectorized traveler type and site recommender.
+
+Each of the 81 catalog sites (daejeon_touristic_sites_en.csv) has an affinity
+vector over the seven survey questions: the affinity of its category plus
+the affinity of tags in its name (museum, temple, campground, market, ...).
+Ranking every site for a survey is one matrix product of the centered
+responses with the affinity matrix, and a batch of surveys is ranked with the
+same product. The recommended sites are the best site and the next best ones
+within a distance of it, so they fit on one map.
+
+    python recommender.py 4 2 3 5 1 2 3          # recommendation for one survey
+    python recommender.py --bench 10000          # latency of one survey and of a batch
+"""
+import argparse
+import csv
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+CATALOG_CSV = Path(__file__).resolve().parent / "daejeon_touristic_sites_en.csv"
+CATALOG_CSV_KR = Path(__file__).resolve().parent / "daejeon_touristic_sites_kr.csv"
+
+# Survey dimensions, in the order of the questions of app.py
+DIMENSIONS = ("technology", "community", "practical", "adventure", "comfort", "culture", "splurge")
+
+TRAVELER_TYPES = ("Tech-savvy", "Community-focused", "Practical Leisure Seeker")
+
+# Weights of each question per traveler type, applied to the raw 1-5 responses
+TRAVELER_WEIGHTS = np.array([
+    [0.20, -0.10, -0.05, 0.15, -0.10, -0.05, 0.15],
+    [-0.10, 0.20, -0.05, 0.05, -0.05, 0.20, 0.05],
+    [-0.05, -0.05, 0.20, -0.10, 0.20, -0.05, 0.15],
+])
+
+# Affinity of each category to the survey dimensions, applied to centered responses
+CATEGORY_AFFINITY = {
+    "Major Attractions": [0.05, 0.05, 0.10, 0.05, 0.10, 0.05, 0.05],
+    "Science Attractions": [0.30, -0.05, 0.00, 0.10, -0.05, 0.00, 0.00],
+    "Cultural Attractions": [-0.05, 0.15, 0.00, 0.00, 0.05, 0.25, 0.05],
+    "Historical Sites": [-0.10, 0.05, -0.05, 0.00, 0.00, 0.30, -0.05],
+    "Ecological Attractions": [-0.10, 0.00, 0.05, 0.20, 0.10, 0.00, -0.10],
+    "Others": [0.00, 0.20, 0.15, 0.05, 0.05, 0.00, 0.10],
+}
+
+# Affinity added to sites whose name contains the tag (case insensitive)
+TAG_AFFINITY = {
+    "museum": [0.05, 0.00, 0.00, -0.05, 0.05, 0.10, 0.00],
+    "research institute": [0.15, -0.05, -0.05, 0.05, -0.05, -0.05, 0.00],
+    "observatory": [0.10, 0.00, 0.00, 0.10, 0.00, 0.00, 0.00],
+    "campground": [0.00, 0.05, -0.05, 0.15, -0.15, 0.00, -0.05],
+    "camping": [0.00, 0.05, -0.05, 0.15, -0.15, 0.00, -0.05],
+    "hot spring": [0.00, 0.00, 0.05, -0.05, 0.25, 0.00, 0.10],
+    "-gil": [0.00, 0.00, 0.00, 0.15, -0.05, 0.00, -0.05],
+    "trail": [0.00, 0.00, 0.00, 0.15, -0.05, 0.00, -0.05],
+    "forest": [0.00, 0.00, 0.00, 0.10, 0.05, 0.00, 0.00],
+    "market": [0.00, 0.15, 0.10, 0.00, 0.00, 0.05, -0.05],
+    "village": [0.00, 0.10, 0.00, 0.00, 0.00, 0.10, 0.00],
+    "temple": [-0.05, 0.00, 0.00, 0.00, 0.05, 0.10, 0.00],
+    "outlet": [0.00, 0.00, 0.15, -0.05, 0.10, -0.05, 0.25],
+    "shopping": [0.00, 0.05, 0.15, -0.05, 0.05, -0.05, 0.15],
+    "bakery": [0.00, 0.10, 0.10, 0.00, 0.05, 0.05, 0.05],
+    "noodles": [0.00, 0.10, 0.10, 0.00, 0.05, 0.05, 0.00],
+    "world": [0.05, 0.05, 0.05, 0.10, 0.00, -0.05, 0.05],
+}
+
+# Small bias towards the city's landmarks, e.g. when every answer is neutral
+CATEGORY_PRIOR = {"Major Attractions": 0.02}
+DEFAULT_TOP_N = 3
+# Distance from the best site the other recommended sites are chosen within,
+# so they stay inside the 4 km map radius around their center
+SITE_SPREAD_M = 3000
+EARTH_RADIUS_M = 6_371_000
+
+
+@dataclass(frozen=True)
+class CatalogSite:
+    """Catalog row as used by the recommender."""
+    index: int
+    name: str
+    name_kr: str
+    category: str
+    lat: float
+    lon: float
+
+
+@dataclass
+class Recommendation:
+    traveler_type: str
+    traveler_scores: dict
+    sites: list
+
+    def sites_data(self) -> dict:
+        """name : {'lat', 'lon'} of the sites, as used by the map functions."""
+        return {site.name: {"lat": site.lat, "lon": site.lon} for site in self.sites}
+
+    def center(self) -> tuple:
+        """(lat, lon) center of the sites."""
+        return (
+            sum(site.lat for site in self.sites) / len(self.sites),
+            sum(site.lon for site in self.sites) / len(self.sites),
+        )
+
+
+def load_sites(path: Path = CATALOG_CSV, path_kr: Path = CATALOG_CSV_KR) -> list:
+    """Sites of the catalog CSV, with the Korean names of the row-aligned Korean CSV."""
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    names_kr = [""] * len(rows)
+    if path_kr.exists():
+        with open(path_kr, encoding="utf-8", newline="") as f:
+            names_kr = [row["Name"] for row in csv.DictReader(f)]
+    return [
+        CatalogSite(i, row["Name"], name_kr, row["Category"], float(row["lat"]), float(row["lon"]))
+        for i, (row, name_kr) in enumerate(zip(rows, names_kr))
+    ]
+
+
+def site_affinity(site: CatalogSite) -> np.ndarray:
+    """Affinity vector of a site over DIMENSIONS."""
+    affinity = np.array(CATEGORY_AFFINITY.get(site.category, [0.0] * len(DIMENSIONS)), dtype=np.float32)
+    name = site.name.lower()
+    for tag, tag_affinity in TAG_AFFINITY.items():
+        if tag in name:
+            affinity += np.asarray(tag_affinity, dtype=np.float32)
+    return affinity
+
+
+def distance_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Pairwise great-circle distances in meters."""
+    lat, lon = np.radians(lats)[:, None], np.radians(lons)[:, None]
+    a = np.sin((lat - lat.T) / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin((lon - lon.T) / 2) ** 2
+    return (2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))).astype(np.float32)
+
+
+class Recommender:
+    def __init__(self, sites: list):
+        self.sites = sites
+        self.affinity = np.stack([site_affinity(site) for site in sites])
+        # The prior and a tiny index tie-break make rankings deterministic
+        self.prior = np.array(
+            [CATEGORY_PRIOR.get(site.category, 0.0) - 1e-6 * site.index for site in sites], dtype=np.float32
+        )
+        self.distances = distance_matrix(
+            np.array([site.lat for site in sites]), np.array([site.lon for site in sites])
+        )
+
+    def traveler_scores(self, responses: np.ndarray) -> np.ndarray:
+        """(surveys, traveler types) scores of (surveys, questions) responses."""
+        return responses @ TRAVELER_WEIGHTS.T
+
+    def traveler_hundredths(self, responses: np.ndarray) -> np.ndarray:
+        """
+        Traveler type scores in exact hundredths (the weights are multiples of
+        0.05), so ties go to the first traveler type instead of float noise.
+        """
+        return np.rint(self.traveler_scores(responses) * 100)
+
+    def site_scores(self, responses: np.ndarray) -> np.ndarray:
+        """(surveys, sites) scores of (surveys, questions) responses."""
+        return (responses - 3) @ self.affinity.T + self.prior
+
+    def recommend_batch(self, responses, n: int = DEFAULT_TOP_N, within_m: float | None = None) -> tuple:
+        """
+        Traveler type indices (surveys,) and recommended site indices
+        (surveys, n), best first, of a batch of surveys. With within_m, the
+        sites are the best one and the next best ones within within_m of it.
+        """
+        responses = np.atleast_2d(np.asarray(responses, dtype=np.float32))
+        types = self.traveler_hundredths(responses).argmax(axis=1)
+        scores = self.site_scores(responses)
+        if within_m is not None:
+            best = scores.argmax(axis=1)
+            scores = np.where(self.distances[best] <= within_m, scores, -np.inf)
+        n = min(n, scores.shape[1])
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        # Fewer than n sites within reach: the masked ones are not recommended
+        top = np.where(np.isfinite(np.take_along_axis(scores, top, axis=1)), top, -1)
+        return types, top
+
+    def recommend(self, responses: list, n: int = DEFAULT_TOP_N, within_m: float | None = None) -> Recommendation:
+        """Traveler type, its scores and the recommended sites of one survey."""
+        responses = np.asarray(responses, dtype=np.float32)
+        # Shown as the hundredths the traveler type is chosen by
+        traveler_scores = self.traveler_hundredths(responses[None])[0] / 100
+        types, top = self.recommend_batch(responses, n, within_m)
+        return Recommendation(
+            traveler_type=TRAVELER_TYPES[types[0]],
+            traveler_scores={t: round(float(s), 2) for t, s in zip(TRAVELER_TYPES, traveler_scores)},
+            sites=[self.sites[i] for i in top[0] if i >= 0],
+        )
+
+
+@lru_cache(maxsize=None)
+def get_recommender() -> Recommender:
+    """Recommender of the catalog, shared by every session in the process."""
+    return Recommender(load_sites())
+
+
+def bench(surveys: int, within_m: float) -> dict:
+    recommender = get_recommender()
+    rng = np.random.default_rng(0)
+    batch = rng.integers(1, 6, size=(surveys, len(DIMENSIONS))).astype(np.float32)
+    latencies = []
+    for responses in batch[:1000]:
+        start = time.perf_counter()
+        recommender.recommend(responses, within_m=within_m)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    recommender.recommend_batch(batch, within_m=within_m)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "single_p50_ms": round(float(np.quantile(latencies, 0.5)) * 1e3, 4),
+        "single_p99_ms": round(float(np.quantile(latencies, 0.99)) * 1e3, 4),
+        "batch_surveys": surveys,
+        "batch_ms": round(batch_seconds * 1e3, 2),
+        "batch_us_per_survey": round(batch_seconds / surveys * 1e6, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("responses", nargs="*", type=int, help=f"{len(DIMENSIONS)} answers from 1 to 5")
+    parser.add_argument("-n", type=int, default=DEFAULT_TOP_N)
+    parser.add_argument("--within", type=float, default=SITE_SPREAD_M, help="meters from the best site, 0 for anywhere")
+    parser.add_argument("--bench", type=int, metavar="SURVEYS", help="benchmark a random batch of this size")
+    args = parser.parse_args()
+
+    within_m = args.within or None
+    if args.bench:
+        print(bench(args.bench, within_m))
+    else:
+        if len(args.responses) != len(DIMENSIONS):
+            parser.error(f"expected {len(DIMENSIONS)} responses ({', '.join(DIMENSIONS)})")
+        recommendation = get_recommender().recommend(args.responses, args.n, within_m)
+        print(f"{recommendation.traveler_type} {recommendation.traveler_scores}")
+        for site in recommendation.sites:
+            print(f"- {site.name} ({site.name_kr}) · {site.category}")
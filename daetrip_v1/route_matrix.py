@@ -0,0 +1,166 @@
+"""
+Precomputed site-to-site travel costs for the tourist catalog.
+
+The build step snaps every catalog row to the road graph and runs one
+single-source Dijkstra per site (scipy.sparse.csgraph) for each network type,
+storing the full length / travel time matrices and the route geometry of every
+pair in one .npz file. At request time route drawing and itinerary text read
+costs and geometries in O(1) instead of searching the graph.
+
+Build with
+    python route_matrix.py build
+"""
+import argparse
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import DATA_DIR
+from road_graph import NETWORK_TYPES, get_road_graph
+from snapping import get_site_nodes
+
+CATALOG_CSV = Path(__file__).resolve().parent / "daejeon_touristic_sites_en.csv"
+MATRIX_PATH = DATA_DIR / "route_matrix.npz"
+
+
+class RouteMatrix:
+    """Site-to-site lengths (m), travel times (s) and route geometries."""
+
+    def __init__(self, arrays: dict):
+        self.names = [str(name) for name in arrays["names"]]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.meta = json.loads(str(arrays["meta"]))
+        self.modes = tuple(self.meta["graph_versions"])
+        self._arrays = arrays
+
+    @classmethod
+    def load(cls, path: Path = MATRIX_PATH):
+        with np.load(path) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+        return cls(arrays)
+
+    def _position(self, site) -> int:
+        return site if isinstance(site, (int, np.integer)) else self.index[site]
+
+    def __contains__(self, site) -> bool:
+        return site in self.index
+
+    def lengths(self, mode: str = "drive") -> np.ndarray:
+        return self._arrays[f"{mode}_length"]
+
+    def times(self, mode: str = "drive") -> np.ndarray:
+        return self._arrays[f"{mode}_time"]
+
+    def cost(self, origin, destination, mode: str = "drive", metric: str = "time") -> float:
+        """Travel time in seconds (metric="time") or length in meters (metric="length")."""
+        matrix = self.times(mode) if metric == "time" else self.lengths(mode)
+        return float(matrix[self._position(origin), self._position(destination)])
+
+    def has_route(self, origin, destination, mode: str = "drive") -> bool:
+        if not (origin in self and destination in self):
+            return False
+        return bool(np.isfinite(self.cost(origin, destination, mode)))
+
+    def route_coords(self, origin, destination, mode: str = "drive") -> list:
+        """Route geometry as a list of (lat, lon) tuples."""
+        pair = self._position(origin) * len(self.names) + self._position(destination)
+        offsets = self._arrays[f"{mode}_offsets"]
+        coords = self._arrays[f"{mode}_coords"][offsets[pair]:offsets[pair + 1]]
+        return [(lat, lon) for lon, lat in coords.tolist()]
+
+
+@lru_cache(maxsize=None)
+def get_route_matrix():
+    """Process-wide RouteMatrix, or None if it was not built yet."""
+    try:
+        return RouteMatrix.load()
+    except FileNotFoundError:
+        return None
+
+
+def _path_positions(predecessors: np.ndarray, source: int, target: int) -> list:
+    path = [target]
+    while path[-1] != source:
+        previous = predecessors[path[-1]]
+        if previous < 0:
+            return []
+        path.append(previous)
+    return path[::-1]
+
+
+def compute_mode(graph, site_positions: np.ndarray) -> dict:
+    """Cost matrices and route geometries between sites for one road graph."""
+    from scipy.sparse.csgraph import dijkstra
+
+    csgraph_time = graph.to_csgraph("travel_time")
+    csgraph_length = graph.to_csgraph("length")
+    # One single-source search per site on travel time, all targets at once.
+    times, predecessors = dijkstra(
+        csgraph_time, directed=True, indices=site_positions, return_predecessors=True
+    )
+
+    n_sites = len(site_positions)
+    time_matrix = times[:, site_positions].astype(np.float32)
+    length_matrix = np.full((n_sites, n_sites), np.inf, dtype=np.float32)
+    offsets = np.zeros(n_sites * n_sites + 1, dtype=np.int64)
+    coords = []
+    x, y = np.asarray(graph.x), np.asarray(graph.y)
+    for i, source in enumerate(site_positions):
+        for j, target in enumerate(site_positions):
+            path = np.array(_path_positions(predecessors[i], source, target), dtype=np.int64)
+            if len(path):
+                length_matrix[i, j] = (
+                    np.asarray(csgraph_length[path[:-1], path[1:]]).sum() if len(path) > 1 else 0
+                )
+                coords.append(np.column_stack([x[path], y[path]]).astype(np.float32))
+            pair = i * n_sites + j
+            offsets[pair + 1] = offsets[pair] + len(path)
+    return {
+        "length": length_matrix,
+        "time": time_matrix,
+        "offsets": offsets,
+        "coords": np.concatenate(coords) if coords else np.empty((0, 2), dtype=np.float32),
+        "nodes": np.asarray(graph.node_ids)[site_positions],
+    }
+
+
+def build_route_matrix(
+    catalog_csv: Path = CATALOG_CSV, path: Path = MATRIX_PATH
+) -> RouteMatrix:
+    """Compute drive and walk matrices for all catalog rows and save them to path."""
+    sites = pd.read_csv(catalog_csv)
+    arrays = {"names": sites["Name"].to_numpy(dtype=str)}
+    graph_versions = {}
+    for mode in NETWORK_TYPES:
+        graph = get_road_graph(mode)
+        if graph is None:
+            raise FileNotFoundError(
+                f"No '{mode}' road graph found, run `python road_graph.py build` first"
+            )
+        site_nodes = get_site_nodes(mode, catalog_csv)
+        site_positions = np.array([site_nodes[name] for name in sites["Name"]])
+        for key, value in compute_mode(graph, site_positions).items():
+            arrays[f"{mode}_{key}"] = value
+        graph_versions[mode] = graph.version
+    arrays["meta"] = np.array(
+        json.dumps({"graph_versions": graph_versions, "catalog": str(catalog_csv)})
+    )
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path, **arrays)
+    get_route_matrix.cache_clear()
+    return RouteMatrix.load(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the DaeTrip route matrix")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--catalog", type=Path, default=CATALOG_CSV)
+    args = parser.parse_args()
+
+    matrix = build_route_matrix(args.catalog)
+    print(f"{len(matrix.names)} sites, modes {matrix.modes}")
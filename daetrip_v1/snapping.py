@@ -0,0 +1,113 @@
+"""
+Spatial index for snapping points to road graph nodes.
+
+A scipy cKDTree over the road nodes (in a local equirectangular projection, so
+distances are in meters) is pickled next to the road graph store and keyed by
+the graph version. The nearest node of every catalog row is cached on top of
+it and rebuilt whenever the graph version or the catalog changes. Both accept
+arrays, so thousands of points (e.g. user GPS traces) snap in one query.
+"""
+import hashlib
+import json
+import pickle
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import DATA_DIR
+from road_graph import get_road_graph
+
+INDEX_DIR = DATA_DIR / "node_index"
+CATALOG_CSV = Path(__file__).resolve().parent / "daejeon_touristic_sites_en.csv"
+EARTH_RADIUS_M = 6_371_008.8
+
+
+class NodeIndex:
+    """KD-tree over the nodes of one road graph."""
+
+    def __init__(self, tree, lat0: float, graph_version: str):
+        self.tree = tree
+        self.lat0 = lat0
+        self.graph_version = graph_version
+
+    @classmethod
+    def build(cls, graph):
+        from scipy.spatial import cKDTree
+
+        lat0 = float(np.mean(graph.y))
+        tree = cKDTree(_project(graph.x, graph.y, lat0))
+        return cls(tree, lat0, graph.version)
+
+    def query(self, lons, lats, max_distance: float = np.inf):
+        """
+        Nearest node positions and distances in meters for arrays of points.
+        Points farther than max_distance get position -1.
+        """
+        points = _project(np.atleast_1d(lons), np.atleast_1d(lats), self.lat0)
+        distances, positions = self.tree.query(points, distance_upper_bound=max_distance)
+        positions = np.where(np.isfinite(distances), positions, -1)
+        return positions, distances
+
+
+def _project(lons, lats, lat0: float) -> np.ndarray:
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    return np.column_stack(
+        [lons * np.cos(np.radians(lat0)) * EARTH_RADIUS_M, lats * EARTH_RADIUS_M]
+    )
+
+
+@lru_cache(maxsize=None)
+def get_node_index(network_type: str = "drive"):
+    """Process-wide NodeIndex for the road graph store, or None if no graph was built."""
+    graph = get_road_graph(network_type)
+    if graph is None:
+        return None
+    path = INDEX_DIR / f"{network_type}-{graph.version}.pkl"
+    if path.exists():
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    index = NodeIndex.build(graph)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return index
+
+
+def snap_points(lons, lats, network_type: str = "drive", max_distance: float = np.inf):
+    """Snap arrays of points to OSM node ids (-1 where nothing is within max_distance)."""
+    graph = get_road_graph(network_type)
+    positions, distances = get_node_index(network_type).query(lons, lats, max_distance)
+    node_ids = np.where(positions >= 0, graph.node_ids[np.maximum(positions, 0)], -1)
+    return node_ids, distances
+
+
+@lru_cache(maxsize=None)
+def get_site_nodes(network_type: str = "drive", catalog_csv: Path = CATALOG_CSV) -> dict:
+    """
+    Returns dict of catalog site name : nearest node position in the road graph,
+    cached on disk until the graph version or the catalog file changes.
+    """
+    graph = get_road_graph(network_type)
+    if graph is None:
+        return {}
+    catalog_hash = hashlib.sha1(Path(catalog_csv).read_bytes()).hexdigest()[:12]
+    path = INDEX_DIR / f"{network_type}-sites.json"
+    if path.exists():
+        cached = json.loads(path.read_text())
+        if cached["graph_version"] == graph.version and cached["catalog"] == catalog_hash:
+            return {name: graph.node_position(node) for name, node in cached["nodes"].items()}
+
+    sites = pd.read_csv(catalog_csv)
+    positions, _ = get_node_index(network_type).query(sites["lon"], sites["lat"])
+    nodes = dict(zip(sites["Name"], graph.node_ids[positions].tolist()))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps(
+            {"graph_version": graph.version, "catalog": catalog_hash, "nodes": nodes},
+            ensure_ascii=False,
+        )
+    )
+    return dict(zip(sites["Name"], positions.tolist()))
@@ -0,0 +1,60 @@
+"""
+Recommendations for every possible survey answer.
+
+    python -m pytest test_recommender.py
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from recommender import DEFAULT_TOP_N, DIMENSIONS, SITE_SPREAD_M, TRAVELER_TYPES, get_recommender
+
+ALL_SURVEYS = np.array(list(itertools.product(range(1, 6), repeat=len(DIMENSIONS))))
+
+
+@pytest.fixture(scope="module")
+def recommender():
+    return get_recommender()
+
+
+@pytest.fixture(scope="module")
+def batch(recommender):
+    return recommender.recommend_batch(ALL_SURVEYS, within_m=SITE_SPREAD_M)
+
+
+def test_catalog(recommender):
+    assert len(recommender.sites) == 81
+    assert all(site.name_kr for site in recommender.sites)
+
+
+def test_every_survey_gets_sites(recommender, batch):
+    types, top = batch
+    assert top.shape == (len(ALL_SURVEYS), DEFAULT_TOP_N)
+    assert (top >= 0).all()
+    # Distinct sites within SITE_SPREAD_M of the best one
+    assert (np.sort(top, axis=1)[:, 1:] != np.sort(top, axis=1)[:, :-1]).all()
+    assert (recommender.distances[top[:, :1], top] <= SITE_SPREAD_M).all()
+    # Every traveler type is chosen for some survey
+    assert set(types.tolist()) == set(range(len(TRAVELER_TYPES)))
+
+
+def test_single_survey_matches_batch(recommender, batch):
+    types, top = batch
+    for i in np.random.default_rng(0).choice(len(ALL_SURVEYS), size=200, replace=False):
+        recommendation = recommender.recommend(ALL_SURVEYS[i].tolist(), within_m=SITE_SPREAD_M)
+        assert recommendation.traveler_type == TRAVELER_TYPES[types[i]]
+        assert [site.index for site in recommendation.sites] == top[i].tolist()
+        assert set(recommendation.traveler_scores) == set(TRAVELER_TYPES)
+        lat, lon = recommendation.center()
+        assert 36.1 < lat < 36.6 and 127.2 < lon < 127.6
+
+
+def test_without_distance_limit(recommender):
+    types, top = recommender.recommend_batch(ALL_SURVEYS[::97], n=5)
+    assert (top >= 0).all() and top.shape[1] == 5
+    scores = recommender.site_scores(ALL_SURVEYS[::97].astype(np.float32))
+    # Best first, and no site outside the top n scores higher than the n-th
+    ranked = np.take_along_axis(scores, top, axis=1)
+    assert (np.diff(ranked, axis=1) <= 0).all()
+    assert (np.sort(scores, axis=1)[:, -5] == ranked[:, -1]).all()